@@ -17,26 +17,36 @@ int main(void)
         if (transport_ingestion_done())
         {
             uint32_t cmd_len = transport_get_cmd_len();
+            uint8_t *cmd_buf = transport_get_cmd_buf();
             uint32_t cmd_read_error = transport_read_command();
 
             if (!cmd_read_error)
             {
-                uint32_t resp_len = (uint32_t)sizeof(tpm_cmd_buf);
-                uint8_t *resp_ptr = tpm_cmd_buf;
+                uint32_t resp_len = TPM_MAX_CMD_LEN;
+                uint8_t *resp_ptr = cmd_buf;
 
-                // Optionally pause RX/IRQs so the ingress path can't stomp the buffer
-                // receiver_pause();
-                _plat__RunCommand(cmd_len, tpm_cmd_buf, &resp_len, &resp_ptr);
+                // The response is built in place in this slot; the ISR keeps
+                // receiving the next command(s) into the other slot(s) meanwhile
+                _plat__RunCommand(cmd_len, cmd_buf, &resp_len, &resp_ptr);
                 _debug_transport_write_ready();
                 transport_write_rsp(resp_ptr, resp_len);
-                // receiver_resume();
             }
             else
             {
-                ;
+                // Answer anyway so the host does not wait forever for this command
+                _debug_transport_write_ready();
+                transport_write_rc_rsp(TRANSPORT_RC_COMMAND_SIZE);
             }
+            transport_release_command();
+            // A pipelined command may already be complete: run it without sleeping
+            continue;
         }
-        // Low-power wait.
-        asm volatile("wfi");
+
+        // Low-power wait. Interrupts are masked around the check so a command
+        // completing right before the wfi still wakes us up (the pending IRQ does).
+        irq_setie(0);
+        if (!transport_ingestion_done())
+            asm volatile("wfi");
+        irq_setie(1);
     }
 }
\ No newline at end of file
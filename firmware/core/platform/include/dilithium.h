@@ -42,6 +42,8 @@
 #define DILITHIUM_RHO_SIZE 32
 #define DILITHIUM_TR_SIZE 32
 #define DILITHIUM_C_SIZE 32
+// Pre-hash signing: the host sends SHAKE256(message) of this size, signed as the message
+#define DILITHIUM_PREHASH_DIGEST_SIZE 64
 #define DILITHIUM_CORE_MLEN_SIZE 8
 
 #define DILITHIUM_CMD_KEYGEN 0
@@ -0,0 +1,72 @@
+#pragma once
+#include <stdint.h>
+#include <stdbool.h>
+#include <string.h>
+#include <generated/soc.h>
+
+// On-chip cycle accounting. mcycle is sampled around _plat__RunCommand, the dilithium_*
+// operations, the Dilithium DMA waits and the key/signature repacking, and the samples
+// are accumulated per TPM command code. The host reads them back with the vendor
+// ReadPerfCounters command (answered by _plat__RunCommand, see perf_command_response).
+// NOTE: sections nest (e.g. a DMA wait inside dilithium_sign_finish counts in both), so
+//       CPU time of an operation is its section minus the DMA waits inside it.
+// With the gateware's PerfCounters (CSR_PERF_COUNTERS_BASE), the PERF_HW_* sections add
+// what those counted during each command: Dilithium busy/compute cycles, stalls on both
+// sides of the core and wishbone wait states of the Dilithium DMA masters.
+
+#ifndef PERF_ENABLE
+#define PERF_ENABLE 1
+#endif
+
+// Vendor command: TPM_ST_NO_SESSIONS, one BYTE parameter (non-zero clears the stats after reading)
+#define TPM_CC_READ_PERF_COUNTERS 0x200001A5u
+
+// Distinct command codes tracked; later ones are accumulated under command code 0
+#ifndef PERF_MAX_COMMANDS
+#define PERF_MAX_COMMANDS 12u
+#endif
+
+// Order is part of the ReadPerfCounters response format (tpm_utils.PERF_SECTIONS)
+typedef enum
+{
+    PERF_RUN_COMMAND = 0,
+    PERF_DILITHIUM_KEYGEN,
+    PERF_DILITHIUM_SIGN_START,
+    PERF_DILITHIUM_UPDATE,
+    PERF_DILITHIUM_SIGN_FINISH,
+    PERF_DILITHIUM_VERIFY_START,
+    PERF_DILITHIUM_VERIFY_FINISH,
+    PERF_DMA_READ_WAIT,
+    PERF_DMA_WRITE_WAIT,
+    PERF_PACK_KEYPAIR,
+    PERF_PACK_SIG,
+    PERF_HW_DILITHIUM_BUSY,
+    PERF_HW_DILITHIUM_COMPUTE,
+    PERF_HW_SINK_STARVED,
+    PERF_HW_SINK_BLOCKED,
+    PERF_HW_SOURCE_STARVED,
+    PERF_HW_SOURCE_BLOCKED,
+    PERF_HW_READER_WAIT,
+    PERF_HW_WRITER_WAIT,
+    PERF_SECTIONS
+} perf_section_t;
+
+#if PERF_ENABLE
+uint64_t perf_cycles(void);
+void perf_command_begin(uint32_t command_code);
+void perf_command_end(uint64_t start);
+void perf_record(perf_section_t section, uint64_t start);
+#else
+static inline uint64_t perf_cycles(void) { return 0; }
+static inline void perf_command_begin(uint32_t command_code) { (void)command_code; }
+static inline void perf_command_end(uint64_t start) { (void)start; }
+static inline void perf_record(perf_section_t section, uint64_t start)
+{
+    (void)section;
+    (void)start;
+}
+#endif
+
+void perf_clear(void);
+void perf_command_response(const uint8_t *request, uint32_t request_size,
+                           uint32_t *response_size, uint8_t **response);
@@ -0,0 +1,22 @@
+#pragma once
+#include <stdint.h>
+#include <stdbool.h>
+#include <string.h>
+
+// Pre-hash signing. The host sends SHAKE256(message) and the TPM signs that digest as
+// the message, so only DILITHIUM_PREHASH_DIGEST_SIZE bytes cross the UART.
+// _plat__RunCommand serves the vendor HashSignDigest command itself: the request is
+// replayed through ExecuteCommand as HashSignStart (with the caller's authorization),
+// one SequenceUpdate carrying the digest and HashSignFinish. pq-tpm therefore resolves
+// the key handle, checks its auth and loads the sensitive area exactly as it does for
+// a streamed signature, and the HashSignFinish response is the HashSignDigest response.
+
+// Vendor command: TPM_ST_SESSIONS, keyHandle (one password session) | TPM2B digest.
+// Response: parameterSize | TPMT_SIGNATURE | response session, as HashSignFinish
+#define TPM_CC_HASHSIGN_DIGEST 0x200001A4u
+
+// Parses a HashSignDigest request into local state, before the response may overwrite
+// it; returns TPM_RC_SUCCESS or the response code to answer with
+uint32_t prehash_command_load(const uint8_t *request, uint32_t request_size);
+// Answers the loaded request (or `rc` when loading failed), like ExecuteCommand
+void prehash_command_execute(uint32_t rc, uint32_t *response_size, uint8_t **response);
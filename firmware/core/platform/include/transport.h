@@ -10,20 +10,30 @@
 
 // ---- TPM-specific sizes ----
 #define TPM_HEADER_LEN 10u    // 2(tag) + 4(size) + 4(code)
-#define TPM_MAX_CMD_LEN 4096u // tune to your worst-case; spec allows large buffers
+#define TPM_MAX_CMD_LEN 6144u // fits a level 5 HashVerifyStart (4651 B, signature included)
+
+// The tpm_cmd_buffer region is split into TPM_RX_SLOTS command slots of TPM_MAX_CMD_LEN
+// bytes each (the SoC reserves 12 KB, i.e. 2 slots). While main executes one slot, the ISR
+// keeps assembling the next command into another, so the host can keep up to
+// TPM_RX_SLOTS commands in flight. Bytes are only dropped when every slot is busy.
+#ifndef TPM_RX_SLOTS
+#define TPM_RX_SLOTS 2u
+#endif
+
+// TPM_RC_COMMAND_SIZE, returned when a command does not fit in a slot
+#define TRANSPORT_RC_COMMAND_SIZE 0x142u
 
 // NOTE: this should be 64 bit aligned
-extern uint8_t tpm_cmd_buf[TPM_MAX_CMD_LEN];
+extern uint8_t tpm_cmd_buf[TPM_RX_SLOTS * TPM_MAX_CMD_LEN];
 
-// TODO: we need some FSM info so we can deny new requests before finishing one being done atm, such as testing
-// ---- Simple assembler state machine ----
+// ---- Simple assembler state machine (for the slot being filled) ----
 typedef enum
 {
 
     RX_WAITING_FOR_HEADER = 0,
     RX_WAITING_FOR_BODY = 1,
     RX_COMMAND_READY = 2,
-    RX_ERROR = 3
+    RX_ERROR = 3 // discarding the rest of an oversized command
 
 } rx_state_t;
 
@@ -41,6 +51,9 @@ uint32_t transport_get_cmd_len(void);
 uint32_t transport_get_bytes_read(void);
 bool transport_ingestion_done(void);
 uint32_t transport_read_command(void);
+uint8_t *transport_get_cmd_buf(void);
+void transport_release_command(void);
+void transport_write_rc_rsp(uint32_t rc);
 void transport_write_byte(uint8_t b);
 void transport_write_rsp(const uint8_t *buf, uint32_t len);
 void _debug_transport_write_ready(void);
@@ -1,5 +1,6 @@
 #include "dilithium.h"
 #include "log.h"
+#include "perf.h"
 
 extern uint8_t _dilithium_buffer_start[]; // NOTE: should be 64 bit aligned
 
@@ -130,8 +131,10 @@ static bool dilithium_read_in_progress(void)
 
 static void dilithium_read_wait(void)
 {
+    const uint64_t t0 = perf_cycles();
     while (dilithium_read_in_progress())
         ;
+    perf_record(PERF_DMA_READ_WAIT, t0);
 }
 
 // NOTE: since Litex DMA truncates last non-integer transfer, we need to align()
@@ -162,8 +165,10 @@ static bool dilithium_write_in_progress(void)
 
 static void dilithium_write_wait(void)
 {
+    const uint64_t t0 = perf_cycles();
     while (dilithium_write_in_progress())
         ;
+    perf_record(PERF_DMA_WRITE_WAIT, t0);
 }
 
 // keypair points to the DMA scratch laid out (64b aligned) as:
@@ -302,6 +307,7 @@ void dilithium_init(void)
 // NOTE: msg_chunk should be 64 bit aligned
 uint32_t dilithium_update(const uint8_t *msg_chunk, uint16_t msg_chunk_size)
 {
+    const uint64_t t0 = perf_cycles();
     LOGD("Starting Update op...");
     // Wait for previous dilithium op to end, assuming it hasnt
     LOGD("Waiting for previous msg ingestion to finish...");
@@ -311,6 +317,7 @@ uint32_t dilithium_update(const uint8_t *msg_chunk, uint16_t msg_chunk_size)
     dilithium_read_start();
 
     LOGD("Update done!");
+    perf_record(PERF_DILITHIUM_UPDATE, t0);
     return 0;
 }
 
@@ -319,6 +326,7 @@ uint32_t dilithium_keygen(uint8_t sec_level, const uint8_t *seed,
                           uint8_t *pk, uint16_t *pk_size,
                           uint8_t *sk, uint16_t *sk_size)
 {
+    const uint64_t t0 = perf_cycles();
     LOGD("Starting Keygen op...");
     // NOTE: both pk and sk have Rho, but it is only output once by the module, so we subtract it
     uint8_t *keypair_addr = _dilithium_buffer_start;
@@ -340,12 +348,17 @@ uint32_t dilithium_keygen(uint8_t sec_level, const uint8_t *seed,
     dilithium_write_wait();
 
     LOGD("Keygen done!");
-    return pack_keypair(sec_level, keypair_addr, pk, pk_size, sk, sk_size);
+    const uint64_t t_pack = perf_cycles();
+    const uint32_t rc = pack_keypair(sec_level, keypair_addr, pk, pk_size, sk, sk_size);
+    perf_record(PERF_PACK_KEYPAIR, t_pack);
+    perf_record(PERF_DILITHIUM_KEYGEN, t0);
+    return rc;
 }
 
 uint32_t dilithium_sign_start(uint8_t sec_level, uint32_t message_size,
                               const uint8_t *sk, uint16_t sk_size)
 {
+    const uint64_t t0 = perf_cycles();
     LOGD("Starting Sign Start op...");
     (void)sk_size; // Unecessary arg
     // For the first part of the sign operation, we just feed the core part of the sk
@@ -382,6 +395,7 @@ uint32_t dilithium_sign_start(uint8_t sec_level, uint32_t message_size,
     dilithium_start();
 
     LOGD("Sign Start done!");
+    perf_record(PERF_DILITHIUM_SIGN_START, t0);
     return 0;
 }
 
@@ -389,6 +403,7 @@ uint32_t dilithium_sign_finish(uint8_t sec_level,
                                const uint8_t *sk, uint16_t sk_size,
                                uint8_t *sig, uint16_t *sig_size)
 {
+    const uint64_t t0 = perf_cycles();
     LOGD("Starting Sign Finish op...");
     (void)sk_size; // Unecessary arg
     // For the last part of the sign operation, we just feed the core the rest of the sk
@@ -441,13 +456,18 @@ uint32_t dilithium_sign_finish(uint8_t sec_level,
     dilithium_write_wait();
 
     LOGD("Sign Finish done!");
-    return pack_sig(sec_level, output_payload_addr, sig, sig_size);
+    const uint64_t t_pack = perf_cycles();
+    const uint32_t rc = pack_sig(sec_level, output_payload_addr, sig, sig_size);
+    perf_record(PERF_PACK_SIG, t_pack);
+    perf_record(PERF_DILITHIUM_SIGN_FINISH, t0);
+    return rc;
 }
 
 uint32_t dilithium_verify_start(uint8_t sec_level, uint32_t message_size,
                                 const uint8_t *pk, uint16_t pk_size,
                                 const uint8_t *sig, uint16_t sig_size)
 {
+    const uint64_t t0 = perf_cycles();
     LOGD("Starting Verify Start op...");
     // Unecessary args
     (void)pk_size;
@@ -489,11 +509,13 @@ uint32_t dilithium_verify_start(uint8_t sec_level, uint32_t message_size,
     dilithium_start();
 
     LOGD("Verify Start done!");
+    perf_record(PERF_DILITHIUM_VERIFY_START, t0);
     return 0;
 }
 
 uint32_t dilithium_verify_finish(uint8_t sec_level, const uint8_t *h, uint16_t h_size, bool *accepted)
 {
+    const uint64_t t0 = perf_cycles();
     LOGD("Starting Verify Finish op...");
     // Unecessary args
     (void)h_size;
@@ -524,5 +546,6 @@ uint32_t dilithium_verify_finish(uint8_t sec_level, const uint8_t *h, uint16_t h
     uint64_t verify_result = *((volatile uint64_t *)output_payload_addr);
     LOGD("Verify Finish done, result was: %" PRIu64, verify_result);
     *accepted = !((bool)verify_result);
+    perf_record(PERF_DILITHIUM_VERIFY_FINISH, t0);
     return 0;
 }
\ No newline at end of file
@@ -0,0 +1,191 @@
+#include "perf.h"
+#include "transport.h"
+#include <generated/csr.h>
+
+#define PERF_HW_FIRST PERF_HW_DILITHIUM_BUSY
+#define PERF_HW_COUNT (PERF_SECTIONS - PERF_HW_FIRST)
+
+typedef struct
+{
+    uint32_t calls;
+    uint32_t max;
+    uint64_t cycles;
+} perf_stat_t;
+
+typedef struct
+{
+    uint32_t command_code;
+    uint32_t commands;
+    perf_stat_t sections[PERF_SECTIONS];
+} perf_command_t;
+
+// Last entry collects the command codes that did not get one of their own
+static perf_command_t perf_table[PERF_MAX_COMMANDS + 1];
+static uint32_t perf_used;
+// Entry of the command being executed; sections ending outside a command are dropped
+static perf_command_t *perf_current;
+
+// ReadPerfCounters response: header | clock_hz(4) | sections(1) | commands(1) |
+//   per command: command_code(4) | commands(4) | per section: calls(4) | cycles(8) | max(4)
+#define PERF_RSP_ENTRY_LEN (8u + PERF_SECTIONS * 16u)
+#define PERF_RSP_MAX_LEN (TPM_HEADER_LEN + 6u + (PERF_MAX_COMMANDS + 1u) * PERF_RSP_ENTRY_LEN)
+_Static_assert(PERF_RSP_MAX_LEN <= TPM_MAX_CMD_LEN, "ReadPerfCounters response must fit a command slot");
+
+#if PERF_ENABLE
+// Hardware counters at the start of the command being executed
+static uint64_t perf_hw_start[PERF_HW_COUNT];
+
+// Reads the PerfCounters CSRs, all latched on the same cycle; false without them
+static bool perf_hw_read(uint64_t *out)
+{
+#ifdef CSR_PERF_COUNTERS_BASE
+    perf_counters_control_write((1u << CSR_PERF_COUNTERS_CONTROL_ENABLE_OFFSET) |
+                                (1u << CSR_PERF_COUNTERS_CONTROL_LATCH_OFFSET));
+    out[PERF_HW_DILITHIUM_BUSY - PERF_HW_FIRST] = perf_counters_dilithium_busy_read();
+    out[PERF_HW_DILITHIUM_COMPUTE - PERF_HW_FIRST] = perf_counters_dilithium_compute_read();
+    out[PERF_HW_SINK_STARVED - PERF_HW_FIRST] = perf_counters_dilithium_sink_starved_read();
+    out[PERF_HW_SINK_BLOCKED - PERF_HW_FIRST] = perf_counters_dilithium_sink_blocked_read();
+    out[PERF_HW_SOURCE_STARVED - PERF_HW_FIRST] = perf_counters_dilithium_source_starved_read();
+    out[PERF_HW_SOURCE_BLOCKED - PERF_HW_FIRST] = perf_counters_dilithium_source_blocked_read();
+    out[PERF_HW_READER_WAIT - PERF_HW_FIRST] = perf_counters_dilithium_reader_wait_read();
+    out[PERF_HW_WRITER_WAIT - PERF_HW_FIRST] = perf_counters_dilithium_writer_wait_read();
+    return true;
+#else
+    (void)out;
+    return false;
+#endif
+}
+
+static void perf_add(perf_stat_t *stat, uint64_t cycles)
+{
+    stat->calls++;
+    stat->cycles += cycles;
+    if (cycles > stat->max)
+        stat->max = cycles > UINT32_MAX ? UINT32_MAX : (uint32_t)cycles;
+}
+
+uint64_t perf_cycles(void)
+{
+#if defined(__riscv)
+#if __riscv_xlen == 32
+    uint32_t hi, lo, hi2;
+    do
+    {
+        asm volatile("csrr %0, mcycleh" : "=r"(hi));
+        asm volatile("csrr %0, mcycle" : "=r"(lo));
+        asm volatile("csrr %0, mcycleh" : "=r"(hi2));
+    } while (hi != hi2);
+    return ((uint64_t)hi << 32) | lo;
+#else
+    uint64_t x;
+    asm volatile("csrr %0, mcycle" : "=r"(x));
+    return x;
+#endif
+#else
+    return 0;
+#endif
+}
+
+void perf_command_begin(uint32_t command_code)
+{
+    perf_command_t *entry = &perf_table[PERF_MAX_COMMANDS];
+    for (uint32_t i = 0; i < perf_used; i++)
+    {
+        if (perf_table[i].command_code == command_code)
+        {
+            entry = &perf_table[i];
+            break;
+        }
+    }
+    if (entry == &perf_table[PERF_MAX_COMMANDS] && perf_used < PERF_MAX_COMMANDS)
+    {
+        entry = &perf_table[perf_used++];
+        entry->command_code = command_code;
+    }
+    entry->commands++;
+    perf_current = entry;
+    perf_hw_read(perf_hw_start);
+}
+
+void perf_record(perf_section_t section, uint64_t start)
+{
+    if (!perf_current)
+        return;
+    perf_add(&perf_current->sections[section], perf_cycles() - start);
+}
+
+void perf_command_end(uint64_t start)
+{
+    uint64_t hw_end[PERF_HW_COUNT];
+    perf_record(PERF_RUN_COMMAND, start);
+    if (perf_current && perf_hw_read(hw_end))
+    {
+        for (uint32_t i = 0; i < PERF_HW_COUNT; i++)
+            perf_add(&perf_current->sections[PERF_HW_FIRST + i], hw_end[i] - perf_hw_start[i]);
+    }
+    perf_current = NULL;
+}
+#endif
+
+void perf_clear(void)
+{
+    memset(perf_table, 0, sizeof perf_table);
+    perf_used = 0;
+    perf_current = NULL;
+#ifdef CSR_PERF_COUNTERS_BASE
+    perf_counters_control_write((1u << CSR_PERF_COUNTERS_CONTROL_ENABLE_OFFSET) |
+                                (1u << CSR_PERF_COUNTERS_CONTROL_RESET_OFFSET));
+#endif
+}
+
+static uint8_t *put_u32(uint8_t *p, uint32_t v)
+{
+    p[0] = (uint8_t)(v >> 24);
+    p[1] = (uint8_t)(v >> 16);
+    p[2] = (uint8_t)(v >> 8);
+    p[3] = (uint8_t)v;
+    return p + 4;
+}
+
+static uint8_t *put_entry(uint8_t *p, const perf_command_t *entry)
+{
+    p = put_u32(p, entry->command_code);
+    p = put_u32(p, entry->commands);
+    for (uint32_t s = 0; s < PERF_SECTIONS; s++)
+    {
+        const perf_stat_t *stat = &entry->sections[s];
+        p = put_u32(p, stat->calls);
+        p = put_u32(p, (uint32_t)(stat->cycles >> 32));
+        p = put_u32(p, (uint32_t)stat->cycles);
+        p = put_u32(p, stat->max);
+    }
+    return p;
+}
+
+// Builds the ReadPerfCounters response in place (like ExecuteCommand, in *response)
+void perf_command_response(const uint8_t *request, uint32_t request_size,
+                           uint32_t *response_size, uint8_t **response)
+{
+    const bool clear = request_size > TPM_HEADER_LEN && request[TPM_HEADER_LEN];
+    const bool other = perf_table[PERF_MAX_COMMANDS].commands != 0;
+    // The request is fully parsed above: the response may overwrite it
+    uint8_t *rsp = *response;
+    uint8_t *p = rsp + TPM_HEADER_LEN;
+    p = put_u32(p, CONFIG_CLOCK_FREQUENCY);
+    *p++ = (uint8_t)PERF_SECTIONS;
+    *p++ = (uint8_t)(perf_used + (other ? 1u : 0u));
+    for (uint32_t i = 0; i < perf_used; i++)
+        p = put_entry(p, &perf_table[i]);
+    if (other)
+        p = put_entry(p, &perf_table[PERF_MAX_COMMANDS]);
+
+    const uint32_t len = (uint32_t)(p - rsp);
+    rsp[0] = 0x80; // TPM_ST_NO_SESSIONS
+    rsp[1] = 0x01;
+    put_u32(rsp + 2, len);
+    put_u32(rsp + 6, 0); // TPM_RC_SUCCESS
+    *response_size = len;
+
+    if (clear)
+        perf_clear();
+}
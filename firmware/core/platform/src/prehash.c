@@ -0,0 +1,166 @@
+#include "prehash.h"
+#include "run_command.h"
+#include "transport.h"
+#include "dilithium.h"
+
+#define PREHASH_ST_NO_SESSIONS 0x8001u
+#define PREHASH_ST_SESSIONS 0x8002u
+#define PREHASH_RS_PW 0x40000009u
+
+#define PREHASH_CC_HASHSIGN_START 0x200001A0u
+#define PREHASH_CC_HASHSIGN_FINISH 0x200001A1u
+#define PREHASH_CC_SEQUENCE_UPDATE 0x0000015Cu
+#define PREHASH_CC_FLUSH_CONTEXT 0x00000165u
+
+#define PREHASH_RC_FAILURE 0x101u
+#define PREHASH_RC_AUTH_MISSING 0x125u
+#define PREHASH_RC_AUTHSIZE 0x144u
+#define PREHASH_RC_SIZE_P1 0x1D5u         // TPM_RC_SIZE, parameter 1 (digest)
+#define PREHASH_RC_INSUFFICIENT_P1 0x1DAu // TPM_RC_INSUFFICIENT, parameter 1
+
+// Largest authorization area taken from the request: one session whose nonce and
+// hmac/password are at most 64 bytes each
+#define PREHASH_AUTH_MAX (4u + 2u + 64u + 1u + 2u + 64u)
+// Authorization area of the sequence commands: TPM_RS_PW with an empty password
+#define PREHASH_EMPTY_PW_LEN 9u
+
+static uint32_t key_handle;
+static uint32_t auth_size;
+static uint8_t auth[PREHASH_AUTH_MAX];
+static uint8_t digest[DILITHIUM_PREHASH_DIGEST_SIZE];
+
+// The internal commands, and the responses to all but HashSignFinish
+static uint8_t cmd_buf[TPM_HEADER_LEN + 8u + PREHASH_AUTH_MAX + 2u + DILITHIUM_PREHASH_DIGEST_SIZE];
+static uint8_t rsp_buf[64];
+
+static uint8_t *put_u16(uint8_t *p, uint16_t v)
+{
+    p[0] = (uint8_t)(v >> 8);
+    p[1] = (uint8_t)v;
+    return p + 2;
+}
+
+static uint8_t *put_u32(uint8_t *p, uint32_t v)
+{
+    p[0] = (uint8_t)(v >> 24);
+    p[1] = (uint8_t)(v >> 16);
+    p[2] = (uint8_t)(v >> 8);
+    p[3] = (uint8_t)v;
+    return p + 4;
+}
+
+static uint16_t get_u16(const uint8_t *p)
+{
+    return (uint16_t)(((uint16_t)p[0] << 8) | p[1]);
+}
+
+static uint32_t get_u32(const uint8_t *p)
+{
+    return ((uint32_t)p[0] << 24) | ((uint32_t)p[1] << 16) | ((uint32_t)p[2] << 8) | p[3];
+}
+
+static void write_rc(uint32_t rc, uint32_t *response_size, uint8_t *response)
+{
+    uint8_t *p = put_u16(response, PREHASH_ST_NO_SESSIONS);
+    p = put_u32(p, TPM_HEADER_LEN);
+    put_u32(p, rc);
+    *response_size = TPM_HEADER_LEN;
+}
+
+// Header of an internal command and its first handle (or the FlushContext parameter)
+static uint8_t *begin(uint16_t tag, uint32_t command_code, uint32_t handle)
+{
+    uint8_t *p = put_u16(cmd_buf, tag);
+    p += 4; // commandSize, set by run()
+    p = put_u32(p, command_code);
+    return put_u32(p, handle);
+}
+
+static uint8_t *put_empty_pw(uint8_t *p)
+{
+    p = put_u32(p, PREHASH_EMPTY_PW_LEN);
+    p = put_u32(p, PREHASH_RS_PW);
+    p = put_u16(p, 0); // nonce
+    *p++ = 0;          // sessionAttributes
+    return put_u16(p, 0);
+}
+
+// Executes the command built in cmd_buf up to `end`; returns its response code
+static uint32_t run(const uint8_t *end, uint32_t *response_size, uint8_t **response)
+{
+    const uint32_t len = (uint32_t)(end - cmd_buf);
+    put_u32(cmd_buf + 2, len);
+    ExecuteCommand(len, cmd_buf, response_size, response);
+    return *response_size >= TPM_HEADER_LEN ? get_u32(*response + 6) : PREHASH_RC_FAILURE;
+}
+
+uint32_t prehash_command_load(const uint8_t *request, uint32_t request_size)
+{
+    // Header | keyHandle | authorizationSize
+    if (request_size < TPM_HEADER_LEN + 8u || get_u32(request + 2) != request_size)
+        return TRANSPORT_RC_COMMAND_SIZE;
+    if (get_u16(request) != PREHASH_ST_SESSIONS)
+        return PREHASH_RC_AUTH_MISSING;
+    key_handle = get_u32(request + TPM_HEADER_LEN);
+    auth_size = get_u32(request + TPM_HEADER_LEN + 4u);
+    const uint32_t auth_off = TPM_HEADER_LEN + 8u;
+    if (auth_size == 0 || auth_size > PREHASH_AUTH_MAX || auth_size > request_size - auth_off)
+        return PREHASH_RC_AUTHSIZE;
+    memcpy(auth, request + auth_off, auth_size);
+
+    const uint32_t digest_off = auth_off + auth_size;
+    if (request_size - digest_off < 2u)
+        return PREHASH_RC_INSUFFICIENT_P1;
+    const uint16_t digest_size = get_u16(request + digest_off);
+    if (digest_size != DILITHIUM_PREHASH_DIGEST_SIZE || request_size - digest_off - 2u != digest_size)
+        return PREHASH_RC_SIZE_P1;
+    memcpy(digest, request + digest_off + 2u, DILITHIUM_PREHASH_DIGEST_SIZE);
+    return 0;
+}
+
+void prehash_command_execute(uint32_t rc, uint32_t *response_size, uint8_t **response)
+{
+    if (rc)
+    {
+        write_rc(rc, response_size, *response);
+        return;
+    }
+
+    // Handle and session numbers in a HashSignStart error are those of the request
+    uint8_t *rsp = rsp_buf;
+    uint32_t rsp_size = sizeof rsp_buf;
+    uint8_t *p = begin(PREHASH_ST_SESSIONS, PREHASH_CC_HASHSIGN_START, key_handle);
+    p = put_u32(p, auth_size);
+    memcpy(p, auth, auth_size);
+    p = put_u32(p + auth_size, DILITHIUM_PREHASH_DIGEST_SIZE);
+    rc = run(p, &rsp_size, &rsp);
+    if (rc || rsp_size < TPM_HEADER_LEN + 4u)
+    {
+        memcpy(*response, rsp, rsp_size);
+        *response_size = rsp_size;
+        return;
+    }
+    const uint32_t sequence = get_u32(rsp + TPM_HEADER_LEN);
+
+    // So is the digest's parameter number in a SequenceUpdate error
+    rsp = rsp_buf;
+    rsp_size = sizeof rsp_buf;
+    p = put_empty_pw(begin(PREHASH_ST_SESSIONS, PREHASH_CC_SEQUENCE_UPDATE, sequence));
+    p = put_u16(p, DILITHIUM_PREHASH_DIGEST_SIZE);
+    memcpy(p, digest, DILITHIUM_PREHASH_DIGEST_SIZE);
+    rc = run(p + DILITHIUM_PREHASH_DIGEST_SIZE, &rsp_size, &rsp);
+    if (rc)
+    {
+        memcpy(*response, rsp, rsp_size);
+        *response_size = rsp_size;
+        // The sequence would otherwise hold one of the TPM's object slots
+        uint8_t *flush_rsp = rsp_buf;
+        uint32_t flush_size = sizeof rsp_buf;
+        run(begin(PREHASH_ST_NO_SESSIONS, PREHASH_CC_FLUSH_CONTEXT, sequence), &flush_size, &flush_rsp);
+        return;
+    }
+
+    // Signed straight into the caller's response buffer
+    p = put_empty_pw(begin(PREHASH_ST_SESSIONS, PREHASH_CC_HASHSIGN_FINISH, sequence));
+    run(p, response_size, response);
+}
@@ -18,6 +18,8 @@
 #include "run_command.h"
 #include "transport.h"
 #include "log.h"
+#include "perf.h"
+#include "prehash.h"
 
 jmp_buf s_jumpBuffer;
 
@@ -36,8 +38,30 @@ LIB_EXPORT void _plat__RunCommand(
     unsigned char **response // IN/OUT: response buffer
 )
 {
+    const uint32_t command_code = requestSize >= TPM_HEADER_LEN
+                                      ? ((uint32_t)request[6] << 24) | ((uint32_t)request[7] << 16) |
+                                            ((uint32_t)request[8] << 8) | request[9]
+                                      : 0;
+    // Vendor command served by the platform itself, and kept out of its own statistics
+    if (command_code == TPM_CC_READ_PERF_COUNTERS)
+    {
+        perf_command_response(request, requestSize, responseSize, response);
+        return;
+    }
+
+    const uint64_t t0 = perf_cycles();
+    perf_command_begin(command_code);
+    // Vendor command replayed through ExecuteCommand by the platform (see prehash.h). The
+    // request is parsed before setjmp: a failure longjmps back after the response has
+    // started to overwrite it
+    const bool hashsign_digest = command_code == TPM_CC_HASHSIGN_DIGEST;
+    const uint32_t hashsign_digest_rc = hashsign_digest ? prehash_command_load(request, requestSize) : 0;
     setjmp(s_jumpBuffer);
-    ExecuteCommand(requestSize, request, responseSize, response);
+    if (hashsign_digest)
+        prehash_command_execute(hashsign_digest_rc, responseSize, response);
+    else
+        ExecuteCommand(requestSize, request, responseSize, response);
+    perf_command_end(t0);
 }
 
 //***_plat__Fail()
@@ -1,15 +1,22 @@
 #include "transport.h"
 
 // TODO: refactor this so we have error treatment, and so the API is generally better
-// For example, forcing the reset when reading the command is weird and forces main to do weirder stuff
-// But for now, I guess it works...
 
 // Global vars for the interrupt service
+// Assembler state for the slot currently being filled (owned by the ISR)
 static rx_state_t rx_state = RX_WAITING_FOR_HEADER;
-static rx_return_code_t rx_code = SUCCESSFUL;
 static uint32_t bytes_collected = 0;
+static uint32_t discard_left = 0;
+static uint32_t fill_slot = 0;
 uint32_t expected_cmd_len = 0;
 
+// Per-slot handoff: the ISR sets slot_full once a command is complete, main clears it
+// through transport_release_command() after the response has been sent.
+static volatile uint8_t slot_full[TPM_RX_SLOTS];
+static volatile uint32_t slot_len[TPM_RX_SLOTS];
+static volatile rx_return_code_t slot_code[TPM_RX_SLOTS];
+static uint32_t run_slot = 0;
+
 // ---- Helpers ----
 static inline uint32_t be32_read(const uint8_t *p)
 {
@@ -26,15 +33,30 @@ static inline uint32_t header_extract_command_size(const uint8_t *hdr)
     return be32_read(&hdr[2]);
 }
 
+static inline uint8_t *slot_buf(uint32_t slot)
+{
+    return &tpm_cmd_buf[slot * TPM_MAX_CMD_LEN];
+}
+
 static void receiver_reset(void)
 {
     // Reset assembler state
     rx_state = RX_WAITING_FOR_HEADER;
-    rx_code = SUCCESSFUL;
     bytes_collected = 0;
+    discard_left = 0;
     expected_cmd_len = 0;
 }
 
+// Hand the slot being filled over to main and move on to the next one
+static void receiver_complete(rx_return_code_t code)
+{
+    slot_len[fill_slot] = expected_cmd_len;
+    slot_code[fill_slot] = code;
+    slot_full[fill_slot] = 1;
+    fill_slot = (fill_slot + 1) % TPM_RX_SLOTS;
+    receiver_reset();
+}
+
 // ---- Interrupt Service Routine ----
 static void rx_isr(void)
 {
@@ -43,29 +65,47 @@ static void rx_isr(void)
     {
         uint8_t b = cmd_uart_rxtx_read();
 
-        // If a previous error or ready state hasn't been consumed, drop bytes (or mask RX)
-        if (rx_state == RX_COMMAND_READY || rx_state == RX_ERROR)
+        if (rx_state == RX_ERROR)
         {
-            // Optional: you could mask RX to apply backpressure:
-            // uint32_t en = cmd_uart_ev_enable_read();
-            // cmd_uart_ev_enable_write(en & ~UART_EV_RX);
+            // Oversized command: swallow the rest of it so framing is kept
+            if (--discard_left == 0)
+                receiver_complete(ER_CMDSIZE_TOO_LARGE);
             continue;
-            // We should send an error message back or something like that
         }
 
-        ((volatile uint8_t *)tpm_cmd_buf)[bytes_collected++] = b;
+        // Every slot is queued or executing: drop bytes
+        // (the host must not keep more than TPM_RX_SLOTS commands in flight)
+        if (slot_full[fill_slot])
+            continue;
+
+        volatile uint8_t *buf = (volatile uint8_t *)slot_buf(fill_slot);
+        buf[bytes_collected++] = b;
 
         if (rx_state == RX_WAITING_FOR_HEADER && bytes_collected == TPM_HEADER_LEN)
         {
             // We just completed the header; parse total command size
-            expected_cmd_len = header_extract_command_size((const uint8_t *)tpm_cmd_buf);
-
+            expected_cmd_len = header_extract_command_size((const uint8_t *)buf);
+
+            if (expected_cmd_len < TPM_HEADER_LEN)
+            {
+                receiver_complete(ER_CMDSIZE_SMALLER_THAN_HEADER);
+                continue;
+            }
+            if (expected_cmd_len > TPM_MAX_CMD_LEN)
+            {
+                rx_state = RX_ERROR;
+                discard_left = expected_cmd_len - TPM_HEADER_LEN;
+                continue;
+            }
             rx_state = (expected_cmd_len == TPM_HEADER_LEN) ? RX_COMMAND_READY : RX_WAITING_FOR_BODY;
         }
 
         if (rx_state == RX_WAITING_FOR_BODY && bytes_collected == expected_cmd_len)
             rx_state = RX_COMMAND_READY;
 
+        if (rx_state == RX_COMMAND_READY)
+            receiver_complete(SUCCESSFUL);
+
         // Ack every byte (mirrors libbase pattern)
         cmd_uart_ev_pending_write(UART_EV_RX);
     }
@@ -103,9 +143,10 @@ void transport_irq_init(void)
     irq_setie(1);
 }
 
+// The accessors below refer to the oldest complete command (the slot main runs next)
 inline uint32_t transport_get_cmd_len(void)
 {
-    return expected_cmd_len;
+    return slot_len[run_slot];
 }
 
 inline uint32_t transport_get_bytes_read(void)
@@ -115,20 +156,24 @@ inline uint32_t transport_get_bytes_read(void)
 
 inline bool transport_ingestion_done(void)
 {
-    asm volatile("nop"); // TODO: this shouldnt be necessary here but seems to work
-    return (rx_state == RX_COMMAND_READY) || (rx_state == RX_ERROR);
+    return slot_full[run_slot];
 }
 
-uint32_t transport_read_command(void)
+inline uint8_t *transport_get_cmd_buf(void)
 {
-    if (rx_state == RX_COMMAND_READY)
-        receiver_reset();
+    return slot_buf(run_slot);
+}
 
-    // Optional: re-enable RX if you masked it in ISR
-    // uint32_t en = cmd_uart_ev_enable_read();
-    // cmd_uart_ev_enable_write(en | UART_EV_RX);
+uint32_t transport_read_command(void)
+{
+    return slot_code[run_slot];
+}
 
-    return rx_code;
+// Give the slot back to the ISR; call once its response has been written
+void transport_release_command(void)
+{
+    slot_full[run_slot] = 0;
+    run_slot = (run_slot + 1) % TPM_RX_SLOTS;
 }
 
 // TODO: make this better
@@ -150,6 +195,15 @@ void transport_write_rsp(const uint8_t *buf, uint32_t len)
     }
 }
 
+// Header-only error response (tag TPM_ST_NO_SESSIONS, size 10, rc)
+void transport_write_rc_rsp(uint32_t rc)
+{
+    const uint8_t rsp[TPM_HEADER_LEN] = {
+        0x80, 0x01, 0x00, 0x00, 0x00, TPM_HEADER_LEN,
+        (uint8_t)(rc >> 24), (uint8_t)(rc >> 16), (uint8_t)(rc >> 8), (uint8_t)rc};
+    transport_write_rsp(rsp, sizeof(rsp));
+}
+
 void _debug_transport_write_ready(void)
 {
     transport_write_byte(0xA0);
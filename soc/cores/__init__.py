@@ -1,3 +1,4 @@
 from .dilithium import Dilithium
 from .crg import PetaliteCRG, PetaliteSimCRG, PowerBridge, PowerController
 from .trng import RingOscillatorTRNG, SimTRNG
+from .perf import PerfCounters
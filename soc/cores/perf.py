@@ -0,0 +1,60 @@
+from migen import Module, Signal, If
+from litex.soc.interconnect.csr import AutoCSR, CSRStorage, CSRField, CSRStatus
+from litex.soc.integration.doc import AutoDoc, ModuleDoc
+
+
+class PerfCounters(Module, AutoCSR, AutoDoc):
+    def __init__(self, width: int = 64):
+        self.intro = ModuleDoc(
+            """
+            Free-running event counters, one CSR each. Every counter adds one per cycle its
+            event is high while `enable` is set. Writing `latch` copies all of them into their
+            CSRs on the same cycle, so values read afterwards belong to the same instant and
+            can be compared with each other (e.g. against `cycles`). `reset` clears them.
+
+            Counters are added with add_counter() (any event), add_stream() (transfers and
+            stalls of a stream endpoint) and add_wishbone() (accesses and wait states of a
+            bus master). Being plain CSRs, they are read by the firmware (generated/csr.h)
+            and by any bus bridge (litex_server + RemoteClient with the build's csr.csv).
+            """
+        )
+        self.width = width
+        self.control = CSRStorage(
+            fields=[
+                CSRField("enable", size=1, reset=1, description="Count events; 0 holds every counter"),
+                CSRField("reset", size=1, pulse=True, description="Clear every counter"),
+                CSRField("latch", size=1, pulse=True, description="Copy every counter into its CSR"),
+            ]
+        )
+        self.counters = []
+        self.add_counter("cycles", 1, "Cycles while enabled")
+
+    def add_counter(self, name: str, event, description: str = "") -> Signal:
+        count = Signal(self.width)
+        status = CSRStatus(self.width, name=name, description=description)
+        # AutoCSR collects the CSRs it finds among the module's attributes
+        setattr(self, name, status)
+        self.sync += [
+            If(self.control.fields.reset, count.eq(0)).Elif(
+                self.control.fields.enable & event, count.eq(count + 1)
+            ),
+            If(self.control.fields.latch, status.status.eq(count)),
+        ]
+        self.counters.append(name)
+        return count
+
+    def add_stream(self, name: str, endpoint, active=1):
+        """Transfers, producer stalls (`starved`) and consumer stalls (`blocked`) of `endpoint`.
+
+        `active` qualifies `starved`: a consumer idling with ready high is not waiting.
+        """
+        self.add_counter(f"{name}_transfers", endpoint.valid & endpoint.ready, "Beats transferred")
+        self.add_counter(
+            f"{name}_starved", active & endpoint.ready & ~endpoint.valid, "Consumer ready, producer has no data"
+        )
+        self.add_counter(f"{name}_blocked", endpoint.valid & ~endpoint.ready, "Producer has data, consumer not ready")
+
+    def add_wishbone(self, name: str, bus):
+        """Cycles with an access pending (`access`) and the part of them without ack (`wait`)"""
+        self.add_counter(f"{name}_access", bus.cyc & bus.stb, "Cycles with an access pending")
+        self.add_counter(f"{name}_wait", bus.cyc & bus.stb & ~bus.ack, "Wait states")
@@ -32,8 +32,12 @@ def main():
     )
 
     # Building stage
+    # csr.csv maps CSR names (e.g. perf_counters_*) for litex_server/RemoteClient on the debug bridge
     builder = Builder(
-        soc=soc, output_dir=args.build_dir, compile_gateware=args.compile_gateware
+        soc=soc,
+        output_dir=args.build_dir,
+        compile_gateware=args.compile_gateware,
+        csr_csv=str(Path(args.build_dir) / "csr.csv") if args.build_dir else None,
     )
 
     if args.sim:
@@ -42,7 +46,7 @@ def main():
         sim_config = SimConfig()
         sim_config.add_clocker("sys_clk", freq_hz=args.sys_clk_freq)
         if args.comm == CommProtocol.UART:
-            sim_config.add_module("serial2tcp", ("serial", 0), args={"port": 4327})
+            sim_config.add_module("serial2tcp", ("serial", 0), args={"port": args.tcp_port})
             sim_config.add_module("serial2console", ("serial_term", 0))
 
         if args.debug_bridge:
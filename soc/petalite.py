@@ -1,4 +1,4 @@
-from migen import Signal, ClockDomainsRenamer
+from migen import Signal, ClockDomainsRenamer, If
 from migen.genlib.cdc import PulseSynchronizer, MultiReg
 from litex.soc.cores.dma import WishboneDMAReader, WishboneDMAWriter
 from litex.soc.integration.soc_core import SoCCore
@@ -7,7 +7,7 @@ from litex.soc.interconnect import wishbone
 from litex.build.generic_platform import GenericPlatform
 from litex.build.sim import SimPlatform
 
-from cores import Dilithium, PowerBridge, PowerController
+from cores import Dilithium, PerfCounters, PowerBridge, PowerController
 from utils import CommProtocol, KBYTE
 
 
@@ -79,6 +79,8 @@ class PetaliteCore(SoCCore):
         self.add_dilithium()
         if debug_bridge:
             self.add_etherbone_bridge()
+        # Last, so it sees every bus master
+        self.add_perf_counters()
 
         # Simulation debugging ------------------------------------------------------------
         # TODO: revise why we need to do this, and what it means
@@ -215,10 +217,11 @@ class PetaliteCore(SoCCore):
             )
             # Add io buffers for TPM commands
             # NOTE: considering Dilithium signatures can be ~5kB big,
-            #       this IO buffer should be bigger than that.
+            #       each of the firmware's 2 command slots (TPM_RX_SLOTS) needs
+            #       more than that: 2 x 6 KB (TPM_MAX_CMD_LEN in transport.h).
             self.add_buffer(
                 name="tpm_cmd_buffer",
-                size=8 * KBYTE,
+                size=12 * KBYTE,
                 mode="rw",
                 custom=True,
             )
@@ -278,3 +281,32 @@ class PetaliteCore(SoCCore):
             mode="rw",
             custom=True,
         )
+
+    def add_perf_counters(self):
+        self.submodules.perf_counters = perf = PerfCounters()
+        self.add_csr("perf_counters")
+
+        # Dilithium op in flight: from the start pulse until the writer has stored the
+        # result or the core is reset. A HashSign/HashVerify sequence stays busy between
+        # its commands, while the core waits for the next message chunk.
+        busy = Signal()
+        self.sync += If(
+            self.dilithium.reset.storage | self.dilithium_writer._done.status, busy.eq(0)
+        ).Elif(self.dilithium.start.storage, busy.eq(1))
+        sink, source = self.dilithium.sink, self.dilithium.source
+        sink_starved = sink.ready & ~sink.valid
+        source_blocked = source.valid & ~source.ready
+        perf.add_counter("dilithium_busy", busy, "Dilithium op in flight")
+        perf.add_counter(
+            "dilithium_compute",
+            busy & ~sink_starved & ~source_blocked,
+            "Dilithium busy and waiting on neither DMA",
+        )
+        # sink: dilithium_reader -> core, source: core -> dilithium_writer
+        perf.add_stream("dilithium_sink", sink, active=busy)
+        perf.add_stream("dilithium_source", source, active=busy)
+
+        # Wait states per bus master (masters of other standards are converted to wishbone)
+        for name, master in self.bus.masters.items():
+            if isinstance(master, wishbone.Interface):
+                perf.add_wishbone(name, master)
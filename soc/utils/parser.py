@@ -77,6 +77,13 @@ def arg_parser():
         help="Communication protocol (UART or PCIE).",
     )
 
+    parser.add_argument(
+        "--tcp-port",
+        type=int,
+        default=4327,
+        help="TCP port serial2tcp binds the TPM UART to (simulation only). "
+        "Use distinct ports to run several sims side by side.",
+    )
     parser.add_argument(
         "--trace",
         action="store_true",
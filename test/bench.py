@@ -0,0 +1,327 @@
+"""End-to-end TPM benchmark: command latency percentiles and HashSign/HashVerify
+throughput, written as JSON so runs can be compared across firmware and gateware builds.
+
+Measures Startup, GetRandom, CreatePrimary(Dilithium) and, for every security
+level, message size and SequenceUpdate chunk size, HashSign and HashVerify
+(HashSignStart/HashVerifyStart through Finish, streamed with TPMClient.sign_file):
+
+    python bench.py                                           # in-process stand-in
+    python bench.py --tcp-port 4327 --label "fw abc123" --out sim.json
+    python bench.py --serial /dev/ttyUSB1 --levels 2 --sizes 32 1024 65536
+
+From Python, e.g. inside a pytest test, run_bench() takes a function that opens a
+UARTConnection and returns the same dict that is written as JSON:
+
+    results = run_bench(lambda: UARTConnection(mode="tcp", tcp_port=port, debug=False), levels=[2])
+
+Latencies are per exchange as seen by the host (UART transfer included), in ms;
+throughput is message KiB/s at the median latency. "phases_ms" splits every command
+into marshal/tx/compute/rx/decode (tpm_timing), to tell link-bound from core-bound;
+"device" holds the firmware's own cycle counters per level (ReadPerfCounters), or
+null when the firmware does not have them.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import subprocess
+
+from uart import UARTConnection
+from histogram import LatencyHistogram
+from tpm_client import TPMClient
+from tpm_timing import CommandTimings
+from tpm_utils import TPM_RX_SLOTS
+
+LEVELS = [2, 3, 5]
+SIZES = [32, 1024, 32 * 1024, 1024 * 1024]
+PERCENTILES = (50, 90, 99)
+TPM_RC_INITIALIZE = 0x100
+
+
+class _Case:
+    """Latency samples of one operation under one set of parameters"""
+
+    def __init__(self, op: str, level: int | None = None, msg_size: int | None = None, chunk_size: int | None = None):
+        self.op = op
+        self.level = level
+        self.msg_size = msg_size
+        self.chunk_size = chunk_size
+        self.hist = LatencyHistogram()
+        # Set when the TPM rejected the operation; the sweep goes on without it
+        self.error = None
+
+    def time(self, fn):
+        t0 = time.perf_counter_ns()
+        out = fn()
+        self.hist.record(time.perf_counter_ns() - t0)
+        return out
+
+    def result(self) -> dict:
+        latency = self.hist.summary(percentiles=PERCENTILES, scale=1e6)
+        out = {"op": self.op}
+        for key in ("level", "msg_size", "chunk_size"):
+            if getattr(self, key) is not None:
+                out[key] = getattr(self, key)
+        if self.error is not None:
+            out["error"] = self.error
+        if not self.hist.count:
+            return out
+        out["latency_ms"] = latency
+        out["ops_per_s"] = 1e3 / latency["mean"] if latency["mean"] else 0.0
+        if self.msg_size is not None and latency["p50"]:
+            out["throughput_kib_s"] = self.msg_size / 1024 / (latency["p50"] / 1e3)
+        return out
+
+    def label(self) -> str:
+        parts = [self.op]
+        if self.level is not None:
+            parts.append(f"L{self.level}")
+        if self.msg_size is not None:
+            parts.append(f"{self.msg_size} B")
+        if self.chunk_size is not None:
+            parts.append(f"chunk {self.chunk_size}")
+        return " ".join(parts)
+
+
+def _check(name: str, rsp, allowed=(0,)) -> bytes:
+    rc = int.from_bytes(rsp[6:10], "big")
+    if rc not in allowed:
+        raise RuntimeError(f"{name} failed rc=0x{rc:08X}")
+    return rsp
+
+
+def _bench_level(
+    connect,
+    level: int,
+    sizes: list,
+    chunk_sizes: list,
+    repeat: int,
+    window: int,
+    timings: CommandTimings,
+    rx_slots: int = TPM_RX_SLOTS,
+) -> tuple:
+    """One connection: Startup, GetRandom and CreatePrimary, then HashSign/HashVerify per size and chunk.
+
+    Returns (cases, ReadPerfCounters of the level or None).
+    """
+    uart = connect()
+    try:
+        client = TPMClient(uart, window=window, rx_slots=rx_slots, verbose=False, timings=timings)
+        uart.wait_for_ready(timeout=180)
+        # A board keeps its state across connections, so a second Startup gets TPM_RC_INITIALIZE
+        startup = _Case("Startup", level)
+        _check("Startup", startup.time(lambda: client.startup_cmd("CLEAR")), (0, TPM_RC_INITIALIZE))
+        device = _perf_counters(client, reset=True)
+        get_random = _Case("GetRandom", level)
+        create = _Case("CreatePrimary", level)
+        for i in range(repeat):
+            _check("GetRandom", get_random.time(lambda: client.get_random_cmd(32)))
+            rsp = _check("CreatePrimary", create.time(lambda: client.create_primary_dilithium_cmd(level)))
+            key_handle = client.extract_first_handle_from_response(rsp)
+            if i < repeat - 1:
+                client.flush_context_cmd(key_handle)
+        cases = [startup, get_random, create]
+
+        for requested in chunk_sizes:
+            chunk_size = requested or client.sequence_chunk_size()
+            for size in sizes:
+                message = os.urandom(size)
+                sign = _Case("HashSign", level, size, chunk_size)
+                verify = _Case("HashVerify", level, size, chunk_size)
+                for _ in range(repeat):
+                    try:
+                        sig = sign.time(lambda: client.sign_file(message, key_handle, chunk_size=chunk_size))
+                    except RuntimeError as e:
+                        sign.error, verify.error = str(e), "not run, HashSign failed"
+                        break
+                    # Not caught: the TPM must verify what it just signed, at every level, so a
+                    # rejected HashVerifyStart (e.g. TPM_RC_COMMAND_SIZE) fails the sweep
+                    verify.time(lambda: client.verify_file(message, sig, key_handle, chunk_size=chunk_size))
+                cases += [sign, verify]
+        client.flush_context_cmd(key_handle)
+        if device is not None:
+            device = _perf_counters(client, reset=True)
+        return cases, device
+    finally:
+        uart.close()
+
+
+def _perf_counters(client: TPMClient, reset: bool) -> dict | None:
+    try:
+        return client.read_perf_counters_cmd(reset=reset)
+    except RuntimeError:
+        # Firmware built without the vendor command
+        return None
+
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_bench(
+    connect,
+    levels: list = LEVELS,
+    sizes: list = SIZES,
+    chunk_sizes: list = (None,),
+    repeat: int = 5,
+    window: int = 1,
+    target: str = "",
+    label: str = "",
+    progress=None,
+    line_baud: int | None = None,
+    rx_slots: int = TPM_RX_SLOTS,
+) -> dict:
+    """Run the sweep; `connect()` returns a new UARTConnection to the TPM.
+
+    chunk_sizes entries of None use the size TPMClient picks from GetCapability.
+    `progress(case)` is called as each level finishes, for live output.
+    `line_baud` is the TPM's UART rate when the host only sees TCP (serial2tcp).
+    `rx_slots` is the TPM's command slot count; `window` must not exceed it.
+    """
+    if repeat < 1:
+        raise ValueError(f"repeat must be at least 1, got {repeat}")
+    started = datetime.datetime.now(datetime.timezone.utc)
+    timings = CommandTimings(baud=line_baud)
+    results = []
+    device = {}
+    for level in levels:
+        cases, device[str(level)] = _bench_level(
+            connect, level, sizes, list(chunk_sizes), repeat, window, timings, rx_slots
+        )
+        for case in cases:
+            if progress:
+                progress(case)
+            results.append(case.result())
+    return {
+        "meta": {
+            "started": started.isoformat(timespec="seconds"),
+            "seconds": (datetime.datetime.now(datetime.timezone.utc) - started).total_seconds(),
+            "target": target,
+            "label": label,
+            "host_revision": _git_revision(),
+            "repeat": repeat,
+            "window": window,
+            "line_baud": line_baud,
+            "percentiles": list(PERCENTILES),
+        },
+        "results": results,
+        "phases_ms": timings.summary(PERCENTILES),
+        "device": device,
+    }
+
+
+def _chunk_arg(value: str) -> int | None:
+    return None if value == "auto" else int(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="TPM latency/throughput benchmark with JSON results")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--tcp-port", type=int, help="Running sim, stand-in or serial2tcp board")
+    target.add_argument("--serial", metavar="DEV", help="Board on a serial port")
+    parser.add_argument("--tcp-host", default="localhost")
+    parser.add_argument(
+        "--baud",
+        type=int,
+        default=None,
+        help="TPM UART rate: serial port setting, stand-in line model, or the board behind --tcp-port",
+    )
+    parser.add_argument("--levels", type=int, nargs="+", default=LEVELS, choices=LEVELS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Message sizes (bytes)")
+    parser.add_argument(
+        "--chunk-sizes",
+        type=_chunk_arg,
+        nargs="+",
+        default=[None],
+        help='SequenceUpdate payload sizes; "auto" asks the TPM (default: auto)',
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Samples per operation and parameter set")
+    parser.add_argument("--window", type=int, default=1, help="SequenceUpdates in flight")
+    parser.add_argument("--label", default="", help="Free text stored with the results, e.g. firmware build")
+    parser.add_argument("--out", metavar="PATH", help="Write JSON here (default: stdout)")
+    stand_in = parser.add_argument_group("in-process stand-in (no --tcp-port/--serial)")
+    stand_in.add_argument(
+        "--latency",
+        action="append",
+        metavar="NAME=MS",
+        help="Per-command processing time, e.g. HashSignFinish=250 (repeatable)",
+    )
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    return args
+
+
+def main():
+    args = parse_args()
+    server = None
+    baudrate = args.baud
+    if args.serial:
+        target = args.serial
+        baudrate = args.baud or 115200
+
+        def connect():
+            return UARTConnection(mode="serial", serial_port=args.serial, baudrate=baudrate, debug=False)
+
+    else:
+        host, port = args.tcp_host, args.tcp_port
+        if port is None:
+            from tpm_standin import TPMStandIn, _parse_latency
+
+            server = TPMStandIn(
+                port=0, latency=_parse_latency(args.latency), baud=args.baud, rx_slots=max(2, args.window)
+            ).start()
+            host, port = server.host, server.port
+        target = f"{host}:{port}" if server is None else f"stand-in ({server.backend.name})"
+
+        def connect():
+            return UARTConnection(mode="tcp", tcp_host=host, tcp_port=port, debug=False)
+
+    def progress(case):
+        if case.error is not None:
+            print(f"{case.label()}: {case.error}", file=sys.stderr)
+        else:
+            print(case.hist.render(case.label(), unit="ms", scale=1e6), file=sys.stderr)
+
+    try:
+        results = run_bench(
+            connect,
+            levels=args.levels,
+            sizes=args.sizes,
+            chunk_sizes=args.chunk_sizes,
+            repeat=args.repeat,
+            window=args.window,
+            target=target,
+            label=args.label,
+            progress=progress,
+            line_baud=baudrate,
+            rx_slots=TPM_RX_SLOTS if server is None else server.rx_slots,
+        )
+    finally:
+        if server is not None:
+            server.close()
+
+    text = json.dumps(results, indent=1)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"Results written to {args.out}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,10 @@ except Exception:
 # Local modules
 from uart import UARTConnection
 from tpm_client import TPMClient
+from key_cache import KeyCache
+from tpm_schema import segment_command, segment_response
 from tpm_utils import (
     sessions_param_offset as _sessions_param_offset,
-    parse_createprimary_outpublic as _parse_createprimary_outpublic,
 )
 
 
@@ -88,6 +89,8 @@ class TPMDashboard(BaseWindow):
         self.pubkey: Optional[bytes] = None
         self.signature: Optional[bytes] = None
         self.ticket: Optional[tuple] = None
+        # Persistent signing keys from earlier sessions, per device
+        self.key_cache = KeyCache()
 
         self.op_log = ThreadSafeLog()
         self._tooltip_win = None
@@ -522,7 +525,12 @@ class TPMDashboard(BaseWindow):
                         name="Dashboard",
                     )
                 self.uart = uart
-                self.client = TPMClient(self.uart, on_command=self._on_command, on_response=self._on_response)
+                self.client = TPMClient(
+                    self.uart,
+                    on_command=self._on_command,
+                    on_response=self._on_response,
+                    key_cache=self.key_cache,
+                )
 
                 # Stage 1 complete: transport connected
                 t1 = time.perf_counter()
@@ -561,6 +569,11 @@ class TPMDashboard(BaseWindow):
                         except Exception:
                             pass
                         self._op("Startup(CLEAR) completed")
+                        # A key persisted by an earlier session needs no CreatePrimary
+                        handle = self.client.load_cached_key()
+                        if handle is not None:
+                            self._op(f"Reusing persistent Dilithium key 0x{handle:08X}")
+                            self.after(0, self._on_key_created, handle, self.client.signing_pubkey)
                         self.after(0, self._set_status, "Connected (ready)", "ok")
                         # Show big ready label
                         try:
@@ -637,7 +650,12 @@ class TPMDashboard(BaseWindow):
         ts = time.strftime("%H:%M:%S")
         if self._last_cmd_name == name and self._last_cmd_t0:
             elapsed = time.perf_counter() - self._last_cmd_t0
-            title = f"[{ts}] [RX] {name} (len={len(data)}) — {elapsed:.2f}s\n"
+            split = ""
+            phases = meta.get("phases")
+            if phases:
+                # Where the time went (TPMClient phase timing): link vs TPM
+                split = f" (tx {phases['tx'] / 1e9:.2f}s, TPM {phases['compute'] / 1e9:.2f}s, rx {phases['rx'] / 1e9:.2f}s)"
+            title = f"[{ts}] [RX] {name} (len={len(data)}) — {elapsed:.2f}s{split}\n"
         else:
             title = f"[{ts}] [RX] {name} (len={len(data)})\n"
         self.after(0, self._append_packet, self.rx_text, title, data, False, meta)
@@ -673,55 +691,12 @@ class TPMDashboard(BaseWindow):
         widget.see(tk.END)
 
     def _segment_packet(self, data: bytes, is_cmd: bool, meta: dict):
-        segs = []
-        n = len(data)
-        if n == 0:
-            return segs
-        hdr_end = min(10, n)
-        segs.append(("hdr", 0, hdr_end, "hdr"))
-        if n <= 10:
-            return segs
-        tag = int.from_bytes(data[0:2], "big")
-
-        def add(label, s, e, t):
-            if s < e:
-                segs.append((label, s, e, t))
-
+        if not data:
+            return []
         if is_cmd:
-            nm = str(meta.get("name") or "")
-            if tag == 0x8001:
-                if nm.startswith("Startup") or nm.startswith("GetRandom"):
-                    add("params", 10, min(12, n), "prm")
-                elif nm.startswith("HashVerifyStart"):
-                    pos = 10
-                    add("handle", pos, min(pos+4, n), "hdl"); pos += 4
-                    add("params", pos, min(pos+4, n), "prm"); pos += 4
-                    if pos + 6 <= n:
-                        add("sigHdr", pos, pos+6, "sig")
-                        sig_len = int.from_bytes(data[pos+4:pos+6], "big")
-                        pos += 6
-                        add("sig", pos, min(pos+sig_len, n), "sig")
-                    else:
-                        add("params", pos, n, "prm")
-                else:
-                    add("params", 10, n, "prm")
-            else:
-                pos = 10
-                if nm in ("HashSignStart", "SequenceUpdate", "HashSignFinish", "HashVerifyFinish", "CreatePrimary(Dilithium)", "CreatePrimary(ECC)"):
-                    add("handle", pos, min(pos+4, n), "hdl"); pos += 4
-                if pos + 4 <= n:
-                    auth_size = int.from_bytes(data[pos:pos+4], "big")
-                    add("authSize", pos, pos+4, "sz"); pos += 4
-                    add("auth", pos, min(pos+auth_size, n), "auth"); pos += auth_size
-                add("params", pos, n, "prm")
-        else:
-            pos = 10
-            handles_out = int(meta.get("handles_out", 0) or 0)
-            add("handles", pos, min(pos + 4*handles_out, n), "hdl"); pos += 4*handles_out
-            if tag == 0x8002 and pos + 4 <= n:
-                add("paramSize", pos, pos+4, "sz"); pos += 4
-            add("params", pos, n, "prm")
-        return segs
+            return segment_command(data)
+        handles_out = int(meta.get("handles_out", 0) or 0)
+        return segment_response(data, str(meta.get("name") or ""), handles_out)
 
     def _seg_label_desc(self, label: str, length: int) -> str:
         name_map = {
@@ -733,6 +708,7 @@ class TPMDashboard(BaseWindow):
             "params": "Parameters",
             "sig": "Signature",
             "sigHdr": "Signature header",
+            "paramSize": "Parameter size",
             "sz": "Size field",
         }
         pretty = name_map.get(label, label)
@@ -882,10 +858,9 @@ class TPMDashboard(BaseWindow):
         def worker():
             try:
                 self._op("CreatePrimary (Dilithium) starting…")
-                resp = self.client.create_primary_dilithium_cmd()
-                handle = self.client.extract_first_handle_from_response(resp)
-                pub = _parse_createprimary_outpublic(resp)
-                pk = pub.get("pub") if pub.get("type") == "dilithium" else None
+                # Made persistent and cached, so the next connection can skip this
+                handle = self.client.dilithium_key()
+                pk = self.client.signing_pubkey
                 if pk is None:
                     raise RuntimeError("CreatePrimary did not return a Dilithium public key")
                 self.after(0, self._on_key_created, handle, pk)
@@ -938,12 +913,7 @@ class TPMDashboard(BaseWindow):
             try:
                 self._op(f"HashSignStart (len={len(msg_bytes)})…")
                 seq = self.client.hashsign_start_cmd(self.key_handle, len(msg_bytes), key_pw=b"abcd")
-                chunk_size = 256
-                sent = 0
-                while sent < len(msg_bytes):
-                    chunk = msg_bytes[sent: sent + chunk_size]
-                    self.client.sequence_update_cmd(seq, chunk)
-                    sent += len(chunk)
+                self.client.sequence_update_stream(seq, msg_bytes)
                 sig = self.client.hashsign_finish_cmd(seq)
                 self.after(0, self._on_signature_ready, msg_bytes, sig)
                 self._op("HashSign finished")
@@ -982,12 +952,7 @@ class TPMDashboard(BaseWindow):
             try:
                 self._op(f"HashVerifyStart (len={len(msg_bytes)})…")
                 seq = self.client.hashverify_start_cmd(self.key_handle, len(msg_bytes), self.signature)
-                chunk_size = 256
-                sent = 0
-                while sent < len(msg_bytes):
-                    chunk = msg_bytes[sent: sent + chunk_size]
-                    self.client.sequence_update_cmd(seq, chunk)
-                    sent += len(chunk)
+                self.client.sequence_update_stream(seq, msg_bytes)
                 ticket = self.client.hashverify_finish_cmd(seq)
                 self.after(0, self._on_verified, ticket)
                 self._op("HashVerify finished (OK)")
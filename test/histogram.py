@@ -0,0 +1,107 @@
+"""Log-linear latency histogram (HDR-style buckets, fixed relative precision).
+
+Values are integers (nanoseconds by convention). Values below 2 * 2**sub_bits are
+counted exactly; above that every power-of-two range is split into 2**sub_bits
+buckets, so a recorded value is off by at most 1 / 2**sub_bits (~3 % by default).
+
+    hist = LatencyHistogram()
+    hist.record(time.perf_counter_ns() - t0)
+    print(hist.render("wake latency"))
+"""
+
+import threading
+
+
+class LatencyHistogram:
+    def __init__(self, sub_bits: int = 5):
+        self.sub_bits = sub_bits
+        self._sub = 1 << sub_bits
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = []
+            self.count = 0
+            self.total = 0
+            self.min = None
+            self.max = None
+
+    def _index(self, value: int) -> int:
+        if value < 2 * self._sub:
+            return value
+        shift = value.bit_length() - self.sub_bits - 1
+        return shift * self._sub + (value >> shift)
+
+    def _highest(self, index: int) -> int:
+        """Largest value that lands in bucket `index`"""
+        if index < 2 * self._sub:
+            return index
+        shift = index // self._sub - 1
+        mantissa = index - shift * self._sub
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, value: int, count: int = 1):
+        value = max(0, int(value))
+        idx = self._index(value)
+        with self._lock:
+            if idx >= len(self.counts):
+                self.counts.extend([0] * (idx + 1 - len(self.counts)))
+            self.counts[idx] += count
+            self.count += count
+            self.total += value * count
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def merge(self, other: "LatencyHistogram"):
+        if other.sub_bits != self.sub_bits:
+            raise ValueError("Cannot merge histograms with different precision")
+        with other._lock:
+            counts = list(other.counts)
+            total, lo, hi = other.total, other.min, other.max
+        with self._lock:
+            if len(counts) > len(self.counts):
+                self.counts.extend([0] * (len(counts) - len(self.counts)))
+            for i, c in enumerate(counts):
+                self.counts[i] += c
+            self.count += sum(counts)
+            self.total += total
+            if lo is not None:
+                self.min = lo if self.min is None else min(self.min, lo)
+                self.max = hi if self.max is None else max(self.max, hi)
+
+    def percentile(self, p: float) -> int:
+        """Value at or below which `p` percent of the recorded values fall"""
+        with self._lock:
+            if not self.count:
+                return 0
+            rank = max(1, -(-self.count * p // 100))
+            seen = 0
+            for idx, c in enumerate(self.counts):
+                seen += c
+                if seen >= rank:
+                    return min(self._highest(idx), self.max)
+            return self.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self, percentiles=(50, 90, 99, 99.9), scale: float = 1.0) -> dict:
+        """count/min/mean/pXX/max, values divided by `scale` (1e3 for ns -> us)"""
+        out = {
+            "count": self.count,
+            "min": (self.min or 0) / scale,
+            "mean": self.mean() / scale,
+        }
+        for p in percentiles:
+            out[f"p{p:g}"] = self.percentile(p) / scale
+        out["max"] = (self.max or 0) / scale
+        return out
+
+    def render(self, title: str = "", unit: str = "us", scale: float = 1e3) -> str:
+        s = self.summary(scale=scale)
+        parts = [f"{k}={v:.1f}" for k, v in s.items() if k != "count"]
+        prefix = f"{title}: " if title else ""
+        return f"{prefix}n={s['count']} " + " ".join(parts) + f" ({unit})"
@@ -0,0 +1,91 @@
+"""Host-side cache of persistent primary keys.
+
+A primary key is fixed by its CreatePrimary template (and the TPM's owner seed), so
+entries are keyed by device and the SHA-256 of the CreatePrimary command. Each entry
+holds the persistent handle the key was moved to with TPM2_EvictControl and its
+public area. On reconnect one TPM2_ReadPublic of that handle shows whether the key
+is still there and unchanged (the firmware's NV is RAM-backed, so a power cycle
+loses it); if so, CreatePrimary is skipped.
+
+    cache = KeyCache()                        # ~/.cache/petalite/keys.json
+    client = TPMClient(uart, key_cache=cache)
+    key = client.dilithium_key()              # ReadPublic on a hit, else CreatePrimary + EvictControl
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+from tpm_utils import TPM_HR_PERSISTENT, PERSISTENT_LAST
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "petalite", "keys.json")
+
+
+def template_hash(create_primary_cmd: bytes) -> str:
+    return hashlib.sha256(create_primary_cmd).hexdigest()
+
+
+# Handles tried, from the reserved one on, when others are held by foreign objects
+PERSISTENT_PROBES = 8
+
+
+def persistent_handle_for(digest: str) -> int:
+    """Owner persistent handle reserved for the key of one template"""
+    span = PERSISTENT_LAST - TPM_HR_PERSISTENT + 1
+    return TPM_HR_PERSISTENT + int(digest[:8], 16) % span
+
+
+def persistent_handles_for(digest: str, count: int = PERSISTENT_PROBES) -> list:
+    """The reserved handle and the ones after it, wrapping within the owner range"""
+    span = PERSISTENT_LAST - TPM_HR_PERSISTENT + 1
+    first = persistent_handle_for(digest) - TPM_HR_PERSISTENT
+    return [TPM_HR_PERSISTENT + (first + i) % span for i in range(count)]
+
+
+class KeyCache:
+    """JSON file of {device: {template hash: {handle, public}}}; safe to share between threads"""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"[key_cache] Ignoring unreadable {self.path} ({e})")
+            return {}
+
+    def _store(self, data: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def get(self, device: str, digest: str) -> dict | None:
+        """{"handle": int, "public": bytes} or None"""
+        with self._lock:
+            entry = self._load().get(device, {}).get(digest)
+        if entry is None:
+            return None
+        try:
+            return {"handle": int(entry["handle"], 16), "public": bytes.fromhex(entry["public"])}
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def put(self, device: str, digest: str, handle: int, public: bytes):
+        with self._lock:
+            data = self._load()
+            data.setdefault(device, {})[digest] = {"handle": f"0x{handle:08X}", "public": bytes(public).hex()}
+            self._store(data)
+
+    def drop(self, device: str, digest: str):
+        with self._lock:
+            data = self._load()
+            if data.get(device, {}).pop(digest, None) is not None:
+                self._store(data)
@@ -0,0 +1,568 @@
+"""Host-side micro-benchmarks for the UART/TPM client hot paths.
+
+Run one benchmark per invocation, e.g.:
+
+    python microbench.py rx --iterations 2000
+
+Each benchmark prints a small before/after table. Allocation figures come from
+tracemalloc (peak transient bytes per response above the steady-state baseline).
+"""
+
+import os
+import time
+import queue
+import socket
+import argparse
+import threading
+import tempfile
+import tracemalloc
+
+from uart import _RingBuffer, _SerialTransport, _SocketTransport, DILITHIUM_READY_BYTE
+from wire_log import WireLog, LEVEL_OFF, LEVEL_WIRE
+from histogram import LatencyHistogram
+from tpm_marshal import CommandBuilder
+from tpm_utils import (
+    TPM_ALG_DILITHIUM,
+    TPM_ALG_NULL,
+    TPM_CC_SequenceUpdate,
+    TPM_CC_HashVerifyStart,
+    TPM_ST_NO_SESSIONS,
+    TPM_ST_SESSIONS,
+    u32_be_hex,
+    u16_be_hex,
+    bytes_hex,
+    build_dilithium_signature_param,
+    command_template,
+    sessions_param_offset,
+)
+from tpm_schema import (
+    TPMTSignature,
+    decode_createprimary_outpublic,
+    decode_hashsign_finish,
+    encode_HashVerifyStart,
+    encode_SequenceUpdate,
+)
+
+# Response sizes worth looking at: HashSignFinish (signature) and CreatePrimary (pk)
+RESPONSE_SIZES = {
+    "sig-L2": 2420 + 25,
+    "sig-L3": 3293 + 25,
+    "sig-L5": 4595 + 25,
+    "pk-L5": 2592 + 60,
+}
+
+
+def _measure(fn, iterations: int, resp_len: int):
+    """Return (MB/s, peak transient KiB per call) for fn()."""
+    fn()  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    dt = time.perf_counter() - t0
+
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (resp_len * iterations / dt / 1e6, (peak - base) / 1024)
+
+
+def _print_table(title: str, header: tuple, rows: list):
+    print(f"\n=== {title} ===")
+    widths = [max(len(str(r[i])) for r in rows + [header]) for i in range(len(header))]
+    fmt = "  ".join(f"{{:>{w}}}" for w in widths)
+    print(fmt.format(*header))
+    for r in rows:
+        print(fmt.format(*r))
+
+
+# ---- rx: queue+pushback (previous UARTConnection) vs preallocated ring ----
+class _LegacyRx:
+    """Replica of the previous receive path: 64 B queue items + bytearray pushback."""
+
+    def __init__(self):
+        self.received_data = queue.Queue()
+        self._pushback = bytearray()
+
+    def feed(self, payload: bytes, read_size: int):
+        for i in range(0, len(payload), read_size):
+            self.received_data.put(("data", payload[i : i + read_size], time.time()))
+
+    def _next(self):
+        if self._pushback:
+            data = bytes(self._pushback)
+            self._pushback.clear()
+            return ("data", data, time.time())
+        return self.received_data.get_nowait()
+
+    def wait_for_ready(self):
+        while True:
+            _, data, _ = self._next()
+            for idx, byte in enumerate(data):
+                if byte == DILITHIUM_READY_BYTE:
+                    if idx + 1 < len(data):
+                        self._pushback.extend(data[idx + 1 :])
+                    return True
+
+    def wait_for_bytes(self, num_bytes):
+        buffer = bytearray()
+        while True:
+            if self._pushback and len(buffer) < num_bytes:
+                take = min(num_bytes - len(buffer), len(self._pushback))
+                buffer.extend(bytes(self._pushback[:take]))
+                del self._pushback[:take]
+                if len(buffer) >= num_bytes:
+                    return bytes(buffer[:num_bytes])
+            _, data, _ = self._next()
+            need = num_bytes - len(buffer)
+            take = data[:need]
+            buffer.extend(take)
+            if len(data) > len(take):
+                self._pushback.extend(data[len(take) :])
+            if len(buffer) >= num_bytes:
+                return bytes(buffer[:num_bytes])
+
+
+class _RingRx:
+    """Same consumer logic as UARTConnection on top of _RingBuffer (threads left out)."""
+
+    def __init__(self):
+        self.ring = _RingBuffer()
+
+    def feed(self, payload: bytes, read_size: int):
+        src = memoryview(payload)
+        pos = 0
+        while pos < len(src):
+            view = self.ring.writable()[:read_size]
+            n = min(len(view), len(src) - pos)
+            view[:n] = src[pos : pos + n]  # stands in for recv_into()
+            self.ring.commit(n)
+            pos += n
+
+    def wait_for_ready(self):
+        avail = self.ring.available()
+        idx = self.ring.find(DILITHIUM_READY_BYTE, avail)
+        self.ring.consume(idx + 1)
+        return True
+
+    def wait_for_bytes(self, num_bytes):
+        views = self.ring.views(num_bytes)
+        data = bytes(views[0]) if len(views) == 1 else b"".join(views)
+        self.ring.consume(num_bytes)
+        return data
+
+
+def bench_rx(args):
+    rows = []
+    for label, size in RESPONSE_SIZES.items():
+        body = os.urandom(size - 10)
+        header = b"\x80\x02" + size.to_bytes(4, "big") + b"\x00\x00\x00\x00"
+        wire = bytes([DILITHIUM_READY_BYTE]) + header + body
+
+        for name, cls in (("queue+pushback", _LegacyRx), ("ring", _RingRx)):
+            rx = cls()
+
+            def one_response():
+                rx.feed(wire, args.read_size)
+                rx.wait_for_ready()
+                hdr = rx.wait_for_bytes(10)
+                rsp_len = int.from_bytes(hdr[2:6], "big")
+                return hdr + rx.wait_for_bytes(rsp_len - 10)
+
+            assert one_response() == header + body
+            mbps, kib = _measure(one_response, args.iterations, len(wire))
+            rows.append((label, name, f"{mbps:.1f}", f"{kib:.1f}"))
+    _print_table(
+        f"rx path, {args.read_size} B reads",
+        ("response", "impl", "MB/s", "peak KiB/rsp"),
+        rows,
+    )
+
+
+# ---- log: per-line text formatting on the I/O thread vs queued raw records ----
+def bench_log(args):
+    rows = []
+    size = RESPONSE_SIZES["sig-L2"]
+    wire = os.urandom(size)
+    with tempfile.TemporaryDirectory() as tmp:
+        # Previous path: strftime + f-string per line, line-buffered text file
+        fp = open(os.path.join(tmp, "legacy.log"), "a", buffering=1, encoding="utf-8")
+        for label, per_byte in (("serial (per byte)", True), ("tcp (per read)", False)):
+
+            def legacy():
+                for i in range(0, len(wire), args.read_size):
+                    chunk = wire[i : i + args.read_size]
+                    if per_byte:
+                        for b in chunk:
+                            fp.write(f"[{time.strftime('%H:%M:%S')}] [READ] {b:02x}" + "\n")
+                    else:
+                        fp.write(f"[{time.strftime('%H:%M:%S')}] [READ] {chunk.hex()}" + "\n")
+
+            mbps, kib = _measure(legacy, args.iterations, size)
+            rows.append((label, "text lines", f"{mbps:.1f}", f"{kib:.1f}"))
+        fp.close()
+
+        for name, level in (("WireLog", LEVEL_WIRE), ("WireLog off", LEVEL_OFF)):
+            log = WireLog(path=os.path.join(tmp, "bench.wlog"), level=level)
+            src = memoryview(wire)
+
+            def recorded():
+                for i in range(0, len(src), args.read_size):
+                    if log.wire:
+                        log.read(src[i : i + args.read_size])
+
+            mbps, kib = _measure(recorded, args.iterations, size)
+            log.close()
+            rows.append(("any", name, f"{mbps:.1f}", f"{kib:.1f}"))
+    _print_table(
+        f"I/O-thread logging cost, {args.read_size} B reads, {size} B response",
+        ("mode", "impl", "MB/s", "peak KiB/rsp"),
+        rows,
+    )
+
+
+# ---- tx: slice-per-partial-write vs memoryview / gather writes ----
+class _PartialSerial:
+    """Stands in for a serial port whose kernel buffer takes `limit` bytes per write."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.calls = 0
+
+    def fileno(self):
+        raise OSError("no descriptor")  # forces _SerialTransport's pyserial path
+
+    def write(self, data) -> int:
+        self.calls += 1
+        return min(len(data), self.limit)
+
+
+def _drain(sock):
+    while sock.recv(1 << 16):
+        pass
+
+
+def bench_tx(args):
+    # Partial writes of a HashVerifyStart carrying an L5 signature
+    rows = []
+    command = os.urandom(RESPONSE_SIZES["sig-L5"])
+    limit = args.read_size
+    for name in ("slice remainder", "memoryview"):
+        ser = _PartialSerial(limit)
+        transport = _SerialTransport(ser)
+
+        def legacy():
+            total = 0
+            while total < len(command):
+                total += ser.write(command[total:])
+
+        def viewed():
+            transport.sendv([command])
+
+        mbps, kib = _measure(legacy if name == "slice remainder" else viewed, args.iterations, len(command))
+        rows.append((name, f"{mbps:.1f}", f"{kib:.1f}"))
+    _print_table(
+        f"partial writes, {len(command)} B command, {limit} B accepted per write",
+        ("impl", "MB/s", "peak KiB/cmd"),
+        rows,
+    )
+
+    # A pipelined burst of SequenceUpdates (21 B header + 256 B chunk) over a socket
+    rows = []
+    burst = [(os.urandom(21), os.urandom(256)) for _ in range(args.window)]
+    for name in ("sendall per command", "coalesced sendmsg"):
+        a, b = socket.socketpair()
+        reader = threading.Thread(target=_drain, args=(b,), daemon=True)
+        reader.start()
+        transport = _SocketTransport(a)
+        calls = 0
+        t0 = time.perf_counter()
+        for _ in range(args.iterations):
+            if name == "sendall per command":
+                for header, chunk in burst:
+                    transport.sendall(header + chunk)
+                    calls += 1
+            else:
+                calls += transport.sendv([buf for part in burst for buf in part])
+        dt = time.perf_counter() - t0
+        a.close()
+        reader.join()
+        b.close()
+        nbytes = sum(len(h) + len(c) for h, c in burst) * args.iterations
+        rows.append((name, calls, f"{nbytes / calls:.0f}", f"{nbytes / dt / 1e6:.1f}"))
+    _print_table(
+        f"{args.window} pipelined SequenceUpdates per burst",
+        ("impl", "syscalls", "B/syscall", "MB/s"),
+        rows,
+    )
+
+
+# ---- wake: last response byte -> waiting caller, many connections at once ----
+def _responder(conn, size: int):
+    """Answer every 10 B request with READY + a `size` B response"""
+    rsp = bytes([DILITHIUM_READY_BYTE]) + os.urandom(size)
+    try:
+        while conn.recv(10):
+            conn.sendall(rsp)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+def bench_wake(args):
+    from uart import UARTConnection
+
+    size = RESPONSE_SIZES["sig-L2"]
+    srv = socket.socket()
+    srv.bind(("127.0.0.1", 0))
+    srv.listen()
+    port = srv.getsockname()[1]
+
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = srv.accept()
+            except OSError:
+                return
+            threading.Thread(target=_responder, args=(conn, size), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    uarts = [
+        UARTConnection(mode="tcp", tcp_host="127.0.0.1", tcp_port=port, debug=False)
+        for _ in range(args.connections)
+    ]
+
+    def client(uart):
+        for _ in range(args.iterations):
+            uart.send_bytes(b"\0" * 10)
+            uart.wait_for_ready(timeout=5)
+            uart.wait_for_bytes(size, timeout=5)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(u,)) for u in uarts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    dt = time.perf_counter() - t0
+
+    merged = LatencyHistogram()
+    for u in uarts:
+        merged.merge(u.wake_latency)
+        u.close()
+    srv.close()
+    s = merged.summary(scale=1e3)
+    rows = [(k, f"{v:.1f}" if k != "count" else v) for k, v in s.items()]
+    rows.append(("round trips/s", f"{args.iterations * len(uarts) / dt:.0f}"))
+    _print_table(
+        f"wake latency (us), {len(uarts)} connections, {size} B responses",
+        ("stat", "value"),
+        rows,
+    )
+
+
+# ---- marshal: hex-string command building vs struct.pack_into ----
+SIGNATURE_SIZES = {"L2": 2420, "L3": 3293, "L5": 4595}
+
+
+def _hex_sequence_update(seq_handle: int, chunk: bytes) -> bytes:
+    """The previous TPMClient SequenceUpdate builder"""
+    tag = "80 02"
+    cc = u32_be_hex(TPM_CC_SequenceUpdate)
+    handle_hex = u32_be_hex(seq_handle)
+    auth_entry = "40000009" + "0000" + "00" + "0000"
+    auth_area_size_hex = u32_be_hex(len(bytes.fromhex(auth_entry)))
+    buf_hex = u16_be_hex(len(chunk)) + bytes_hex(chunk)
+    size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry)) + 2 + len(chunk)
+    size_hex = u32_be_hex(size_bytes)
+    return bytes.fromhex(f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}{buf_hex}")
+
+
+def _hex_hashverify_start(key_handle: int, total_len: int, signature: bytes) -> bytes:
+    """The previous TPMClient HashVerifyStart builder"""
+    tag = "80 01"
+    cc = u32_be_hex(TPM_CC_HashVerifyStart)
+    handle_hex = u32_be_hex(key_handle)
+    total_hex = u32_be_hex(int(total_len))
+    sig_param_hex = build_dilithium_signature_param(signature)
+    size_bytes = 10 + 4 + 4 + len(bytes.fromhex(sig_param_hex))
+    size_hex = u32_be_hex(size_bytes)
+    return bytes.fromhex(f"{tag}{size_hex}{cc}{handle_hex}{total_hex}{sig_param_hex}")
+
+
+def bench_marshal(args):
+    m = CommandBuilder()
+
+    def packed_sequence_update(chunk, inline):
+        m.begin(TPM_ST_SESSIONS, TPM_CC_SequenceUpdate)
+        m.handle(0x80000001)
+        m.pw_auth()
+        if inline:
+            m.tpm2b(chunk)
+            return m.finish()
+        m.tpm2b_size(len(chunk))
+        return m.finish(len(chunk))
+
+    def packed_hashverify_start(sig, inline):
+        m.begin(TPM_ST_NO_SESSIONS, TPM_CC_HashVerifyStart)
+        m.handle(0x80000000)
+        m.u32(1024)
+        m.dilithium_signature_prefix(len(sig))
+        if inline:
+            m.raw(sig)
+        return m.finish(0 if inline else len(sig))
+
+    seq_template = command_template("SequenceUpdate")
+    cases = []
+    for n in (256, 512, 1024):
+        chunk = os.urandom(n)
+        cases.append(
+            (
+                f"SequenceUpdate {n} B",
+                lambda c=chunk: _hex_sequence_update(0x80000001, c),
+                lambda c=chunk: packed_sequence_update(c, True),
+                [
+                    ("pack_into header", lambda c=chunk: packed_sequence_update(c, False)),
+                    ("template header", lambda c=chunk: seq_template.render(0x80000001, payload_len=len(c))),
+                    ("schema encoder", lambda c=chunk: encode_SequenceUpdate(m, 0x80000001, c)),
+                ],
+            )
+        )
+    for level, n in SIGNATURE_SIZES.items():
+        sig = os.urandom(n)
+        cases.append(
+            (
+                f"HashVerifyStart {level}",
+                lambda s=sig: _hex_hashverify_start(0x80000000, 1024, s),
+                lambda s=sig: packed_hashverify_start(s, True),
+                [
+                    ("pack_into header", lambda s=sig: packed_hashverify_start(s, False)),
+                    (
+                        "schema encoder",
+                        lambda s=sig: encode_HashVerifyStart(
+                            m, 0x80000000, 1024, TPMTSignature(TPM_ALG_DILITHIUM, TPM_ALG_NULL, s)
+                        ),
+                    ),
+                ],
+            )
+        )
+
+    rows = []
+    for label, hex_fn, packed_fn, header_fns in cases:
+        assert hex_fn() == packed_fn()
+        for name, fn in [("hex", hex_fn), ("pack_into", packed_fn)] + header_fns:
+            fn()
+            t0 = time.perf_counter_ns()
+            for _ in range(args.iterations):
+                fn()
+            ns = (time.perf_counter_ns() - t0) / args.iterations
+            _, kib = _measure(fn, 1, 1)
+            rows.append((label, name, f"{ns / 1000:.2f}", f"{kib:.1f}"))
+    _print_table(
+        "per-command build cost",
+        ("command", "impl", "us/cmd", "peak KiB/cmd"),
+        rows,
+    )
+
+
+# ---- decode: slice + int.from_bytes parsing vs memoryview/unpack_from decoder ----
+PUBLIC_KEY_SIZES = {"L2": 1312, "L3": 1952, "L5": 2592}
+
+
+def _legacy_signature(rsp: bytes) -> bytes:
+    """The previous hashsign_finish_cmd parsing"""
+    off = sessions_param_offset(rsp, response_handle_count=0)
+    _ = int.from_bytes(rsp[off : off + 2], "big"); off += 2
+    _ = int.from_bytes(rsp[off : off + 2], "big"); off += 2
+    sig_len = int.from_bytes(rsp[off : off + 2], "big"); off += 2
+    return rsp[off : off + sig_len]
+
+
+def _legacy_outpublic(rsp: bytes) -> bytes:
+    """The previous parse_createprimary_outpublic, Dilithium branch"""
+    off = sessions_param_offset(rsp, response_handle_count=1)
+    _ = int.from_bytes(rsp[off : off + 2], "big")
+    off += 2
+    p = off
+    _ = int.from_bytes(rsp[p : p + 2], "big"); p += 2
+    _ = int.from_bytes(rsp[p : p + 2], "big"); p += 2
+    _ = int.from_bytes(rsp[p : p + 4], "big"); p += 4
+    ap_size = int.from_bytes(rsp[p : p + 2], "big"); p += 2
+    p += ap_size + 2 + 2 + 1
+    u_size = int.from_bytes(rsp[p : p + 2], "big"); p += 2
+    return rsp[p : p + u_size]
+
+
+def _response(params: bytes, handles: int = 0) -> bytes:
+    body = b"\x80\x00\x00\x01" * handles + len(params).to_bytes(4, "big") + params
+    return b"\x80\x02" + (10 + len(body)).to_bytes(4, "big") + b"\x00" * 4 + body
+
+
+def bench_decode(args):
+    rows = []
+    for level in SIGNATURE_SIZES:
+        sig = os.urandom(SIGNATURE_SIZES[level])
+        sig_rsp = bytearray(_response(b"\x00\x72\x00\x10" + len(sig).to_bytes(2, "big") + sig))
+        pk = os.urandom(PUBLIC_KEY_SIZES[level])
+        public = b"\x00\x72\x00\x0b\x00\x04\x04\x72\x00\x00\x00\x10\x00\x10\x02" + len(pk).to_bytes(2, "big") + pk
+        pub_rsp = bytearray(_response(len(public).to_bytes(2, "big") + public + b"\x00" * 40, handles=1))
+        assert _legacy_signature(sig_rsp) == decode_hashsign_finish(sig_rsp).signature == sig
+        assert _legacy_outpublic(pub_rsp) == decode_createprimary_outpublic(pub_rsp).unique == pk
+
+        impls = (
+            ("HashSignFinish", "slice+from_bytes", lambda: _legacy_signature(sig_rsp), len(sig_rsp)),
+            ("HashSignFinish", "decoder (view)", lambda: decode_hashsign_finish(sig_rsp).signature, len(sig_rsp)),
+            ("HashSignFinish", "decoder + bytes()", lambda: bytes(decode_hashsign_finish(sig_rsp).signature), len(sig_rsp)),
+            ("CreatePrimary", "slice+from_bytes", lambda: _legacy_outpublic(pub_rsp), len(pub_rsp)),
+            ("CreatePrimary", "decoder (view)", lambda: decode_createprimary_outpublic(pub_rsp).unique, len(pub_rsp)),
+        )
+        for command, name, fn, size in impls:
+            fn()
+            t0 = time.perf_counter_ns()
+            for _ in range(args.iterations):
+                fn()
+            ns = (time.perf_counter_ns() - t0) / args.iterations
+            _, kib = _measure(fn, 1, size)
+            rows.append((f"{command} {level}", name, f"{ns / 1000:.2f}", f"{kib:.2f}"))
+    _print_table(
+        "response decode cost",
+        ("response", "impl", "us/rsp", "peak KiB/rsp"),
+        rows,
+    )
+
+
+BENCHMARKS = {
+    "rx": bench_rx,
+    "log": bench_log,
+    "tx": bench_tx,
+    "wake": bench_wake,
+    "marshal": bench_marshal,
+    "decode": bench_decode,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Host-side micro-benchmarks")
+    parser.add_argument("bench", choices=sorted(BENCHMARKS), help="Benchmark to run")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument(
+        "--read-size",
+        type=int,
+        default=64,
+        help="Bytes per simulated transport read (default: 64, as in _read_worker)",
+    )
+    parser.add_argument("--window", type=int, default=4, help="Commands per pipelined burst (tx)")
+    parser.add_argument("--connections", type=int, default=8, help="Concurrent UART connections (wake)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    BENCHMARKS[args.bench](args)
+
+
+if __name__ == "__main__":
+    main()
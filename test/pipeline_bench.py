@@ -0,0 +1,131 @@
+"""Multi-chunk HashSign throughput vs. number of SequenceUpdates in flight and chunk size.
+
+By default runs against an in-process tpm_standin with UART pacing and per-command
+latency, so the overlap between command transfer and execution is visible:
+
+    python pipeline_bench.py --windows 1 2 4 --msg-size 16384 --baud 115200
+    python pipeline_bench.py --windows 1 2 --chunk-sizes 256 512 auto
+
+"auto" is the size TPMClient picks from the TPM's GetCapability limits.
+
+Point it at the sim (or a board behind serial2tcp) with --tcp-port; windows there
+default to 1 2, since the firmware has TPM_RX_SLOTS (2) command slots and
+TPMClient rejects larger windows. The stand-in gets as many slots as the largest window.
+"""
+
+import os
+import time
+import argparse
+
+from uart import UARTConnection
+from tpm_client import TPMClient
+from tpm_standin import TPMStandIn
+from tpm_utils import TPM_RX_SLOTS
+
+
+def _run_window(host: str, port: int, window: int, rx_slots: int, message: bytes, chunk_size: int | None) -> tuple:
+    """Fresh connection: Startup, CreatePrimary, then time one full HashSign.
+
+    Returns (seconds, chunk size used); chunk_size None asks the TPM.
+    """
+    uart = UARTConnection(mode="tcp", tcp_host=host, tcp_port=port, debug=False)
+    try:
+        client = TPMClient(uart, window=window, rx_slots=rx_slots, verbose=False)
+        uart.wait_for_ready(timeout=180)
+        client.startup_cmd("CLEAR")
+        rsp = client.create_primary_dilithium_cmd()
+        key_handle = client.extract_first_handle_from_response(rsp)
+        chunk_size = chunk_size or client.sequence_chunk_size()
+        t0 = time.perf_counter()
+        seq = client.hashsign_start_cmd(key_handle, len(message), key_pw=b"abcd")
+        client.sequence_update_stream(seq, message, chunk_size=chunk_size)
+        client.hashsign_finish_cmd(seq)
+        return time.perf_counter() - t0, chunk_size
+    finally:
+        uart.close()
+
+
+def _chunk_arg(value: str) -> int | None:
+    return None if value == "auto" else int(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HashSign throughput with pipelined SequenceUpdate")
+    parser.add_argument(
+        "--windows",
+        type=int,
+        nargs="+",
+        default=None,
+        help=f"SequenceUpdates in flight (default: 1 2 4, or up to TPM_RX_SLOTS={TPM_RX_SLOTS} with --tcp-port)",
+    )
+    parser.add_argument("--msg-size", type=int, default=16 * 1024)
+    parser.add_argument(
+        "--chunk-sizes",
+        "--chunk-size",
+        type=_chunk_arg,
+        nargs="+",
+        default=[256, None],
+        help='SequenceUpdate payload sizes to compare; "auto" asks the TPM (default: 256 auto)',
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per window (best is reported)")
+    parser.add_argument("--tcp-host", default="localhost")
+    parser.add_argument("--tcp-port", type=int, default=None, help="Use a running sim/stand-in instead")
+    stand_in = parser.add_argument_group("in-process stand-in")
+    stand_in.add_argument("--baud", type=int, default=115200)
+    stand_in.add_argument(
+        "--update-ms", type=float, default=5.0, help="SequenceUpdate processing time"
+    )
+    stand_in.add_argument("--finish-ms", type=float, default=50.0, help="HashSignFinish processing time")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = None
+    host, port = args.tcp_host, args.tcp_port
+    if args.windows is None:
+        args.windows = [1, 2, 4] if port is None else list(range(1, TPM_RX_SLOTS + 1))
+    rx_slots = TPM_RX_SLOTS
+    if port is None:
+        server = TPMStandIn(
+            port=0,
+            latency={"SequenceUpdate": args.update_ms, "HashSignFinish": args.finish_ms},
+            baud=args.baud,
+            rx_slots=max(args.windows),
+        ).start()
+        host, port = server.host, server.port
+        rx_slots = server.rx_slots
+        print(
+            f"stand-in: {args.baud} baud, SequenceUpdate {args.update_ms} ms, "
+            f"{server.rx_slots} RX slots, crypto {server.backend.name}"
+        )
+
+    message = os.urandom(args.msg_size)
+    rows = []
+    try:
+        for chunk_size in args.chunk_sizes:
+            for window in args.windows:
+                runs = [_run_window(host, port, window, rx_slots, message, chunk_size) for _ in range(args.repeat)]
+                rows.append((min(runs)[1], window, min(runs)[0]))
+    finally:
+        if server is not None:
+            server.close()
+
+    base = rows[0][2]
+    print(f"\nHashSign of {args.msg_size} B")
+    print(
+        f"{'chunk':>6}  {'window':>6}  {'updates':>7}  {'total s':>8}  "
+        f"{'chunks/s':>9}  {'KiB/s':>8}  {'speedup':>7}"
+    )
+    for chunk_size, window, secs in rows:
+        chunks = (args.msg_size + chunk_size - 1) // chunk_size
+        print(
+            f"{chunk_size:>6}  {window:>6}  {chunks:>7}  {secs:>8.3f}  {chunks / secs:>9.1f}  "
+            f"{args.msg_size / 1024 / secs:>8.1f}  {base / secs:>6.2f}x"
+        )
+    if server is not None and server.commands_dropped:
+        print(f"WARNING: stand-in dropped {server.commands_dropped} command(s)")
+
+
+if __name__ == "__main__":
+    main()
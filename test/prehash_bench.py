@@ -0,0 +1,110 @@
+"""HashSign time vs. message size: streamed message vs. pre-hash (HashSignDigest).
+
+Streaming sends the whole message over the UART (HashSignStart, SequenceUpdates,
+HashSignFinish); pre-hash digests it on the host and sends one HashSignDigest with
+a PREHASH_DIGEST_SIZE digest. By default runs against an in-process tpm_standin
+with UART pacing and per-command latency:
+
+    python prehash_bench.py --sizes 64 1024 16384 65536 --baud 115200
+
+The crossover is the smallest size at which pre-hash wins; TPMClient.sign_many()
+switches to pre-hash at PREHASH_THRESHOLD bytes (or TPMClient(prehash_threshold=...)).
+Point it at the sim (or a board behind serial2tcp) with --tcp-port.
+"""
+
+import os
+import time
+import argparse
+
+from uart import UARTConnection
+from tpm_client import TPMClient, PREHASH_THRESHOLD
+from tpm_standin import TPMStandIn
+from tpm_utils import TPM_RX_SLOTS
+
+
+def _best(fn, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return min(runs)
+
+
+def _run_sizes(host: str, port: int, sizes: list, repeat: int, window: int, rx_slots: int) -> list:
+    """One connection and key; [(size, stream s, pre-hash s)] per message size"""
+    uart = UARTConnection(mode="tcp", tcp_host=host, tcp_port=port, debug=False)
+    try:
+        client = TPMClient(uart, window=window, rx_slots=rx_slots, verbose=False)
+        uart.wait_for_ready(timeout=180)
+        client.startup_cmd("CLEAR")
+        key_handle = client.dilithium_key()
+        rows = []
+        for size in sizes:
+            message = os.urandom(size)
+            stream = _best(lambda: client.sign_file(message, key_handle), repeat)
+            prehash = _best(lambda: client.sign_file(message, key_handle, prehash=True), repeat)
+            rows.append((size, stream, prehash))
+        return rows
+    finally:
+        uart.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Streamed vs. pre-hash HashSign by message size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256, 1024, 4096, 16384, 65536])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size and mode (best is reported)")
+    parser.add_argument("--window", type=int, default=2, help="SequenceUpdates in flight when streaming")
+    parser.add_argument("--tcp-host", default="localhost")
+    parser.add_argument("--tcp-port", type=int, default=None, help="Use a running sim/stand-in instead")
+    stand_in = parser.add_argument_group("in-process stand-in")
+    stand_in.add_argument("--baud", type=int, default=115200)
+    stand_in.add_argument("--update-ms", type=float, default=5.0, help="SequenceUpdate processing time")
+    stand_in.add_argument(
+        "--finish-ms", type=float, default=50.0, help="HashSignFinish / HashSignDigest processing time"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = None
+    host, port = args.tcp_host, args.tcp_port
+    if port is None:
+        server = TPMStandIn(
+            port=0,
+            latency={
+                "SequenceUpdate": args.update_ms,
+                "HashSignFinish": args.finish_ms,
+                "HashSignDigest": args.finish_ms,
+            },
+            baud=args.baud,
+            rx_slots=max(2, args.window),
+        ).start()
+        host, port = server.host, server.port
+        print(
+            f"stand-in: {args.baud} baud, SequenceUpdate {args.update_ms} ms, "
+            f"sign {args.finish_ms} ms, crypto {server.backend.name}"
+        )
+
+    try:
+        rx_slots = TPM_RX_SLOTS if server is None else server.rx_slots
+        rows = _run_sizes(host, port, sorted(args.sizes), args.repeat, args.window, rx_slots)
+    finally:
+        if server is not None:
+            server.close()
+
+    print(f"\n{'bytes':>8}  {'stream s':>9}  {'pre-hash s':>10}  {'speedup':>7}")
+    crossover = None
+    for size, stream, prehash in rows:
+        if crossover is None and prehash < stream:
+            crossover = size
+        print(f"{size:>8}  {stream:>9.3f}  {prehash:>10.3f}  {stream / prehash:>6.2f}x")
+    if crossover is None:
+        print("pre-hash never faster at these sizes")
+    else:
+        print(f"pre-hash faster from {crossover} B (sign_many threshold: {PREHASH_THRESHOLD} B)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""bench.run_bench against an in-process tpm_standin: JSON shape and latency percentiles.
+
+    python -m pytest -q test/test_bench.py
+"""
+
+import json
+
+import pytest
+
+import tpm_standin
+from bench import run_bench, PERCENTILES
+from tpm_standin import TPMStandIn
+from tpm_timing import PHASES
+from uart import UARTConnection
+
+LEVELS = [2, 5]
+SIZES = [32, 3000]
+REPEAT = 3
+
+
+@pytest.fixture
+def standin():
+    server = TPMStandIn(port=0, backend="fake").start()
+    try:
+        yield server
+    finally:
+        server.close()
+
+
+def _connect(server):
+    return lambda: UARTConnection(mode="tcp", tcp_host=server.host, tcp_port=server.port, debug=False)
+
+
+def _sweep(server, **kwargs):
+    return run_bench(
+        _connect(server),
+        levels=LEVELS,
+        sizes=SIZES,
+        repeat=REPEAT,
+        window=2,
+        target="stand-in",
+        rx_slots=server.rx_slots,
+        **kwargs,
+    )
+
+
+def _check_latency(latency: dict):
+    assert latency["count"] == REPEAT
+    ordered = [latency["min"]] + [latency[f"p{p}"] for p in PERCENTILES] + [latency["max"]]
+    assert ordered == sorted(ordered)
+    assert latency["min"] <= latency["mean"] <= latency["max"]
+
+
+def test_run_bench_results(standin):
+    results = json.loads(json.dumps(_sweep(standin, chunk_sizes=[None, 256], label="test")))
+    assert set(results) == {"meta", "results", "phases_ms", "device"}
+
+    meta = results["meta"]
+    assert meta["target"] == "stand-in"
+    assert meta["label"] == "test"
+    assert meta["repeat"] == REPEAT
+    assert meta["window"] == 2
+    assert meta["percentiles"] == list(PERCENTILES)
+
+    cases = results["results"]
+    # Startup, GetRandom, CreatePrimary, then HashSign/HashVerify per chunk size and message size
+    assert len(cases) == len(LEVELS) * (3 + 2 * 2 * len(SIZES))
+    for case in cases:
+        assert "error" not in case, case
+        assert case["level"] in LEVELS
+        if case["op"] == "Startup":
+            continue
+        _check_latency(case["latency_ms"])
+        assert case["ops_per_s"] > 0
+        if case["op"] in ("HashSign", "HashVerify"):
+            assert case["msg_size"] in SIZES
+            assert case["chunk_size"] in (256, 1024)
+            assert case["throughput_kib_s"] > 0
+    level_5_verifies = [c for c in cases if c["op"] == "HashVerify" and c["level"] == 5]
+    assert len(level_5_verifies) == 2 * len(SIZES)
+
+    for command in ("CreatePrimary(Dilithium)", "HashSignStart", "SequenceUpdate", "HashVerifyStart"):
+        phases = results["phases_ms"][command]
+        assert set(phases) == set(PHASES)
+        for summary in phases.values():
+            assert summary["p50"] <= summary["p90"] <= summary["p99"] <= summary["max"]
+
+    for level in LEVELS:
+        device = results["device"][str(level)]
+        assert device["clock_hz"] == tpm_standin.PERF_CLOCK_HZ
+        assert device["commands"]
+
+
+def test_run_bench_rejects_no_repeats(standin):
+    with pytest.raises(ValueError, match="repeat"):
+        run_bench(_connect(standin), levels=[2], sizes=[32], repeat=0)
+
+
+def test_hashverify_command_size_fails_sweep(standin, monkeypatch):
+    # A level 5 HashVerifyStart (4651 B) no longer fits the stand-in's command slot
+    monkeypatch.setattr(tpm_standin, "MAX_COMMAND_SIZE", 4096)
+    with pytest.raises(RuntimeError, match="0x00000142"):
+        _sweep(standin, chunk_sizes=[None])
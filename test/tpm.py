@@ -6,19 +6,41 @@ from uart import UARTConnection
 # TODO: Get rid of the "as" imports, thats horrible
 from tpm_utils import (
     TPM_ALG_ECC,
+    TPM_CAP_TPM_PROPERTIES,
+    TPM_PT_INPUT_BUFFER,
+    TPM_PT_MAX_COMMAND_SIZE,
+    DEFAULT_CHUNK_SIZE,
     TPM_ALG_DILITHIUM,
-    TPM_CC_HashSignStart,
-    TPM_CC_HashSignFinish,
-    TPM_CC_SequenceUpdate,
     TPM_CC_HashVerifyStart,
-    TPM_CC_HashVerifyFinish,
-    u32_be_hex as _u32_be_hex,
-    u16_be_hex as _u16_be_hex,
-    bytes_hex as _bytes_hex,
-    sessions_param_offset as _sessions_param_offset,
+    TPM_ALG_NULL,
+    TPM_ALG_SHA256,
+    TPM_RH_OWNER,
+    TPM_ST_NO_SESSIONS,
     parse_createprimary_outpublic as _parse_createprimary_outpublic,
     build_dilithium_signature_param as _build_dilithium_signature_param,
+    command_template,
+    max_sequence_chunk,
 )
+from tpm_marshal import CommandBuilder
+from tpm_schema import (
+    TPMSEccParms,
+    TPMSEccPoint,
+    TPMSSensitiveCreate,
+    TPMTPublic,
+    decode_hashsign_finish,
+    decode_hashverify_finish,
+    decode_response,
+    encode_CreatePrimary,
+    encode_GetCapability,
+    encode_GetRandom,
+    encode_HashSignStart,
+    encode_Startup,
+)
+
+_CREATE_PRIMARY_DILITHIUM = command_template("CreatePrimary(Dilithium)")
+_SEQUENCE_UPDATE = command_template("SequenceUpdate")
+_HASHSIGN_FINISH = command_template("HashSignFinish")
+_HASHVERIFY_FINISH = command_template("HashVerifyFinish")
 
 
 def _write_hex_file(path: str, data: bytes) -> None:
@@ -35,6 +57,8 @@ class TpmTester:
 
     def __init__(self, uart: UARTConnection):
         self.uart = uart
+        self._marshal = CommandBuilder()
+        self._chunk_size = None
 
     def wait_for_ready_signal(self):
         while not self.uart.wait_for_ready(timeout=180):
@@ -43,8 +67,11 @@ class TpmTester:
     def read_tpm_response(self, timeout):
         header = self.uart.wait_for_bytes(num_bytes=10, timeout=timeout)
         response_size = int.from_bytes(header[2:6], byteorder="big")
-        body = self.uart.wait_for_bytes(num_bytes=(response_size - 10), timeout=timeout)
-        return header + body
+        # Body goes straight from the UART ring into the response buffer
+        rsp = bytearray(response_size)
+        rsp[:10] = header
+        self.uart.readinto(memoryview(rsp)[10:], timeout=timeout)
+        return rsp
 
     def extract_first_handle_from_response(self, rsp: bytes) -> int:
         # After 10-byte header, a response-handle (if present) is 4 bytes big-endian.
@@ -59,16 +86,13 @@ class TpmTester:
     def startup_cmd(self, startup_type: str = "CLEAR"):
         # Map startup type to 2-byte parameter
         st = (startup_type or "").strip().upper()
-        if st in ("0", "CLEAR", ""):
-            su_val = "0000"
-        elif st in ("1", "STATE"):
-            su_val = "0001"
+        if st in ("1", "STATE"):
+            su_val = 0x0001  # TPM_SU_STATE
         else:
-            su_val = "0000"  # default CLEAR
+            su_val = 0x0000  # TPM_SU_CLEAR (default)
 
-        # Full command: TPM_ST_NO_SESSIONS (0x8001), size 0x000C, TPM_CC_Startup (0x00000144), TPM_SU (2 bytes)
-        bytestring = f"80010000000C00000144{su_val}"
-        bytestream = bytes.fromhex(bytestring)
+        # Full command: TPM_ST_NO_SESSIONS, size 12, TPM_CC_Startup, TPM_SU (2 bytes)
+        bytestream = encode_Startup(self._marshal, su_val)
         print("Sending startup command...")
         self.uart.send_bytes(bytestream)
 
@@ -84,8 +108,7 @@ class TpmTester:
     def get_random_cmd(self, num_bytes: int = 32):
         # Replace fixed length with user choice
         num_bytes = max(1, min(0xFFFF, int(num_bytes)))
-        bytestring = f"80010000000C0000017B{num_bytes:04X}"
-        bytestream = bytes.fromhex(bytestring.replace(" ", ""))
+        bytestream = encode_GetRandom(self._marshal, num_bytes)  # bytesRequested
         print(f"Sending get_random_bytes({num_bytes}) command...")
         self.uart.send_bytes(bytestream)
 
@@ -98,38 +121,57 @@ class TpmTester:
         print("get_random_bytes() response:\n", " ".join(f"{b:02X}" for b in result))
         return result
 
+    def get_capability_cmd(self, capability: int, prop: int, count: int):
+        bytestream = encode_GetCapability(self._marshal, capability, prop, count)
+        print(f"Sending GetCapability(0x{capability:X}, 0x{prop:X}, {count}) command...")
+        self.uart.send_bytes(bytestream)
+
+        print("Waiting for GetCapability answer...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+
+        if not result:
+            raise RuntimeError("Failed to get GetCapability() answer, aborting")
+        print("GetCapability() response:\n", " ".join(f"{b:02X}" for b in result))
+        rc = int.from_bytes(result[6:10], "big")
+        if rc != 0:
+            raise RuntimeError(f"GetCapability failed rc=0x{rc:08X}")
+        return decode_response("GetCapability", result)
+
+    def sequence_chunk_size(self) -> int:
+        # Largest SequenceUpdate chunk the TPM and the firmware's RX slot accept,
+        # asked once per connection
+        if self._chunk_size is None:
+            try:
+                rsp = self.get_capability_cmd(
+                    TPM_CAP_TPM_PROPERTIES,
+                    TPM_PT_INPUT_BUFFER,
+                    TPM_PT_MAX_COMMAND_SIZE - TPM_PT_INPUT_BUFFER + 1,
+                )
+                props = {p.property: p.value for p in rsp.capability_data.data}
+                self._chunk_size = max_sequence_chunk(
+                    props[TPM_PT_INPUT_BUFFER], props[TPM_PT_MAX_COMMAND_SIZE]
+                )
+            except (RuntimeError, KeyError) as e:
+                print(f"TPM limits unavailable ({e}), using {DEFAULT_CHUNK_SIZE} B chunks")
+                self._chunk_size = DEFAULT_CHUNK_SIZE
+            print(f"SequenceUpdate chunk size: {self._chunk_size} B")
+        return self._chunk_size
+
     def create_primary_cmd(self):
-        bytestring = (
-            # =========== Header ===========
-            "80 02"  # ST_SESSIONS
-            "00 00 00 45"  # Command size
-            "00 00 01 31"  # CreatePrimary
-            # =========== Handle ===========
-            "40 00 00 01"  # Owner handle
-            # =========== AuthArea ===========
-            "00 00 00 09"  # Size of authArea
-            "40 00 00 09"  # TPM_RS_PW -> use password
-            "00 00 00 00 00"  # all zeroes
-            # =========== inSensitive ===========
-            "00 08"  # Size of sensitive area
-            "00 04"  # Size of password
-            "61 62 63 64"  # Password
-            "00 00"  # Sensitive data
-            # =========== inPublic ===========
-            "00 18"  # Size of inPublic
-            "00 23"  # TPM_ALG_ECC
-            "00 0B"  # TPM_ALG_SHA256 for deriving name
-            "00 04 04 72"  # objectAttributes TODO: revise
-            "00 00"  # authPolicy TODO: revise
-            "00 10  00 18 00 0B  00 03  00 10"  # TPMS_ECC_PARMS
-            "00 00  00 00"  # unique TODO: revise
-            # outsideInfo
-            "00 00"
-            # creationPCR
-            "00 00 00 00"
+        public = TPMTPublic(
+            TPM_ALG_ECC,
+            TPM_ALG_SHA256,  # for deriving name
+            0x00040472,  # objectAttributes TODO: revise
+            b"",  # authPolicy TODO: revise
+            # symmetric NULL, scheme ECDSA/SHA256, curve NIST P-256, kdf NULL
+            TPMSEccParms(TPM_ALG_NULL, 0x0018, TPM_ALG_SHA256, 0x0003, TPM_ALG_NULL),
+            TPMSEccPoint(b"", b""),  # unique TODO: revise
+        )
+        # Owner handle with empty owner auth, password "abcd", no outsideInfo/creationPCR
+        bytestream = encode_CreatePrimary(
+            self._marshal, TPM_RH_OWNER, TPMSSensitiveCreate(b"abcd", b""), public, b"", []
         )
-
-        bytestream = bytes.fromhex(bytestring.replace(" ", ""))
         print("Sending create_primary() command...")
         self.uart.send_bytes(bytestream)
 
@@ -163,43 +205,8 @@ class TpmTester:
         return result
 
     def create_primary_dilithium_cmd(self):
-        # TPM2_CreatePrimary with Dilithium L2
-        bytestring = (
-            # ===== Header =====
-            "80 02"  # TPM_ST_SESSIONS
-            "00 00 00 3E"  # command size = 62 bytes
-            "00 00 01 31"  # TPM_CC_CreatePrimary
-            # ===== Handle =====
-            "40 00 00 01"  # TPM_RH_OWNER
-            # ===== AuthArea =====
-            "00 00 00 09"  # authArea size = 9
-            "40 00 00 09"  # TPM_RS_PW
-            "00 00"  # nonce size = 0
-            "00"  # session attributes
-            "00 00"  # hmac size = 0 (empty owner auth)
-            # ===== inSensitive (TPM2B_SENSITIVE_CREATE) =====
-            "00 08"  # total size = 8
-            "00 04"  # userAuth size = 4
-            "61 62 63 64"  # "abcd"
-            "00 00"  # sensitive.data size = 0
-            # ===== inPublic (TPM2B_PUBLIC) =====
-            "00 11"  # TPMT_PUBLIC size = 17
-            "00 72"  # type = TPM_ALG_DILITHIUM (0x0072)
-            "00 0B"  # nameAlg = TPM_ALG_SHA256 (0x000B)
-            "00 04 04 72"  # objectAttributes = 0x00040472
-            "00 00"  # authPolicy size = 0
-            # ----- TPMS_DILITHIUM_PARMS -----
-            "00 10"  # parameters.symmetric.algorithm = TPM_ALG_NULL
-            "00 10"  # parameters.scheme.scheme = TPM_ALG_NULL
-            "02"  # securityLevel = 2
-            # ----- unique -----
-            "00 00"  # unique (TPM2B) size = 0
-            # ===== outsideInfo =====
-            "00 00"
-            # ===== creationPCR =====
-            "00 00 00 00"
-        )
-        bytestream = bytes.fromhex(bytestring.replace(" ", ""))
+        # TPM2_CreatePrimary with Dilithium L2, userAuth "abcd"
+        bytestream = _CREATE_PRIMARY_DILITHIUM.render()
         print("Sending create_primary_dilithium() command...")
         self.uart.send_bytes(bytestream)
 
@@ -232,34 +239,9 @@ class TpmTester:
         self, key_handle: int, total_len: int, key_pw: bytes = b"abcd"
     ) -> int:
         # Build TPM2_HashSignStart request with one RS_PW auth for the key
-        tag = "80 02"  # TPM_ST_SESSIONS
-        cc = _u32_be_hex(TPM_CC_HashSignStart)
-        # Handle area: key handle
-        handle_hex = _u32_be_hex(key_handle)
-        # Auth area: one TPMS_AUTH_COMMAND (RS_PW)
-        # sessionHandle (RS_PW), nonce(0), sessionAttributes(0), hmac = key_pw
-        auth_entry = "40000009"  # TPM_RS_PW
-        auth_entry += "0000"  # nonce size = 0
-        auth_entry += "00"  # session attributes
-        auth_entry += _u16_be_hex(len(key_pw))  # hmac size
-        auth_entry += _bytes_hex(key_pw)  # hmac bytes
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-        # Parameters: totalLen (UINT32)
-        params_hex = _u32_be_hex(int(total_len))
-        # Compute command size
-        # header(10) + handle(4) + authSize(4) + authEntry + params(4)
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry)) + 4
-        size_hex = _u32_be_hex(size_bytes)
-        bytestring = (
-            f"{tag}"
-            f"{size_hex}"
-            f"{cc}"
-            f"{handle_hex}"
-            f"{auth_area_size_hex}"
-            f"{auth_entry}"
-            f"{params_hex}"
-        )
-        bytestream = bytes.fromhex(bytestring)
+        # Handle: key handle; auth: one TPMS_AUTH_COMMAND (RS_PW, hmac = key_pw);
+        # parameters: totalLen (UINT32)
+        bytestream = encode_HashSignStart(self._marshal, key_handle, int(total_len), auth=key_pw)
         print(f"Sending HashSignStart(total_len={total_len})...")
         self.uart.send_bytes(bytestream)
 
@@ -281,31 +263,12 @@ class TpmTester:
 
     def sequence_update_cmd(self, seq_handle: int, chunk: bytes) -> None:
         # TPM2_SequenceUpdate: ST_SESSIONS, 1 in-handle (sequence), auth for the handle, TPM2B_MAX_BUFFER
-        tag = "80 02"  # TPM_ST_SESSIONS
-        cc = _u32_be_hex(TPM_CC_SequenceUpdate)
-        handle_hex = _u32_be_hex(seq_handle)
-
-        # RS_PW auth for the sequence handle (empty auth value set by start)
-        auth_entry = "40000009"  # TPM_RS_PW
-        auth_entry += "0000"  # nonce size = 0
-        auth_entry += "00"  # session attributes
-        auth_entry += "0000"  # hmac size = 0
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-
-        # TPM2B_MAX_BUFFER
-        buf_hex = _u16_be_hex(len(chunk)) + _bytes_hex(chunk)
-
-        # header(10) + handle(4) + authSize(4) + authEntry + buffer(2+N)
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry)) + 2 + len(chunk)
-        size_hex = _u32_be_hex(size_bytes)
-
-        hex_cmd = (
-            f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}{buf_hex}"
-        )
-        bytestream = bytes.fromhex(hex_cmd)
+        # Sequence handle, RS_PW auth (empty auth value set by start) and the
+        # TPM2B_MAX_BUFFER size; the chunk itself is sent without copying
+        header = _SEQUENCE_UPDATE.render(seq_handle, payload_len=len(chunk))
 
         print(f"Sending SequenceUpdate command...")
-        self.uart.send_bytes(bytestream)
+        self.uart.send_bytes(header, chunk)
         print(f"Waiting for SequenceUpdate answer...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
@@ -320,15 +283,7 @@ class TpmTester:
 
     def hashsign_finish_cmd(self, seq_handle: int) -> bytes:
         # TPM2_HashSignFinish: ST_SESSIONS, 1 in-handle (sequence), auth for the handle, no params
-        tag = "80 02"
-        cc = _u32_be_hex(TPM_CC_HashSignFinish)
-        handle_hex = _u32_be_hex(seq_handle)
-        auth_entry = "40000009" + "0000" + "00" + "0000"
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry))
-        size_hex = _u32_be_hex(size_bytes)
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}"
-        bytestream = bytes.fromhex(bytestring)
+        bytestream = _HASHSIGN_FINISH.render(seq_handle)
 
         print("Sending HashSignFinish...")
         self.uart.send_bytes(bytestream)
@@ -344,41 +299,26 @@ class TpmTester:
         if rc != 0:
             raise RuntimeError(f"HashSignFinish failed rc=0x{rc:08X}")
 
-        # Skip parameterSize for ST_SESSIONS responses
-        off = _sessions_param_offset(result, response_handle_count=0)
-
-        # TPMT_SIGNATURE
-        sigAlg = int.from_bytes(result[off : off + 2], "big")
-        off += 2
-        hashAlg = int.from_bytes(result[off : off + 2], "big")
-        off += 2
-        sig_len = int.from_bytes(result[off : off + 2], "big")
-        off += 2
-        sig_bytes = result[off : off + sig_len]
+        # TPMT_SIGNATURE (after parameterSize for ST_SESSIONS responses)
+        sig = decode_hashsign_finish(result)
+        sig_bytes = bytes(sig.signature)
 
         print(
-            f"HashSignFinish OK: sigAlg=0x{sigAlg:04X}, hashAlg=0x{hashAlg:04X}, sig_len={sig_len}"
+            f"HashSignFinish OK: sigAlg=0x{sig.sig_alg:04X}, hashAlg=0x{sig.hash_alg:04X}, sig_len={len(sig_bytes)}"
         )
         return sig_bytes
     
     def hashverify_start_cmd(self, key_handle: int, total_len: int, signature: bytes) -> int:
         # No authorization required (public key); use ST_NO_SESSIONS
-        tag = "80 01"  # TPM_ST_NO_SESSIONS
-        cc = _u32_be_hex(TPM_CC_HashVerifyStart)
-
-        handle_hex = _u32_be_hex(key_handle)
-        total_hex = _u32_be_hex(int(total_len))
-        sig_param_hex = self.build_dilithium_signature_param(signature)
-
-        # header(10) + handle(4) + params(totalLen 4 + TPMT_SIGNATURE)
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(sig_param_hex))
-        size_hex = _u32_be_hex(size_bytes)
-
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{total_hex}{sig_param_hex}"
-        bytestream = bytes.fromhex(bytestring)
+        m = self._marshal.begin(TPM_ST_NO_SESSIONS, TPM_CC_HashVerifyStart)
+        m.handle(key_handle)
+        m.u32(int(total_len))
+        # TPMT_SIGNATURE: sigAlg, hash and TPM2B size here, signature bytes sent as-is
+        m.dilithium_signature_prefix(len(signature))
+        header = m.finish(len(signature))
 
         print(f"Sending HashVerifyStart(total_len={total_len})...")
-        self.uart.send_bytes(bytestream)
+        self.uart.send_bytes(header, signature)
         print(f"Waiting for HashVerifyStart answer...")
         self.wait_for_ready_signal()
         rsp = self.read_tpm_response(timeout=3600)
@@ -396,19 +336,8 @@ class TpmTester:
 
     def hashverify_finish_cmd(self, seq_handle: int):
         # Mirror HashSignFinish (use ST_SESSIONS with empty RS_PW on the sequence)
-        tag = "80 02"  # TPM_ST_SESSIONS
-        cc = _u32_be_hex(TPM_CC_HashVerifyFinish)
-        handle_hex = _u32_be_hex(seq_handle)
-
-        # RS_PW auth with empty HMAC
-        auth_entry = "40000009" + "0000" + "00" + "0000"
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry))
-        size_hex = _u32_be_hex(size_bytes)
-
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}"
-        bytestream = bytes.fromhex(bytestring)
+        # Sequence handle, RS_PW auth with empty HMAC
+        bytestream = _HASHVERIFY_FINISH.render(seq_handle)
 
         print("Sending HashVerifyFinish...")
         self.uart.send_bytes(bytestream)
@@ -424,18 +353,22 @@ class TpmTester:
             raise RuntimeError(f"HashVerifyFinish failed rc=0x{rc:08X}")
 
         # Parse TPMT_TK_VERIFIED from response parameters
-        off = _sessions_param_offset(rsp, response_handle_count=0)
-        tag_val = int.from_bytes(rsp[off : off + 2], "big"); off += 2
-        hierarchy = int.from_bytes(rsp[off : off + 4], "big"); off += 4
-        dsz = int.from_bytes(rsp[off : off + 2], "big"); off += 2
-        digest = rsp[off : off + dsz]
+        ticket = decode_hashverify_finish(rsp)
 
         print(
-            f"HashVerifyFinish OK: ticket.tag=0x{tag_val:04X}, hierarchy=0x{hierarchy:08X}, digestLen={dsz}"
+            f"HashVerifyFinish OK: ticket.tag=0x{ticket.tag:04X}, hierarchy=0x{ticket.hierarchy:08X}, "
+            f"digestLen={len(ticket.digest)}"
         )
-        return (tag_val, hierarchy, digest)
+        return ticket
+
+    def _stream_message(self, seq_handle: int, message, chunk_size: int | None) -> None:
+        # memoryview slices, so no chunk is copied on the way to the UART
+        chunk_size = chunk_size or self.sequence_chunk_size()
+        view = memoryview(message)
+        for off in range(0, len(view), chunk_size):
+            self.sequence_update_cmd(seq_handle, view[off : off + chunk_size])
 
-    def run_hashsign_flow(self, message: bytes, chunk_size: int = 256) -> bytes:
+    def run_hashsign_flow(self, message: bytes, chunk_size: int | None = None) -> bytes:
         print("Running HashSignFlow...")
         resp = self.create_primary_dilithium_cmd()
         key_handle = self.extract_first_handle_from_response(resp)
@@ -450,19 +383,14 @@ class TpmTester:
         print(f"Message ({len(message)} bytes): {message.hex().upper()}")
         _write_hex_file(f"hashsign_msg_{ts}.hex", message)
 
-        sent = 0
-        while sent < len(message):
-            chunk = message[sent : sent + chunk_size]
-            self.sequence_update_cmd(seq, chunk)
-            sent += len(chunk)
-        assert sent == len(message)
+        self._stream_message(seq, message, chunk_size)
 
         sig = self.hashsign_finish_cmd(seq)
         print(f"Signature ({len(sig)} bytes): {sig.hex().upper()}")
         _write_hex_file(f"hashsign_sig_{ts}.hex", sig)
         return sig
     
-    def run_dilithium_flow(self, message: bytes, chunk_size: int = 256) -> bool:
+    def run_dilithium_flow(self, message: bytes, chunk_size: int | None = None) -> bool:
         print("Running HashSign + HashVerify flow...")
         resp = self.create_primary_dilithium_cmd()
         key_handle = self.extract_first_handle_from_response(resp)
@@ -476,11 +404,7 @@ class TpmTester:
         print(f"Message ({len(message)} bytes): {message.hex().upper()}")
         _write_hex_file(f"hashsign_msg_{ts}.hex", message)
 
-        sent = 0
-        while sent < len(message):
-            chunk = message[sent : sent + chunk_size]
-            self.sequence_update_cmd(seq_sign, chunk)
-            sent += len(chunk)
+        self._stream_message(seq_sign, message, chunk_size)
         sig = self.hashsign_finish_cmd(seq_sign)
         print(f"Signature ({len(sig)} bytes): {sig.hex().upper()}")
         _write_hex_file(f"hashsign_sig_{ts}.hex", sig)
@@ -489,11 +413,7 @@ class TpmTester:
         seq_verify = self.hashverify_start_cmd(
             key_handle=key_handle, total_len=len(message), signature=sig
         )
-        sent = 0
-        while sent < len(message):
-            chunk = message[sent : sent + chunk_size]
-            self.sequence_update_cmd(seq_verify, chunk)
-            sent += len(chunk)
+        self._stream_message(seq_verify, message, chunk_size)
         ticket = self.hashverify_finish_cmd(seq_verify)
         _write_hex_file(f"hashverify_ticket_{ts}.hex", ticket[2])
         print("Verify succeeded and ticket stored.")
@@ -504,7 +424,7 @@ class TpmTester:
         self.wait_for_ready_signal()
         self.startup_cmd(startup_type="CLEAR")
         msg = os.urandom(640)
-        return self.run_dilithium_flow(message=msg, chunk_size=256)
+        return self.run_dilithium_flow(message=msg)
 
     def repl(self):
         print("\nWaiting for SoC to signal it is READY...")
@@ -580,12 +500,12 @@ class TpmTester:
             if cmd in ("complete_hashsign"):
                 # Simple demo message; adjust or prompt as needed
                 msg = os.urandom(640)
-                self.run_hashsign_flow(message=msg, chunk_size=256)
+                self.run_hashsign_flow(message=msg)
                 continue
 
             if cmd in ("complete_dilithium"):
                 msg = os.urandom(640)
-                self.run_dilithium_flow(message=msg, chunk_size=256)
+                self.run_dilithium_flow(message=msg)
                 continue
 
             print("Unknown command. Type 'help'.")
@@ -634,13 +554,13 @@ def parse_args():
     parser.add_argument(
         "--log",
         action="store_true",
-        help="Route UART logs to a timestamped file.",
+        help="Record the UART wire log to a timestamped file (render with wire_log.py).",
     )
     parser.add_argument(
         "--log-name",
         type=str,
         default="uart-log",
-        help="Base filename for UART logs (timestamp and .log will be appended).",
+        help="Base filename for UART logs (timestamp and .wlog will be appended).",
     )
     return parser.parse_args()
 
@@ -658,7 +578,7 @@ def main():
     if getattr(args, "log", False):
         ts = time.strftime("%Y%m%d-%H%M%S")
         base = args.log_name
-        log_path = f"{base}-{ts}.log"
+        log_path = f"{base}-{ts}.wlog"
 
     try:
         # Create UART connection
@@ -688,6 +608,19 @@ def main():
             success = tester.test()
 
         print(f"\n{'✅ Test passed!' if success else '❌ Test failed!'}")
+        stats = uart.get_rx_stats()
+        print(
+            f"RX: {stats['bytes_read']} bytes in {stats['read_calls']} reads "
+            f"({stats['bytes_per_read']:.1f} B/read), {stats['syscalls']} syscalls, "
+            f"{stats['wakeups']} wakeups"
+        )
+        stats = uart.get_tx_stats()
+        print(
+            f"TX: {stats['bytes_written']} bytes in {stats['write_calls']} writes "
+            f"({stats['bytes_per_write']:.1f} B/write), {stats['commands']} commands in "
+            f"{stats['batches']} batches"
+        )
+        print(uart.wake_latency.render("RX wake latency (last byte -> caller)"))
 
     except Exception as e:
         print(f"Test failed: {e}")
@@ -1,32 +1,112 @@
+import os
+import mmap
 import time
+import collections
 from typing import Optional
 from uart import UARTConnection
 from tpm_utils import (
     TPM_ALG_ECC,
     TPM_ALG_DILITHIUM,
-    TPM_CC_HashSignStart,
-    TPM_CC_HashSignFinish,
-    TPM_CC_SequenceUpdate,
+    TPM_CAP_TPM_PROPERTIES,
     TPM_CC_HashVerifyStart,
-    TPM_CC_HashVerifyFinish,
-    u32_be_hex as _u32_be_hex,
-    u16_be_hex as _u16_be_hex,
-    bytes_hex as _bytes_hex,
+    TPM_PT_INPUT_BUFFER,
+    TPM_PT_MAX_COMMAND_SIZE,
+    TPM_RH_OWNER,
+    TPM_RX_SLOTS,
+    TPM_ST_NO_SESSIONS,
+    DEFAULT_CHUNK_SIZE,
+    prehash_digest,
     sessions_param_offset as _sessions_param_offset,
     parse_createprimary_outpublic as _parse_createprimary_outpublic,
     build_dilithium_signature_param as _build_dilithium_signature_param,
+    decode_perf_counters,
+    command_template,
+    max_sequence_chunk,
 )
+from tpm_marshal import CommandBuilder, create_primary_dilithium
+from tpm_schema import (
+    TPMTTKVerified,
+    decode_hashsign_finish,
+    decode_hashverify_finish,
+    decode_response,
+    encode_EvictControl,
+    encode_FlushContext,
+    encode_GetCapability,
+    encode_GetRandom,
+    encode_HashSignDigest,
+    encode_HashSignStart,
+    encode_ReadPerfCounters,
+    encode_ReadPublic,
+    encode_Startup,
+)
+from key_cache import persistent_handles_for, template_hash
+from tpm_timing import CommandTimings, Exchange
+
+TPM_RC_NV_DEFINED = 0x14C
+TPM_RC_COMMAND_CODE = 0x143
+# sign_many() default: pre-hash messages of this many bytes or more. prehash_bench.py at
+# 115200 baud: 1.4x faster at 1 KiB, under 1.2x below it, where the signature covering
+# only the digest is not worth it. TPMs without HashSignDigest fall back to streaming
+PREHASH_THRESHOLD = 1024
+
+# Files are streamed through the mapping this many bytes at a time (page aligned)
+MAP_WINDOW = 4 << 20
+
+_CREATE_PRIMARY_DILITHIUM = command_template("CreatePrimary(Dilithium)")
+_SEQUENCE_UPDATE = command_template("SequenceUpdate")
+_HASHSIGN_FINISH = command_template("HashSignFinish")
+_HASHVERIFY_FINISH = command_template("HashVerifyFinish")
 
 
 class TPMClient:
     """Minimal TPM client for Dilithium demo; uses UARTConnection directly."""
 
-    def __init__(self, uart: UARTConnection, on_command=None, on_response=None):
+    def __init__(
+        self,
+        uart: UARTConnection,
+        on_command=None,
+        on_response=None,
+        window: int = 1,
+        rx_slots: int = TPM_RX_SLOTS,
+        verbose: bool = True,
+        key_cache=None,
+        prehash_threshold: int | None = PREHASH_THRESHOLD,
+        timings: CommandTimings | None = None,
+    ):
         self.uart = uart
+        self.verbose = verbose
         self._on_command = on_command
         self._on_response = on_response
+        # Max SequenceUpdate commands in flight. The TPM drops commands arriving while all
+        # of its receive slots (rx_slots, the firmware's TPM_RX_SLOTS) are busy, and the
+        # client would then wait forever for their answers
+        self.window = max(1, int(window))
+        if self.window > rx_slots:
+            raise ValueError(f"window {self.window} exceeds the TPM's {rx_slots} receive slots")
+        self._marshal = CommandBuilder()
+        # SequenceUpdate chunk size for this device, from GetCapability on first use
+        self._chunk_size = None
+        # Dilithium signing key from dilithium_key(), reused for every batch; with a
+        # key_cache.KeyCache it is kept persistent in the TPM across connections
+        self.key_cache = key_cache
+        self._signing_key = None
+        self.signing_pubkey = None
+        # sign_many() signs messages of at least this many bytes in pre-hash mode (None: never)
+        self.prehash_threshold = prehash_threshold
+        # Per-command phase histograms (marshal/tx/compute/rx/decode); pass one to share it
+        self.timings = timings if timings is not None else CommandTimings(baud=uart.baudrate)
+        self._marshal_t0 = None
+        self._in_flight = collections.deque()  # exchanges sent and not yet answered, in order
+        self._answered = None
+        # Host-side metrics (tpm_metrics): commands sent by name, responses by (name, rc)
+        self.commands_sent = collections.Counter()
+        self.response_codes = collections.Counter()
 
     # ---- internal helpers ----
+    def _log(self, msg: str):
+        if self.verbose:
+            print(msg)
+
     def _emit_command(self, name: str, data: bytes, meta: dict | None = None):
         if self._on_command:
             try:
@@ -36,20 +116,66 @@ class TPMClient:
 
     def _emit_response(self, name: str, data: bytes, meta: dict | None = None):
         if self._on_response:
+            meta = dict(meta or {})
+            if self._answered is not None:
+                # marshal/tx/compute/rx so far (ns); decode is still to come
+                meta["phases"] = self.timings.split(self._answered, time.perf_counter_ns())
             try:
-                self._on_response(name, data, meta or {})
+                self._on_response(name, data, meta)
             except Exception:
                 pass
 
+    # ---- phase timing (tpm_timing) ----
+    def _phase_begin(self):
+        self._marshal_t0 = time.perf_counter_ns()
+
+    def _phase_sent(self, name: str, size: int):
+        """The command is handed to the link; it now waits for its answer, in send order"""
+        now = time.perf_counter_ns()
+        self._in_flight.append(Exchange(name, size, self._marshal_t0 or now, now))
+        self._marshal_t0 = None
+        self.commands_sent[name] += 1
+
+    def _phase_done(self):
+        """Record the exchange whose response was read last"""
+        ex, self._answered = self._answered, None
+        if ex is not None:
+            self.timings.record(ex, time.perf_counter_ns())
+
     def wait_for_ready_signal(self):
         while not self.uart.wait_for_ready(timeout=180):
-            pass
+            if self.uart.link_error is not None:
+                raise ConnectionError(f"UART link down: {self.uart.link_error}")
+        if self._in_flight:
+            ex = self._in_flight[0]
+            ex.ready = self.uart.ready_ns
+            ex.tx_done = self.uart.tx_done_ns
 
     def read_tpm_response(self, timeout):
+        # One deadline for the whole response, not one per read
+        deadline = time.monotonic() + timeout
         header = self.uart.wait_for_bytes(num_bytes=10, timeout=timeout)
-        response_size = int.from_bytes(header[2:6], byteorder="big")
-        body = self.uart.wait_for_bytes(num_bytes=(response_size - 10), timeout=timeout)
-        return header + body
+        if not header or len(header) < 10:
+            self._in_flight.clear()
+            return None
+        response_size = max(10, int.from_bytes(header[2:6], byteorder="big"))
+        # Body goes straight from the UART ring into the response buffer
+        rsp = bytearray(response_size)
+        rsp[:10] = header
+        remaining = max(0.0, deadline - time.monotonic())
+        if self.uart.readinto(memoryview(rsp)[10:], timeout=remaining) < response_size - 10:
+            # Like a missing header: what is in flight can no longer be matched to answers
+            self._in_flight.clear()
+            return None
+        if self._in_flight:
+            self._answered = self._in_flight.popleft()
+            self._answered.received = self.uart.rx_last_ns
+            self.response_codes[(self._answered.name, int.from_bytes(header[6:10], "big"))] += 1
+        return rsp
+
+    def commands_in_flight(self) -> int:
+        """Commands sent and not answered yet"""
+        return len(self._in_flight)
 
     def extract_first_handle_from_response(self, rsp: bytes) -> int:
         if len(rsp) < 14:
@@ -61,196 +187,677 @@ class TPMClient:
 
     # ---- commands ----
     def startup_cmd(self, startup_type: str = "CLEAR"):
+        self._phase_begin()
         st = (startup_type or "").strip().upper()
-        if st in ("0", "CLEAR", ""):
-            su_val = "0000"
-        elif st in ("1", "STATE"):
-            su_val = "0001"
-        else:
-            su_val = "0000"
-        bytestring = f"80010000000C00000144{su_val}"
-        bytestream = bytes.fromhex(bytestring)
-        print("Sending Startup command...")
+        su_val = 1 if st in ("1", "STATE") else 0  # TPM_SU_STATE / TPM_SU_CLEAR
+        bytestream = encode_Startup(self._marshal, su_val)
+        self._log("Sending Startup command...")
         self._emit_command("Startup", bytestream, {"handles_out": 0})
+        self._phase_sent("Startup", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for Startup answer...")
+        self._log("Waiting for Startup answer...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
         if not result:
             raise RuntimeError("Failed to get startup answer, aborting")
-        print("Startup cmd response received")
+        self._log("Startup cmd response received")
         self._emit_response("Startup", result, {"handles_out": 0})
+        self._phase_done()
         return result
 
     def get_random_cmd(self, num_bytes: int = 32):
+        self._phase_begin()
         num_bytes = max(1, min(0xFFFF, int(num_bytes)))
-        bytestring = f"80010000000C0000017B{num_bytes:04X}"
-        bytestream = bytes.fromhex(bytestring)
-        print(f"Sending get_random_bytes({num_bytes}) command...")
+        bytestream = encode_GetRandom(self._marshal, num_bytes)
+        self._log(f"Sending get_random_bytes({num_bytes}) command...")
         self._emit_command("GetRandom", bytestream, {"handles_out": 0})
+        self._phase_sent("GetRandom", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for get_random answer...")
+        self._log("Waiting for get_random answer...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
         if not result:
             raise RuntimeError("Failed to get get_random_bytes() answer, aborting")
-        print("get_random_bytes() response received")
+        self._log("get_random_bytes() response received")
         self._emit_response("GetRandom", result, {"handles_out": 0})
+        self._phase_done()
         return result
 
-    def create_primary_dilithium_cmd(self):
-        # Exact command aligned with working tpm.py tester (avoid extra trailing zeros)
-        hex_cmd = (
-            "80020000003E0000013140000001000000094000000900000000000008000461626364"
-            "000000110072000B00040472000000100010020000000000000000"
-        )
-        bytestream = bytes.fromhex(hex_cmd)
-        print("Sending create_primary_dilithium() command...")
+    def get_capability_cmd(self, capability: int, prop: int, count: int):
+        """TPM2_GetCapability; returns the decoded response (more_data, capability_data)"""
+        self._phase_begin()
+        bytestream = encode_GetCapability(self._marshal, capability, prop, count)
+        self._log(f"Sending GetCapability(0x{capability:X}, 0x{prop:X}, {count})...")
+        self._emit_command("GetCapability", bytestream, {"handles_out": 0})
+        self._phase_sent("GetCapability", len(bytestream))
+        self.uart.send_bytes(bytestream)
+        self._log("Waiting for GetCapability answer...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+        if not result:
+            raise RuntimeError("Failed to get GetCapability() answer, aborting")
+        self._log("GetCapability() response received")
+        self._emit_response("GetCapability", result, {"handles_out": 0})
+        rc = int.from_bytes(result[6:10], "big")
+        if rc != 0:
+            raise RuntimeError(f"GetCapability failed rc=0x{rc:08X}")
+        decoded = decode_response("GetCapability", result)
+        self._phase_done()
+        return decoded
+
+    def tpm_properties(self, first: int, count: int) -> dict:
+        """TPM_CAP_TPM_PROPERTIES in [first, first + count) as {property: value}"""
+        props = {}
+        end = first + count
+        while first < end:
+            rsp = self.get_capability_cmd(TPM_CAP_TPM_PROPERTIES, first, end - first)
+            found = rsp.capability_data.data
+            for p in found:
+                if p.property < end:
+                    props[p.property] = p.value
+            if not rsp.more_data or not found:
+                break
+            first = found[-1].property + 1
+        return props
+
+    def sequence_chunk_size(self) -> int:
+        """Largest SequenceUpdate chunk for this TPM; queried once, then cached"""
+        if self._chunk_size is None:
+            try:
+                props = self.tpm_properties(
+                    TPM_PT_INPUT_BUFFER, TPM_PT_MAX_COMMAND_SIZE - TPM_PT_INPUT_BUFFER + 1
+                )
+                self._chunk_size = max_sequence_chunk(
+                    props[TPM_PT_INPUT_BUFFER], props[TPM_PT_MAX_COMMAND_SIZE]
+                )
+            except (RuntimeError, KeyError) as e:
+                self._log(f"TPM limits unavailable ({e}), using {DEFAULT_CHUNK_SIZE} B chunks")
+                self._chunk_size = DEFAULT_CHUNK_SIZE
+            self._log(f"SequenceUpdate chunk size: {self._chunk_size} B")
+        return self._chunk_size
+
+    def create_primary_dilithium_cmd(self, security_level: int = 2):
+        self._phase_begin()
+        if security_level == 2:
+            bytestream = _CREATE_PRIMARY_DILITHIUM.render()
+        else:
+            bytestream = create_primary_dilithium(self._marshal, security_level=security_level)
+        self._log("Sending create_primary_dilithium() command...")
         self._emit_command("CreatePrimary(Dilithium)", bytestream, {"handles_out": 1})
+        self._phase_sent("CreatePrimary(Dilithium)", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for create_primary_dilithium() answer...")
+        self._log("Waiting for create_primary_dilithium() answer...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
         if not result:
             raise RuntimeError("Failed to get create_primary_dilithium() answer, aborting")
-        print("create_primary_dilithium() response received")
+        self._log("create_primary_dilithium() response received")
         self._emit_response("CreatePrimary(Dilithium)", result, {"handles_out": 1})
+        self._phase_done()
+        return result
+
+    def read_public_cmd(self, object_handle: int):
+        """TPM2_ReadPublic; returns the raw response (rc != 0 if the handle is not loaded)"""
+        self._phase_begin()
+        bytestream = encode_ReadPublic(self._marshal, object_handle)
+        self._log(f"Sending ReadPublic(0x{object_handle:08X})...")
+        self._emit_command("ReadPublic", bytestream, {"handles_out": 0})
+        self._phase_sent("ReadPublic", len(bytestream))
+        self.uart.send_bytes(bytestream)
+        self._log("Waiting for ReadPublic answer...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+        if not result:
+            raise RuntimeError("Failed to get ReadPublic() answer, aborting")
+        self._log("ReadPublic() response received")
+        self._emit_response("ReadPublic", result, {"handles_out": 0})
+        self._phase_done()
         return result
 
+    def evict_control_cmd(self, object_handle: int, persistent_handle: int) -> int:
+        """TPM2_EvictControl under the owner hierarchy; returns the response code.
+
+        A transient `object_handle` is copied to `persistent_handle`; passing the
+        persistent handle itself as `object_handle` removes it from NV.
+        """
+        self._phase_begin()
+        bytestream = encode_EvictControl(self._marshal, TPM_RH_OWNER, object_handle, persistent_handle)
+        self._log(f"Sending EvictControl(0x{object_handle:08X} -> 0x{persistent_handle:08X})...")
+        self._emit_command("EvictControl", bytestream, {"handles_out": 0})
+        self._phase_sent("EvictControl", len(bytestream))
+        self.uart.send_bytes(bytestream)
+        self._log("Waiting for EvictControl answer...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+        if not result:
+            raise RuntimeError("Failed to get EvictControl() answer, aborting")
+        self._log("EvictControl() response received")
+        self._emit_response("EvictControl", result, {"handles_out": 0})
+        self._phase_done()
+        return int.from_bytes(result[6:10], "big")
+
+    def flush_context_cmd(self, handle: int) -> None:
+        self._phase_begin()
+        bytestream = encode_FlushContext(self._marshal, handle)
+        self._log(f"Sending FlushContext(0x{handle:08X})...")
+        self._emit_command("FlushContext", bytestream, {"handles_out": 0})
+        self._phase_sent("FlushContext", len(bytestream))
+        self.uart.send_bytes(bytestream)
+        self._log("Waiting for FlushContext answer...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+        if not result:
+            raise RuntimeError("Failed to get FlushContext() answer, aborting")
+        self._log("FlushContext() response received")
+        self._emit_response("FlushContext", result, {"handles_out": 0})
+        self._phase_done()
+        rc = int.from_bytes(result[6:10], "big")
+        if rc != 0:
+            raise RuntimeError(f"FlushContext failed rc=0x{rc:08X}")
+
+    def read_perf_counters_cmd(self, reset: bool = False) -> dict:
+        """On-device cycle counters per command (tpm_utils.decode_perf_counters); `reset` clears them after reading"""
+        self._phase_begin()
+        bytestream = encode_ReadPerfCounters(self._marshal, 1 if reset else 0)
+        self._log(f"Sending ReadPerfCounters(reset={bool(reset)})...")
+        self._emit_command("ReadPerfCounters", bytestream, {"handles_out": 0})
+        self._phase_sent("ReadPerfCounters", len(bytestream))
+        self.uart.send_bytes(bytestream)
+        self._log("Waiting for ReadPerfCounters answer...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+        if not result:
+            raise RuntimeError("Failed to get ReadPerfCounters() answer, aborting")
+        self._log("ReadPerfCounters() response received")
+        self._emit_response("ReadPerfCounters", result, {"handles_out": 0})
+        rc = int.from_bytes(result[6:10], "big")
+        if rc != 0:
+            raise RuntimeError(f"ReadPerfCounters failed rc=0x{rc:08X}")
+        counters = decode_perf_counters(result)
+        self._phase_done()
+        return counters
+
+    # ---- signing key ----
+    def dilithium_key(self) -> int:
+        """Handle of this connection's Dilithium signing key, set up on first use.
+
+        Without a key cache this is a transient primary from CreatePrimary. With one,
+        a cached persistent key that ReadPublic confirms is reused; otherwise the
+        primary is created, made persistent and recorded in the cache.
+        """
+        if self._signing_key is None:
+            handle = self.load_cached_key()
+            if handle is None:
+                handle = self._create_dilithium_key()
+            self._signing_key = handle
+        return self._signing_key
+
+    def _key_cache_entry(self) -> tuple:
+        """(device, template hash) the signing key is cached under"""
+        return self.uart.endpoint or "default", template_hash(_CREATE_PRIMARY_DILITHIUM.prototype)
+
+    def load_cached_key(self) -> int | None:
+        """Persistent signing key from the key cache, if the TPM still holds it unchanged"""
+        if self.key_cache is None:
+            return None
+        device, digest = self._key_cache_entry()
+        entry = self.key_cache.get(device, digest)
+        if entry is None:
+            return None
+        rsp = self.read_public_cmd(entry["handle"])
+        rc = int.from_bytes(rsp[6:10], "big")
+        if rc != 0 or _public_area(rsp, 0) != entry["public"]:
+            self._log(f"Cached key 0x{entry['handle']:08X} is gone or changed (rc=0x{rc:X})")
+            self.key_cache.drop(device, digest)
+            return None
+        self._log(f"Using cached persistent key 0x{entry['handle']:08X}")
+        self.signing_pubkey = bytes(decode_response("ReadPublic", rsp).out_public.unique)
+        self._signing_key = entry["handle"]
+        return entry["handle"]
+
+    def _create_dilithium_key(self) -> int:
+        rsp = self.create_primary_dilithium_cmd()
+        rc = int.from_bytes(rsp[6:10], "big")
+        if rc != 0:
+            raise RuntimeError(f"CreatePrimary failed rc=0x{rc:08X}")
+        handle = self.extract_first_handle_from_response(rsp)
+        self.signing_pubkey = _parse_createprimary_outpublic(rsp).get("pub")
+        if self.key_cache is None:
+            return handle
+
+        public = _public_area(rsp, 1)
+        device, digest = self._key_cache_entry()
+        try:
+            persistent = self._persist_key(handle, public, digest)
+        finally:
+            # The transient copy, persisted or not, would only hold one of the TPM's
+            # few object slots
+            self.flush_context_cmd(handle)
+        self.key_cache.put(device, digest, persistent, public)
+        self._log(f"Signing key persisted at 0x{persistent:08X}")
+        return persistent
+
+    def _persist_key(self, handle: int, public: bytes, digest: str) -> int:
+        """EvictControl `handle` to a free persistent handle of the template (or find it
+        already there); returns that handle"""
+        candidates = persistent_handles_for(digest)
+        for persistent in candidates:
+            rc = self.evict_control_cmd(handle, persistent)
+            if rc != TPM_RC_NV_DEFINED:
+                break
+            # Primaries are derived from the template, so the occupant is usually this
+            # very key, persisted by a run whose cache entry is lost. Anything else is
+            # not ours to evict: try the next handle
+            rsp = self.read_public_cmd(persistent)
+            if int.from_bytes(rsp[6:10], "big") == 0 and _public_area(rsp, 0) == public:
+                rc = 0
+                break
+            self._log(f"Persistent handle 0x{persistent:08X} holds another object, skipping it")
+        else:
+            raise RuntimeError(
+                f"Persistent handles 0x{candidates[0]:08X}..0x{candidates[-1]:08X} all hold other "
+                "objects; evict one or run without a key cache"
+            )
+        if rc != 0:
+            raise RuntimeError(f"EvictControl failed rc=0x{rc:08X}")
+        return persistent
+
     def hashsign_start_cmd(self, key_handle: int, total_len: int, key_pw: bytes = b"abcd") -> int:
-        tag = "80 02"
-        cc = _u32_be_hex(TPM_CC_HashSignStart)
-        handle_hex = _u32_be_hex(key_handle)
-        auth_entry = "40000009" + "0000" + "00" + _u16_be_hex(len(key_pw)) + _bytes_hex(key_pw)
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-        params_hex = _u32_be_hex(int(total_len))
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry)) + 4
-        size_hex = _u32_be_hex(size_bytes)
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}{params_hex}"
-        bytestream = bytes.fromhex(bytestring)
-        print(f"Sending HashSignStart(total_len={total_len})...")
+        self._phase_begin()
+        bytestream = encode_HashSignStart(self._marshal, key_handle, int(total_len), auth=key_pw)
+        self._log(f"Sending HashSignStart(total_len={total_len})...")
         self._emit_command("HashSignStart", bytestream, {"handles_out": 1})
+        self._phase_sent("HashSignStart", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for HashSignStart answer...")
+        self._log("Waiting for HashSignStart answer...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
         if not result:
             raise RuntimeError("Failed to get HashSignStart() answer, aborting")
-        print("HashSignStart() response received")
+        self._log("HashSignStart() response received")
         self._emit_response("HashSignStart", result, {"handles_out": 1})
         rc = int.from_bytes(result[6:10], "big")
         if rc != 0:
             raise RuntimeError(f"HashSignStart failed rc=0x{rc:08X}")
         seq_handle = self.extract_first_handle_from_response(result)
+        self._phase_done()
         return seq_handle
 
-    def sequence_update_cmd(self, seq_handle: int, chunk: bytes) -> None:
-        tag = "80 02"
-        cc = _u32_be_hex(TPM_CC_SequenceUpdate)
-        handle_hex = _u32_be_hex(seq_handle)
-        auth_entry = "40000009" + "0000" + "00" + "0000"
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-        buf_hex = _u16_be_hex(len(chunk)) + _bytes_hex(chunk)
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry)) + 2 + len(chunk)
-        size_hex = _u32_be_hex(size_bytes)
-        hex_cmd = f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}{buf_hex}"
-        bytestream = bytes.fromhex(hex_cmd)
-        print("Sending SequenceUpdate command...")
-        self._emit_command("SequenceUpdate", bytestream, {"handles_out": 0})
-        self.uart.send_bytes(bytestream)
-        print("Waiting for SequenceUpdate answer...")
+    def _sequence_update_header(self, seq_handle: int, chunk_len: int) -> bytes:
+        """Everything up to and including TPM2B_MAX_BUFFER.size; the chunk follows"""
+        return _SEQUENCE_UPDATE.render(seq_handle, payload_len=chunk_len)
+
+    def _sequence_update_send(self, seq_handle: int, chunk) -> None:
+        self._phase_begin()
+        # Header and chunk go out scatter-gather, the chunk is never copied
+        header = self._sequence_update_header(seq_handle, len(chunk))
+        self._log("Sending SequenceUpdate command...")
+        if self._on_command:
+            self._emit_command("SequenceUpdate", header + bytes(chunk), {"handles_out": 0})
+        self._phase_sent("SequenceUpdate", len(header) + len(chunk))
+        self.uart.send_bytes(header, chunk)
+
+    def _sequence_update_collect(self) -> int:
+        self._log("Waiting for SequenceUpdate answer...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
         if not result:
             raise RuntimeError("Failed to get SequenceUpdate() answer, aborting")
-        print("SequenceUpdate() response received")
+        self._log("SequenceUpdate() response received")
         self._emit_response("SequenceUpdate", result, {"handles_out": 0})
-        rc = int.from_bytes(result[6:10], "big")
+        self._phase_done()
+        return int.from_bytes(result[6:10], "big")
+
+    def sequence_update_cmd(self, seq_handle: int, chunk: bytes) -> None:
+        self._sequence_update_send(seq_handle, chunk)
+        rc = self._sequence_update_collect()
         if rc != 0:
             raise RuntimeError(f"SequenceUpdate failed rc=0x{rc:08X}")
 
+    def sequence_update_stream(self, seq_handle: int, data, chunk_size: int | None = None) -> int:
+        """Feed `data` to a sequence with up to `window` SequenceUpdates in flight.
+
+        `data` is a bytes-like object or an iterable of buffers; chunks are sent as
+        views without copying. `chunk_size` defaults to sequence_chunk_size().
+        Returns the number of bytes sent.
+
+        The firmware queues the next command(s) in its spare RX slot(s) while the
+        current chunk is processed, so the link never idles between chunks.
+        """
+        if chunk_size is None:
+            chunk_size = self.sequence_chunk_size()
+        in_flight = collections.deque()
+        failed_rc = 0
+        sent = 0
+        for chunk in _iter_chunks(data, chunk_size):
+            if len(in_flight) >= self.window:
+                in_flight.popleft()
+                rc = self._sequence_update_collect()
+                failed_rc = failed_rc or rc
+                if failed_rc:
+                    break
+            self._sequence_update_send(seq_handle, chunk)
+            in_flight.append(len(chunk))
+            sent += len(chunk)
+        # Drain everything in flight before reporting, so the link stays in sync
+        while in_flight:
+            in_flight.popleft()
+            rc = self._sequence_update_collect()
+            failed_rc = failed_rc or rc
+        if failed_rc != 0:
+            raise RuntimeError(f"SequenceUpdate failed rc=0x{failed_rc:08X}")
+        return sent
+
     def hashsign_finish_cmd(self, seq_handle: int) -> bytes:
-        tag = "80 02"
-        cc = _u32_be_hex(TPM_CC_HashSignFinish)
-        handle_hex = _u32_be_hex(seq_handle)
-        auth_entry = "40000009" + "0000" + "00" + "0000"
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry))
-        size_hex = _u32_be_hex(size_bytes)
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}"
-        bytestream = bytes.fromhex(bytestring)
-        print("Sending HashSignFinish...")
+        self._phase_begin()
+        bytestream = _HASHSIGN_FINISH.render(seq_handle)
+        self._log("Sending HashSignFinish...")
         self._emit_command("HashSignFinish", bytestream, {"handles_out": 0})
+        self._phase_sent("HashSignFinish", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for HashSignFinish response...")
+        self._log("Waiting for HashSignFinish response...")
         self.wait_for_ready_signal()
         result = self.read_tpm_response(timeout=3600)
         if not result:
             raise RuntimeError("Failed to get HashSignFinish() answer, aborting")
-        print("HashSignFinish() response received")
+        self._log("HashSignFinish() response received")
         self._emit_response("HashSignFinish", result, {"handles_out": 0})
         rc = int.from_bytes(result[6:10], "big")
         if rc != 0:
             raise RuntimeError(f"HashSignFinish failed rc=0x{rc:08X}")
-        off = _sessions_param_offset(result, response_handle_count=0)
-        sigAlg = int.from_bytes(result[off : off + 2], "big"); off += 2
-        hashAlg = int.from_bytes(result[off : off + 2], "big"); off += 2
-        sig_len = int.from_bytes(result[off : off + 2], "big"); off += 2
-        sig_bytes = result[off : off + sig_len]
-        return sig_bytes
+        sig = bytes(decode_hashsign_finish(result).signature)
+        self._phase_done()
+        return sig
 
-    def hashverify_start_cmd(self, key_handle: int, total_len: int, signature: bytes) -> int:
-        tag = "80 01"
-        cc = _u32_be_hex(TPM_CC_HashVerifyStart)
-        handle_hex = _u32_be_hex(key_handle)
-        total_hex = _u32_be_hex(int(total_len))
-        sig_param_hex = self.build_dilithium_signature_param(signature)
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(sig_param_hex))
-        size_hex = _u32_be_hex(size_bytes)
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{total_hex}{sig_param_hex}"
-        bytestream = bytes.fromhex(bytestring)
-        print(f"Sending HashVerifyStart(total_len={total_len})...")
-        self._emit_command("HashVerifyStart", bytestream, {"handles_out": 1})
+    def hashsign_digest_cmd(self, key_handle: int, digest: bytes, key_pw: bytes = b"abcd") -> bytes:
+        """Pre-hash signing: one command signs a PREHASH_DIGEST_SIZE message digest"""
+        rc, sig = self._hashsign_digest(key_handle, digest, key_pw)
+        if rc != 0:
+            raise RuntimeError(f"HashSignDigest failed rc=0x{rc:08X}")
+        return sig
+
+    def _hashsign_digest(self, key_handle: int, digest: bytes, key_pw: bytes) -> tuple:
+        """(rc, signature or None)"""
+        self._phase_begin()
+        bytestream = encode_HashSignDigest(self._marshal, key_handle, digest, auth=key_pw)
+        self._log(f"Sending HashSignDigest({len(digest)} B digest)...")
+        self._emit_command("HashSignDigest", bytestream, {"handles_out": 0})
+        self._phase_sent("HashSignDigest", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for HashVerifyStart answer...")
+        self._log("Waiting for HashSignDigest response...")
+        self.wait_for_ready_signal()
+        result = self.read_tpm_response(timeout=3600)
+        if not result:
+            raise RuntimeError("Failed to get HashSignDigest() answer, aborting")
+        self._log("HashSignDigest() response received")
+        self._emit_response("HashSignDigest", result, {"handles_out": 0})
+        rc = int.from_bytes(result[6:10], "big")
+        if rc != 0:
+            return rc, None
+        sig = bytes(decode_response("HashSignDigest", result).signature.signature)
+        self._phase_done()
+        return 0, sig
+
+    def hashverify_start_cmd(self, key_handle: int, total_len: int, signature: bytes) -> int:
+        self._phase_begin()
+        m = self._marshal.begin(TPM_ST_NO_SESSIONS, TPM_CC_HashVerifyStart)
+        m.handle(key_handle)
+        m.u32(int(total_len))
+        # TPMT_SIGNATURE up to the TPM2B size; the signature itself is sent as-is
+        m.dilithium_signature_prefix(len(signature))
+        header = m.finish(len(signature))
+        self._log(f"Sending HashVerifyStart(total_len={total_len})...")
+        if self._on_command:
+            self._emit_command("HashVerifyStart", header + bytes(signature), {"handles_out": 1})
+        self._phase_sent("HashVerifyStart", len(header) + len(signature))
+        self.uart.send_bytes(header, signature)
+        self._log("Waiting for HashVerifyStart answer...")
         self.wait_for_ready_signal()
         rsp = self.read_tpm_response(timeout=3600)
         if not rsp:
             raise RuntimeError("Failed to get HashVerifyStart() answer, aborting")
-        print("HashVerifyStart() response received")
+        self._log("HashVerifyStart() response received")
         self._emit_response("HashVerifyStart", rsp, {"handles_out": 1})
         rc = int.from_bytes(rsp[6:10], "big")
         if rc != 0:
             raise RuntimeError(f"HashVerifyStart failed rc=0x{rc:08X}")
         seq_handle = self.extract_first_handle_from_response(rsp)
+        self._phase_done()
         return seq_handle
 
-    def hashverify_finish_cmd(self, seq_handle: int):
-        tag = "80 02"
-        cc = _u32_be_hex(TPM_CC_HashVerifyFinish)
-        handle_hex = _u32_be_hex(seq_handle)
-        auth_entry = "40000009" + "0000" + "00" + "0000"
-        auth_area_size_hex = _u32_be_hex(len(bytes.fromhex(auth_entry)))
-        size_bytes = 10 + 4 + 4 + len(bytes.fromhex(auth_entry))
-        size_hex = _u32_be_hex(size_bytes)
-        bytestring = f"{tag}{size_hex}{cc}{handle_hex}{auth_area_size_hex}{auth_entry}"
-        bytestream = bytes.fromhex(bytestring)
-        print("Sending HashVerifyFinish...")
+    def hashverify_finish_cmd(self, seq_handle: int) -> TPMTTKVerified:
+        self._phase_begin()
+        bytestream = _HASHVERIFY_FINISH.render(seq_handle)
+        self._log("Sending HashVerifyFinish...")
         self._emit_command("HashVerifyFinish", bytestream, {"handles_out": 0})
+        self._phase_sent("HashVerifyFinish", len(bytestream))
         self.uart.send_bytes(bytestream)
-        print("Waiting for HashVerifyFinish response...")
+        self._log("Waiting for HashVerifyFinish response...")
         self.wait_for_ready_signal()
         rsp = self.read_tpm_response(timeout=3600)
         if not rsp:
             raise RuntimeError("Failed to get HashVerifyFinish() answer, aborting")
-        print("HashVerifyFinish() response received")
+        self._log("HashVerifyFinish() response received")
         self._emit_response("HashVerifyFinish", rsp, {"handles_out": 0})
         rc = int.from_bytes(rsp[6:10], "big")
         if rc != 0:
             raise RuntimeError(f"HashVerifyFinish failed rc=0x{rc:08X}")
-        off = _sessions_param_offset(rsp, response_handle_count=0)
-        tag_val = int.from_bytes(rsp[off : off + 2], "big"); off += 2
-        hierarchy = int.from_bytes(rsp[off : off + 4], "big"); off += 4
-        dsz = int.from_bytes(rsp[off : off + 2], "big"); off += 2
-        digest = rsp[off : off + dsz]
-        return (tag_val, hierarchy, digest)
+        ticket = decode_hashverify_finish(rsp)
+        self._phase_done()
+        return ticket
+
+    # ---- streaming sign/verify ----
+    def _stream_sequence(self, seq_handle: int, source, total_len: int, chunk_size: int | None):
+        sent = self.sequence_update_stream(seq_handle, source, chunk_size=chunk_size)
+        if sent != total_len:
+            raise ValueError(f"Message source gave {sent} bytes, expected {total_len}")
+
+    def sign_file(
+        self,
+        source,
+        key_handle: int,
+        total_len: int | None = None,
+        key_pw: bytes = b"abcd",
+        chunk_size: int | None = None,
+        prehash: bool = False,
+    ) -> bytes:
+        """HashSign a file (mmap'd, chunks sent as views) or an iterable of buffers.
+
+        Memory use does not depend on the message size. An iterable needs
+        `total_len`, since HashSignStart carries the length up front. With
+        `prehash` the message is digested on the host (prehash_digest()) and only
+        the digest is signed, in a single HashSignDigest; verify with prehashed=True.
+        """
+        return self._sign_source(source, key_handle, total_len, key_pw, chunk_size, prehash)[0]
+
+    def _sign_source(self, source, key_handle, total_len, key_pw, chunk_size, prehash) -> tuple:
+        """(signature, prehashed); prehash None picks pre-hash from prehash_threshold,
+        and streams instead on a TPM that does not know HashSignDigest"""
+        auto = prehash is None
+        with _MessageSource(source, total_len) as (chunks, total):
+            if auto:
+                prehash = self.prehash_threshold is not None and total >= self.prehash_threshold
+            if not prehash:
+                return self._sign_stream(key_handle, chunks, total, key_pw, chunk_size), False
+            digest = prehash_digest(chunks)
+        rc, sig = self._hashsign_digest(key_handle, digest, key_pw)
+        if rc == 0:
+            return sig, True
+        if not auto or rc != TPM_RC_COMMAND_CODE:
+            raise RuntimeError(f"HashSignDigest failed rc=0x{rc:08X}")
+        # Stream this message and, from now on, every other one. Only sign_many() picks
+        # pre-hash, and its messages (bytes-like, paths, files) can be read again
+        self._log("TPM has no HashSignDigest, streaming instead")
+        self.prehash_threshold = None
+        with _MessageSource(source, total_len) as (chunks, total):
+            return self._sign_stream(key_handle, chunks, total, key_pw, chunk_size), False
+
+    def _sign_stream(self, key_handle, chunks, total, key_pw, chunk_size) -> bytes:
+        seq = self.hashsign_start_cmd(key_handle, total, key_pw=key_pw)
+        self._stream_sequence(seq, chunks, total, chunk_size)
+        sig = self.hashsign_finish_cmd(seq)
+        # Chunks may be views of the caller's mapping: all of them must be out first
+        self.uart.wait_sent()
+        return sig
+
+    def verify_file(
+        self,
+        source,
+        signature: bytes,
+        key_handle: int,
+        total_len: int | None = None,
+        chunk_size: int | None = None,
+        prehashed: bool = False,
+    ) -> TPMTTKVerified:
+        """HashVerify `signature` over a file or an iterable of buffers (see sign_file).
+        A pre-hash signature is checked against the message digest instead."""
+        if prehashed:
+            with _MessageSource(source, total_len) as (chunks, total):
+                digest = prehash_digest(chunks)
+            return self.verify_file(digest, signature, key_handle, chunk_size=chunk_size)
+        with _MessageSource(source, total_len) as (chunks, total):
+            seq = self.hashverify_start_cmd(key_handle, total, signature)
+            self._stream_sequence(seq, chunks, total, chunk_size)
+            ticket = self.hashverify_finish_cmd(seq)
+            self.uart.wait_sent()
+        return ticket
+
+    # ---- batch signing ----
+    def sign_many(
+        self,
+        messages,
+        key: int | None = None,
+        key_pw: bytes = b"abcd",
+        chunk_size: int | None = None,
+        prehash: bool | None = None,
+    ) -> list:
+        """HashSign each message with one key; returns a SignResult per message, in order.
+
+        `key` is a loaded key handle; by default the connection's Dilithium key
+        (dilithium_key()) is used, so keygen runs at most once, not per message.
+        Messages are anything sign_file() takes: bytes-like, paths or file objects.
+        By default messages of prehash_threshold bytes or more are signed in
+        pre-hash mode (SignResult.prehashed), unless the TPM turns out not to have
+        HashSignDigest; pass prehash=True/False to force either mode.
+        """
+        key_handle = self.dilithium_key() if key is None else key
+        results = []
+        for message in messages:
+            t0 = time.perf_counter()
+            sig, prehashed = self._sign_source(message, key_handle, None, key_pw, chunk_size, prehash)
+            results.append(SignResult(sig, time.perf_counter() - t0, prehashed))
+        return results
+
+
+class SignResult:
+    """Signature of one sign_many() message, the seconds its signing took and
+    whether it covers the message digest (pre-hash mode) rather than the message"""
+
+    __slots__ = ("signature", "seconds", "prehashed")
+
+    def __init__(self, signature: bytes, seconds: float, prehashed: bool = False):
+        self.signature = signature
+        self.seconds = seconds
+        self.prehashed = prehashed
+
+    def __repr__(self):
+        mode = ", pre-hash" if self.prehashed else ""
+        return f"SignResult({len(self.signature)} B signature, {self.seconds * 1e3:.1f} ms{mode})"
+
+
+def _public_area(rsp, response_handle_count: int) -> bytes:
+    """TPMT_PUBLIC bytes of the TPM2B_PUBLIC that starts the response parameters"""
+    off = _sessions_param_offset(rsp, response_handle_count)
+    size = int.from_bytes(rsp[off : off + 2], "big")
+    return bytes(rsp[off + 2 : off + 2 + size])
+
+
+def _iter_chunks(data, chunk_size: int):
+    """memoryview chunks of `chunk_size` bytes (the last may be shorter).
+
+    A bytes-like `data` is sliced in place. For an iterable of buffers, whole
+    chunks are cut from each buffer without copying and only the pieces that
+    straddle two buffers are joined.
+    """
+    try:
+        view = memoryview(data)
+    except TypeError:
+        view = None
+    if view is not None:
+        view = view.cast("B") if view.format != "B" or view.ndim != 1 else view
+        for off in range(0, len(view), chunk_size):
+            yield view[off : off + chunk_size]
+        return
+    pending = bytearray()
+    for buf in data:
+        view = memoryview(buf).cast("B")
+        if pending:
+            need = chunk_size - len(pending)
+            pending += view[:need]
+            view = view[need:]
+            if len(pending) < chunk_size:
+                continue
+            # The chunk is queued without copying, so hand out a fresh buffer
+            yield memoryview(bytes(pending))
+            pending = bytearray()
+        whole = len(view) - len(view) % chunk_size
+        for off in range(0, whole, chunk_size):
+            yield view[off : off + chunk_size]
+        pending += view[whole:]
+    if pending:
+        yield memoryview(bytes(pending))
+
+
+class _MessageSource:
+    """Context manager giving (chunks, total length) for a path, file object,
+    bytes-like object or iterable of buffers; files are mmap'd read-only"""
+
+    def __init__(self, source, total_len: int | None = None):
+        self.source = source
+        self.total_len = total_len
+        self._file = None
+        self._map = None
+
+    def __enter__(self):
+        src = self.source
+        if isinstance(src, (str, os.PathLike)):
+            src = self._file = open(src, "rb")
+        if hasattr(src, "fileno"):
+            size = os.fstat(src.fileno()).st_size
+            # mmap refuses empty files; an empty message needs no mapping
+            if not size:
+                return b"", 0
+            self._map = mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._map, "madvise"):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            return self._windows(), size
+        try:
+            return src, len(memoryview(src))
+        except TypeError:
+            pass
+        if self.total_len is None:
+            raise ValueError("total_len is required for an iterable message source")
+        return src, int(self.total_len)
+
+    def _windows(self):
+        """The mapping in MAP_WINDOW views; pages of a window already streamed are
+        dropped from the page tables, so resident memory stays flat for big files"""
+        view = memoryview(self._map)
+        can_drop = hasattr(self._map, "madvise") and hasattr(mmap, "MADV_DONTNEED")
+        for off in range(0, len(view), MAP_WINDOW):
+            yield view[off : off + MAP_WINDOW]
+            if can_drop:
+                # Read-only file pages: anything still queued just faults back in
+                self._map.madvise(mmap.MADV_DONTNEED, off, min(MAP_WINDOW, len(view) - off))
+
+    def __exit__(self, *exc):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A chunk view is still referenced (e.g. the link failed mid-write);
+                # the mapping is released once that view is collected
+                pass
+        if self._file is not None:
+            self._file.close()
+        return False
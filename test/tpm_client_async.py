@@ -0,0 +1,417 @@
+"""asyncio TPM client on top of AsyncUARTConnection.
+
+AsyncTPMClient mirrors TPMClient command for command as coroutines, so one event
+loop can drive many TPMs without a thread per device or per request:
+
+    uart = await AsyncUARTConnection.open(tcp_port=4327)
+    client = AsyncTPMClient(uart)
+    await uart.wait_for_ready()
+    await client.startup_cmd("CLEAR")
+    key = client.extract_first_handle_from_response(await client.create_primary_dilithium_cmd())
+    sig = await client.sign(message, key)
+
+Every command takes `timeout=` (seconds), defaulting to `timeouts[name]` or
+`default_timeout`; running out raises TimeoutError. A timeout or a cancelled task
+only stops the caller from waiting: the TPM still runs the command, so the exchange
+carries on in the background and its answer is read and dropped before the next
+command goes out, which keeps the link in step.
+
+    python tpm_client_async.py --standin 4 --jobs 100     # one loop, four stand-ins
+    python tpm_client_async.py --tcp-ports 4327 4328 --jobs 20
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import collections
+
+from uart_async import AsyncUARTConnection
+from tpm_client import _iter_chunks
+from tpm_utils import (
+    TPM_CAP_TPM_PROPERTIES,
+    TPM_CC_HashVerifyStart,
+    TPM_PT_INPUT_BUFFER,
+    TPM_PT_MAX_COMMAND_SIZE,
+    TPM_RX_SLOTS,
+    TPM_ST_NO_SESSIONS,
+    DEFAULT_CHUNK_SIZE,
+    command_template,
+    max_sequence_chunk,
+    prehash_digest,
+)
+from tpm_marshal import CommandBuilder
+from tpm_schema import (
+    TPMTTKVerified,
+    decode_hashsign_finish,
+    decode_hashverify_finish,
+    decode_response,
+    encode_GetCapability,
+    encode_GetRandom,
+    encode_HashSignDigest,
+    encode_HashSignStart,
+    encode_Startup,
+)
+
+_CREATE_PRIMARY_DILITHIUM = command_template("CreatePrimary(Dilithium)")
+_SEQUENCE_UPDATE = command_template("SequenceUpdate")
+_HASHSIGN_FINISH = command_template("HashSignFinish")
+_HASHVERIFY_FINISH = command_template("HashVerifyFinish")
+
+# Longest the link waits for any one answer, whether or not its caller still does
+LINK_TIMEOUT = 3600.0
+
+
+def _retrieve(task: asyncio.Task):
+    # Abandoned exchanges may fail with nobody awaiting them; don't warn about it
+    if not task.cancelled():
+        task.exception()
+
+
+class AsyncTPMClient:
+    """Coroutine counterpart of TPMClient for one AsyncUARTConnection"""
+
+    def __init__(
+        self,
+        uart: AsyncUARTConnection,
+        on_command=None,
+        on_response=None,
+        window: int = 1,
+        rx_slots: int = TPM_RX_SLOTS,
+        verbose: bool = False,
+        default_timeout: float = LINK_TIMEOUT,
+        timeouts: dict | None = None,
+    ):
+        self.uart = uart
+        self.verbose = verbose
+        self._on_command = on_command
+        self._on_response = on_response
+        # Max SequenceUpdate commands in flight. The TPM drops commands arriving while all
+        # of its receive slots (rx_slots, the firmware's TPM_RX_SLOTS) are busy, and the
+        # client would then wait forever for their answers
+        self.window = max(1, int(window))
+        if self.window > rx_slots:
+            raise ValueError(f"window {self.window} exceeds the TPM's {rx_slots} receive slots")
+        # Per-command caller timeouts by command name, e.g. {"HashSignFinish": 30}
+        self.default_timeout = default_timeout
+        self.timeouts = dict(timeouts or {})
+        self._marshal = CommandBuilder()
+        self._chunk_size = None
+        # One exchange on the link at a time; the last one may have lost its caller
+        self._link = asyncio.Lock()
+        self._exchange = None
+        self.link_error = None
+
+    # ---- internal helpers ----
+    def _log(self, msg: str):
+        if self.verbose:
+            print(msg)
+
+    def _emit_command(self, name: str, data: bytes, meta: dict | None = None):
+        if self._on_command:
+            try:
+                self._on_command(name, data, meta or {})
+            except Exception:
+                pass
+
+    def _emit_response(self, name: str, data: bytes, meta: dict | None = None):
+        if self._on_response:
+            try:
+                self._on_response(name, data, meta or {})
+            except Exception:
+                pass
+
+    async def _run(self, name: str, op, timeout: float | None):
+        """Run the link exchange `op()` after any earlier one; wait for it at most `timeout`"""
+        if timeout is None:
+            timeout = self.timeouts.get(name, self.default_timeout)
+        try:
+            return await asyncio.wait_for(self._submit(op), timeout)
+        except asyncio.TimeoutError:
+            # Not the builtin TimeoutError before Python 3.11
+            raise TimeoutError(f"{name}: no answer within {timeout:g}s") from None
+
+    async def _submit(self, op):
+        async with self._link:
+            prev = self._exchange
+            if prev is not None and not prev.done():
+                self._log("Waiting for the answer to an abandoned command...")
+                await asyncio.wait((prev,))
+            if self.link_error is not None:
+                raise ConnectionError(f"TPM link out of step: {self.link_error}")
+            task = asyncio.ensure_future(op())
+            task.add_done_callback(_retrieve)
+            self._exchange = task
+        # Cancelling the caller must not cancel a command that is already on the wire
+        return await asyncio.shield(task)
+
+    async def _read_response(self, name: str, handles_out: int = 0) -> bytes:
+        deadline = time.monotonic() + LINK_TIMEOUT
+        rsp = None
+        if await self.uart.wait_for_ready(timeout=LINK_TIMEOUT):
+            header = await self.uart.wait_for_bytes(10, timeout=max(0.0, deadline - time.monotonic()))
+            if header and len(header) == 10:
+                size = max(10, int.from_bytes(header[2:6], "big"))
+                body = await self.uart.wait_for_bytes(size - 10, timeout=max(0.0, deadline - time.monotonic()))
+                if body is not None and len(body) == size - 10:
+                    rsp = header + body
+        if rsp is None:
+            # Whatever arrives later can no longer be matched to a command
+            self.link_error = self.uart.link_error or f"no complete {name} answer"
+            raise RuntimeError(f"Failed to get {name}() answer, aborting")
+        self._log(f"{name}() response received")
+        self._emit_response(name, rsp, {"handles_out": handles_out})
+        return rsp
+
+    async def _transact(self, name: str, parts: tuple, handles_out: int = 0, timeout: float | None = None) -> bytes:
+        """Send one command (header and payload parts) and return its response"""
+
+        async def op():
+            self._log(f"Sending {name}...")
+            if self._on_command:
+                self._emit_command(name, b"".join(bytes(p) for p in parts), {"handles_out": handles_out})
+            await self.uart.send_bytes(*parts)
+            self._log(f"Waiting for {name} answer...")
+            return await self._read_response(name, handles_out)
+
+        return await self._run(name, op, timeout)
+
+    @staticmethod
+    def _check(name: str, rsp: bytes):
+        rc = int.from_bytes(rsp[6:10], "big")
+        if rc != 0:
+            raise RuntimeError(f"{name} failed rc=0x{rc:08X}")
+
+    def extract_first_handle_from_response(self, rsp: bytes) -> int:
+        if len(rsp) < 14:
+            raise RuntimeError("Response too short to contain a handle")
+        return int.from_bytes(rsp[10:14], byteorder="big")
+
+    async def wait_idle(self):
+        """Wait until the link is free, including answers to abandoned commands"""
+        async with self._link:
+            if self._exchange is not None:
+                await asyncio.wait((self._exchange,))
+
+    # ---- commands ----
+    async def startup_cmd(self, startup_type: str = "CLEAR", timeout: float | None = None):
+        st = (startup_type or "").strip().upper()
+        su_val = 1 if st in ("1", "STATE") else 0  # TPM_SU_STATE / TPM_SU_CLEAR
+        return await self._transact("Startup", (encode_Startup(self._marshal, su_val),), timeout=timeout)
+
+    async def get_random_cmd(self, num_bytes: int = 32, timeout: float | None = None):
+        num_bytes = max(1, min(0xFFFF, int(num_bytes)))
+        return await self._transact("GetRandom", (encode_GetRandom(self._marshal, num_bytes),), timeout=timeout)
+
+    async def get_capability_cmd(self, capability: int, prop: int, count: int, timeout: float | None = None):
+        """TPM2_GetCapability; returns the decoded response (more_data, capability_data)"""
+        bytestream = encode_GetCapability(self._marshal, capability, prop, count)
+        rsp = await self._transact("GetCapability", (bytestream,), timeout=timeout)
+        self._check("GetCapability", rsp)
+        return decode_response("GetCapability", rsp)
+
+    async def tpm_properties(self, first: int, count: int) -> dict:
+        """TPM_CAP_TPM_PROPERTIES in [first, first + count) as {property: value}"""
+        props = {}
+        end = first + count
+        while first < end:
+            rsp = await self.get_capability_cmd(TPM_CAP_TPM_PROPERTIES, first, end - first)
+            found = rsp.capability_data.data
+            for p in found:
+                if p.property < end:
+                    props[p.property] = p.value
+            if not rsp.more_data or not found:
+                break
+            first = found[-1].property + 1
+        return props
+
+    async def sequence_chunk_size(self) -> int:
+        """Largest SequenceUpdate chunk for this TPM; queried once, then cached"""
+        if self._chunk_size is None:
+            try:
+                props = await self.tpm_properties(
+                    TPM_PT_INPUT_BUFFER, TPM_PT_MAX_COMMAND_SIZE - TPM_PT_INPUT_BUFFER + 1
+                )
+                self._chunk_size = max_sequence_chunk(
+                    props[TPM_PT_INPUT_BUFFER], props[TPM_PT_MAX_COMMAND_SIZE]
+                )
+            except (RuntimeError, KeyError) as e:
+                self._log(f"TPM limits unavailable ({e}), using {DEFAULT_CHUNK_SIZE} B chunks")
+                self._chunk_size = DEFAULT_CHUNK_SIZE
+        return self._chunk_size
+
+    async def create_primary_dilithium_cmd(self, timeout: float | None = None):
+        return await self._transact(
+            "CreatePrimary(Dilithium)", (_CREATE_PRIMARY_DILITHIUM.render(),), handles_out=1, timeout=timeout
+        )
+
+    async def hashsign_start_cmd(
+        self, key_handle: int, total_len: int, key_pw: bytes = b"abcd", timeout: float | None = None
+    ) -> int:
+        bytestream = encode_HashSignStart(self._marshal, key_handle, int(total_len), auth=key_pw)
+        rsp = await self._transact("HashSignStart", (bytestream,), handles_out=1, timeout=timeout)
+        self._check("HashSignStart", rsp)
+        return self.extract_first_handle_from_response(rsp)
+
+    async def sequence_update_cmd(self, seq_handle: int, chunk, timeout: float | None = None) -> None:
+        header = _SEQUENCE_UPDATE.render(seq_handle, payload_len=len(chunk))
+        rsp = await self._transact("SequenceUpdate", (header, chunk), timeout=timeout)
+        self._check("SequenceUpdate", rsp)
+
+    async def sequence_update_stream(
+        self, seq_handle: int, data, chunk_size: int | None = None, timeout: float | None = None
+    ) -> int:
+        """Feed `data` to a sequence with up to `window` SequenceUpdates in flight.
+
+        Like TPMClient.sequence_update_stream; the whole stream is one exchange on
+        the link, so `timeout` (default: the "SequenceUpdate" timeout) covers all of it.
+        """
+        if chunk_size is None:
+            chunk_size = await self.sequence_chunk_size()
+
+        async def op():
+            in_flight = collections.deque()
+            failed_rc = 0
+            sent = 0
+            for chunk in _iter_chunks(data, chunk_size):
+                if len(in_flight) >= self.window:
+                    in_flight.popleft()
+                    rsp = await self._read_response("SequenceUpdate")
+                    failed_rc = failed_rc or int.from_bytes(rsp[6:10], "big")
+                    if failed_rc:
+                        break
+                header = _SEQUENCE_UPDATE.render(seq_handle, payload_len=len(chunk))
+                if self._on_command:
+                    self._emit_command("SequenceUpdate", header + bytes(chunk), {"handles_out": 0})
+                await self.uart.send_bytes(header, chunk)
+                in_flight.append(len(chunk))
+                sent += len(chunk)
+            # Drain everything in flight before reporting, so the link stays in sync
+            while in_flight:
+                in_flight.popleft()
+                rsp = await self._read_response("SequenceUpdate")
+                failed_rc = failed_rc or int.from_bytes(rsp[6:10], "big")
+            if failed_rc != 0:
+                raise RuntimeError(f"SequenceUpdate failed rc=0x{failed_rc:08X}")
+            return sent
+
+        return await self._run("SequenceUpdate", op, timeout)
+
+    async def hashsign_finish_cmd(self, seq_handle: int, timeout: float | None = None) -> bytes:
+        rsp = await self._transact("HashSignFinish", (_HASHSIGN_FINISH.render(seq_handle),), timeout=timeout)
+        self._check("HashSignFinish", rsp)
+        return bytes(decode_hashsign_finish(rsp).signature)
+
+    async def hashsign_digest_cmd(
+        self, key_handle: int, digest: bytes, key_pw: bytes = b"abcd", timeout: float | None = None
+    ) -> bytes:
+        bytestream = encode_HashSignDigest(self._marshal, key_handle, digest, auth=key_pw)
+        rsp = await self._transact("HashSignDigest", (bytestream,), timeout=timeout)
+        self._check("HashSignDigest", rsp)
+        return bytes(decode_response("HashSignDigest", rsp).signature.signature)
+
+    async def hashverify_start_cmd(
+        self, key_handle: int, total_len: int, signature: bytes, timeout: float | None = None
+    ) -> int:
+        m = self._marshal.begin(TPM_ST_NO_SESSIONS, TPM_CC_HashVerifyStart)
+        m.handle(key_handle)
+        m.u32(int(total_len))
+        # TPMT_SIGNATURE up to the TPM2B size; the signature itself is sent as-is
+        m.dilithium_signature_prefix(len(signature))
+        header = m.finish(len(signature))
+        rsp = await self._transact("HashVerifyStart", (header, signature), handles_out=1, timeout=timeout)
+        self._check("HashVerifyStart", rsp)
+        return self.extract_first_handle_from_response(rsp)
+
+    async def hashverify_finish_cmd(self, seq_handle: int, timeout: float | None = None) -> TPMTTKVerified:
+        rsp = await self._transact("HashVerifyFinish", (_HASHVERIFY_FINISH.render(seq_handle),), timeout=timeout)
+        self._check("HashVerifyFinish", rsp)
+        return decode_hashverify_finish(rsp)
+
+    # ---- whole flows ----
+    async def sign(
+        self, message, key_handle: int, key_pw: bytes = b"abcd", chunk_size: int | None = None, prehash: bool = False
+    ) -> bytes:
+        """HashSignStart, the SequenceUpdate stream and HashSignFinish for one message;
+        with `prehash`, one HashSignDigest over the message's prehash_digest()"""
+        if prehash:
+            return await self.hashsign_digest_cmd(key_handle, prehash_digest(message), key_pw=key_pw)
+        seq = await self.hashsign_start_cmd(key_handle, len(message), key_pw=key_pw)
+        await self.sequence_update_stream(seq, message, chunk_size=chunk_size)
+        return await self.hashsign_finish_cmd(seq)
+
+    async def verify(
+        self, message, signature: bytes, key_handle: int, chunk_size: int | None = None, prehashed: bool = False
+    ) -> TPMTTKVerified:
+        if prehashed:
+            message = prehash_digest(message)
+        seq = await self.hashverify_start_cmd(key_handle, len(message), signature)
+        await self.sequence_update_stream(seq, message, chunk_size=chunk_size)
+        return await self.hashverify_finish_cmd(seq)
+
+
+async def _device_worker(host: str, port: int, jobs: asyncio.Queue, results: list):
+    uart = await AsyncUARTConnection.open(tcp_host=host, tcp_port=port)
+    try:
+        client = AsyncTPMClient(uart)
+        if not await uart.wait_for_ready(timeout=180):
+            raise TimeoutError(f"{host}:{port}: no boot READY")
+        await client.startup_cmd("CLEAR")
+        key = client.extract_first_handle_from_response(await client.create_primary_dilithium_cmd())
+        while True:
+            try:
+                message = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results.append(await client.sign(message, key))
+    finally:
+        await uart.close()
+
+
+async def _run_jobs(host: str, ports: list, n_jobs: int, msg_size: int) -> float:
+    jobs = asyncio.Queue()
+    for _ in range(n_jobs):
+        jobs.put_nowait(os.urandom(msg_size))
+    results = []
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_device_worker(host, p, jobs, results) for p in ports))
+    elapsed = time.perf_counter() - t0
+    print(f"{len(results)} signatures on {len(ports)} device(s) in {elapsed:.2f}s ({len(results) / elapsed:.1f} sigs/s)")
+    return elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sign on several TPMs from one asyncio event loop")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--tcp-ports", type=int, nargs="+", help="serial2tcp ports of running sims")
+    target.add_argument("--standin", type=int, metavar="N", help="N in-process stand-ins")
+    parser.add_argument("--tcp-host", default="localhost")
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--msg-size", type=int, default=1024)
+    parser.add_argument(
+        "--sign-ms", type=float, default=50.0, help="Stand-in HashSignFinish time (--standin only)"
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    servers = []
+    host, ports = args.tcp_host, args.tcp_ports
+    if args.standin:
+        from tpm_standin import TPMStandIn
+
+        servers = [
+            TPMStandIn(port=0, backend="fake", latency={"HashSignFinish": args.sign_ms}).start()
+            for _ in range(args.standin)
+        ]
+        host, ports = servers[0].host, [s.port for s in servers]
+    try:
+        asyncio.run(_run_jobs(host, ports, args.jobs, args.msg_size))
+    finally:
+        for s in servers:
+            s.close()
+
+
+if __name__ == "__main__":
+    main()
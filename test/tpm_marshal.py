@@ -0,0 +1,131 @@
+"""Binary TPM command marshaling.
+
+Commands are packed with struct.pack_into into a bytearray that is reused from one
+command to the next; the header size is patched in by finish(). Large payloads
+(SequenceUpdate chunks, signatures) can be left out of the buffer: marshal only
+their TPM2B size with tpm2b_size(), pass the payload length to finish() and hand
+header and payload to UARTConnection.send_bytes() separately.
+
+    m = CommandBuilder()
+    m.begin(TPM_ST_SESSIONS, TPM_CC_SequenceUpdate)
+    m.handle(seq_handle)
+    m.pw_auth()
+    m.tpm2b_size(len(chunk))
+    header = m.finish(len(chunk))
+    uart.send_bytes(header, chunk)
+"""
+
+import struct
+
+from tpm_utils import (
+    TPM_ALG_DILITHIUM,
+    TPM_ALG_NULL,
+    TPM_ALG_SHA256,
+    TPM_RH_OWNER,
+)
+
+TPM_RS_PW = 0x40000009
+# fixedTPM | fixedParent | sensitiveDataOrigin | userWithAuth | noDA | sign
+DILITHIUM_KEY_ATTRIBUTES = 0x00040472
+
+_U8 = struct.Struct(">B")
+_U16 = struct.Struct(">H")
+_U32 = struct.Struct(">I")
+_HEADER = struct.Struct(">HII")  # tag, commandSize, commandCode
+# authorizationSize, sessionHandle, nonce.size, sessionAttributes, hmac.size
+_PW_AUTH = struct.Struct(">IIHBH")
+_PW_AUTH_ENTRY_SIZE = _PW_AUTH.size - 4
+# sigAlg, hash, TPM2B signature size
+_SIG_PREFIX = struct.Struct(">HHH")
+
+
+class CommandBuilder:
+    """Packs one command at a time into a reusable buffer"""
+
+    def __init__(self, capacity: int = 256):
+        self.buf = bytearray(capacity)
+        self.pos = 0
+
+    def reserve(self, n: int) -> int:
+        """Make room for n more bytes; returns the offset to write at"""
+        off = self.pos
+        if off + n > len(self.buf):
+            self.buf.extend(bytes(max(n, len(self.buf))))
+        self.pos = off + n
+        return off
+
+    def begin(self, tag: int, cc: int) -> "CommandBuilder":
+        self.pos = 0
+        _HEADER.pack_into(self.buf, self.reserve(_HEADER.size), tag, 0, cc)
+        return self
+
+    def u8(self, v: int):
+        _U8.pack_into(self.buf, self.reserve(1), v)
+
+    def u16(self, v: int):
+        _U16.pack_into(self.buf, self.reserve(2), v)
+
+    def u32(self, v: int):
+        _U32.pack_into(self.buf, self.reserve(4), v)
+
+    handle = u32
+
+    def raw(self, data):
+        off = self.reserve(len(data))
+        self.buf[off : off + len(data)] = data
+
+    def tpm2b(self, data):
+        self.u16(len(data))
+        self.raw(data)
+
+    def tpm2b_begin(self) -> int:
+        """Open a nested TPM2B; returns the token to pass to tpm2b_end()"""
+        return self.reserve(2)
+
+    def tpm2b_end(self, off: int):
+        _U16.pack_into(self.buf, off, self.pos - off - 2)
+
+    def tpm2b_size(self, n: int):
+        """TPM2B size field only; the n payload bytes are sent separately"""
+        self.u16(n)
+
+    def pw_auth(self, hmac: bytes = b""):
+        """Authorization area holding a single TPM_RS_PW session"""
+        off = self.reserve(_PW_AUTH.size)
+        _PW_AUTH.pack_into(
+            self.buf, off, _PW_AUTH_ENTRY_SIZE + len(hmac), TPM_RS_PW, 0, 0, len(hmac)
+        )
+        self.raw(hmac)
+
+    def dilithium_signature_prefix(self, sig_len: int):
+        """TPMT_SIGNATURE up to the signature bytes (sigAlg, hash NULL, TPM2B size)"""
+        _SIG_PREFIX.pack_into(
+            self.buf, self.reserve(_SIG_PREFIX.size), TPM_ALG_DILITHIUM, TPM_ALG_NULL, sig_len
+        )
+
+    def finish(self, trailing: int = 0) -> bytes:
+        """Patch commandSize (including `trailing` bytes sent separately) and return the command"""
+        _U32.pack_into(self.buf, 2, self.pos + trailing)
+        return bytes(memoryview(self.buf)[: self.pos])
+
+
+def create_primary_dilithium(
+    m: CommandBuilder,
+    user_auth: bytes = b"abcd",
+    security_level: int = 2,
+    object_attributes: int = DILITHIUM_KEY_ATTRIBUTES,
+) -> bytes:
+    """TPM2_CreatePrimary under the owner hierarchy for a Dilithium signing key"""
+    # tpm_schema builds its encoders on top of this module, so import it lazily
+    from tpm_schema import TPMSDilithiumParms, TPMSSensitiveCreate, TPMTPublic, encode_CreatePrimary
+
+    public = TPMTPublic(
+        TPM_ALG_DILITHIUM,
+        TPM_ALG_SHA256,  # nameAlg
+        object_attributes,
+        b"",  # authPolicy
+        TPMSDilithiumParms(TPM_ALG_NULL, TPM_ALG_NULL, security_level),
+        b"",  # unique
+    )
+    # empty owner auth, empty sensitive data, outsideInfo and creationPCR
+    return encode_CreatePrimary(m, TPM_RH_OWNER, TPMSSensitiveCreate(user_auth, b""), public, b"", [])
@@ -0,0 +1,257 @@
+"""Host-side TPM traffic metrics, served as OpenMetrics text for Prometheus-style scrapers.
+
+    registry = MetricsRegistry()
+    registry.add_client(client)          # its UARTConnection too
+    server = MetricsServer(registry, port=9464).start()
+    ...                                  # curl localhost:9464/metrics
+
+Exposed per device (label `device`, the link endpoint unless named): bytes in/out,
+link syscalls, commands per opcode, responses per opcode and rc, timeouts by what was
+waited for, READY wait time, per-phase command latency (tpm_timing), send queue depth,
+unread receive bytes and commands in flight; add_pool() adds the TPMPool job queues.
+
+Collection is pull-based: UARTConnection and TPMClient only bump plain counters and
+histograms as they already do, and everything is read when a scrape comes in, on the
+server's thread. Scrapes never take the receive ring lock, so they cannot stall the
+read/write workers; values read mid-update are at most one event behind.
+"""
+
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tpm_timing import PHASES
+
+METRICS_PORT = 9464
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+QUANTILES = (50, 90, 99)
+
+
+class Metric:
+    """One metric family: `samples` are (suffix, labels, value)"""
+
+    __slots__ = ("name", "kind", "help", "samples")
+
+    def __init__(self, name: str, kind: str, help: str):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = []
+
+    def add(self, value, suffix: str = "", **labels):
+        self.samples.append((suffix, labels, value))
+        return self
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value) -> str:
+    return repr(value) if isinstance(value, float) else str(int(value))
+
+
+def render(metrics: list) -> str:
+    """OpenMetrics text exposition of `metrics`, merging families that share a name"""
+    families = {}
+    for m in metrics:
+        family = families.get(m.name)
+        if family is None:
+            families[m.name] = m
+        else:
+            family.samples.extend(m.samples)
+    lines = []
+    for m in families.values():
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.append(f"# HELP {m.name} {_escape(m.help)}")
+        for suffix, labels, value in m.samples:
+            label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            label_text = f"{{{label_text}}}" if label_text else ""
+            lines.append(f"{m.name}{suffix}{label_text} {_format_value(value)}")
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def _summary(metric: Metric, hist, scale: float = 1e9, **labels):
+    """LatencyHistogram (ns) as summary samples in seconds"""
+    count = hist.count
+    for q in QUANTILES:
+        metric.add(hist.percentile(q) / scale if count else 0.0, quantile=f"{q / 100:g}", **labels)
+    metric.add(hist.total / scale, "_sum", **labels)
+    metric.add(count, "_count", **labels)
+
+
+class MetricsRegistry:
+    """Collectors called on every scrape; each returns a list of Metric"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._errors = 0
+
+    def register(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def unregister(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self) -> list:
+        with self._lock:
+            collectors = list(self._collectors)
+        metrics = []
+        t0 = time.perf_counter()
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception:
+                # A closed device must not break the scrape for the others
+                self._errors += 1
+        metrics.append(
+            Metric("tpm_metrics_collect_seconds", "gauge", "Time the last scrape spent collecting").add(
+                time.perf_counter() - t0
+            )
+        )
+        metrics.append(
+            Metric("tpm_metrics_collect_errors", "counter", "Collectors that raised").add(self._errors, "_total")
+        )
+        return metrics
+
+    def render(self) -> str:
+        return render(self.collect())
+
+    # ---- sources ----
+    def add_uart(self, uart, device: str | None = None):
+        """Link counters of a UARTConnection"""
+        device = device or uart.name or uart.endpoint or "tpm"
+
+        def collect():
+            rx, tx = uart.rx_stats.copy(), uart.tx_stats.copy()
+            timeouts = uart.timeouts.copy()
+            ready = Metric("tpm_ready_wait_seconds", "summary", "Time from waiting for READY to receiving it")
+            _summary(ready, uart.ready_wait, device=device)
+            syscalls = Metric("tpm_link_syscalls", "counter", "Link select/read/write calls")
+            syscalls.add(rx["select_calls"], "_total", device=device, call="select")
+            syscalls.add(rx["read_calls"], "_total", device=device, call="read")
+            syscalls.add(tx["write_calls"], "_total", device=device, call="write")
+            timeout = Metric("tpm_timeouts", "counter", "Waits that timed out, by what was waited for")
+            for wait in ("ready", "read", "send"):
+                timeout.add(timeouts.get(wait, 0), "_total", device=device, wait=wait)
+            return [
+                Metric("tpm_received_bytes", "counter", "Bytes read from the link").add(
+                    rx["bytes_read"], "_total", device=device
+                ),
+                Metric("tpm_sent_bytes", "counter", "Bytes written to the link").add(
+                    tx["bytes_written"], "_total", device=device
+                ),
+                syscalls,
+                Metric("tpm_link_up", "gauge", "1 while the link has not failed").add(
+                    int(uart.running and uart.link_error is None), device=device
+                ),
+                Metric("tpm_send_queue_depth", "gauge", "Commands queued for the write worker").add(
+                    uart.send_queue.qsize(), device=device
+                ),
+                Metric("tpm_rx_buffered_bytes", "gauge", "Received bytes not consumed yet").add(
+                    uart.rx_buffered(), device=device
+                ),
+                ready,
+                timeout,
+            ]
+
+        return self.register(collect)
+
+    def add_client(self, client, device: str | None = None, with_uart: bool = True):
+        """Command counters and phase latencies of a TPMClient (and its UARTConnection)"""
+        uart = client.uart
+        device = device or uart.name or uart.endpoint or "tpm"
+        if with_uart:
+            self.add_uart(uart, device)
+
+        def collect():
+            commands = Metric("tpm_commands", "counter", "Commands sent, by opcode")
+            for name, n in client.commands_sent.copy().items():
+                commands.add(n, "_total", device=device, command=name)
+            responses = Metric("tpm_responses", "counter", "Responses received, by opcode and response code")
+            for (name, rc), n in client.response_codes.copy().items():
+                responses.add(n, "_total", device=device, command=name, rc=f"0x{rc:03X}")
+            phases = Metric("tpm_command_phase_seconds", "summary", "Command latency per phase (tpm_timing)")
+            timings = client.timings
+            for name in timings.names():
+                for phase in PHASES:
+                    _summary(phases, timings.histogram(name, phase), device=device, command=name, phase=phase)
+            in_flight = Metric("tpm_commands_in_flight", "gauge", "Commands sent and not answered yet").add(
+                client.commands_in_flight(), device=device
+            )
+            return [commands, responses, phases, in_flight]
+
+        return self.register(collect)
+
+    def add_pool(self, pool):
+        """Every TPMPool device, plus its job queue and completion counters"""
+        for dev in pool.devices:
+            self.add_client(dev.client, dev.name)
+
+        def collect():
+            queued = Metric("tpm_pool_jobs_queued", "gauge", "Jobs waiting for a device")
+            outstanding = Metric("tpm_pool_outstanding_bytes", "gauge", "Message bytes queued or running")
+            up = Metric("tpm_pool_device_up", "gauge", "1 while the pool dispatches to the device")
+            jobs = Metric("tpm_pool_jobs", "counter", "Finished jobs, by result")
+            for s, dev in zip(pool.stats(), pool.devices):
+                queued.add(dev.jobs.qsize(), device=s["device"])
+                outstanding.add(s["outstanding"], device=s["device"])
+                up.add(int(s["alive"]), device=s["device"])
+                jobs.add(s["completed"], "_total", device=s["device"], result="completed")
+                jobs.add(s["errors"], "_total", device=s["device"], result="error")
+            return [queued, outstanding, up, jobs]
+
+        return self.register(collect)
+
+
+class MetricsServer:
+    """HTTP endpoint serving registry.render() at /metrics, on a daemon thread"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = METRICS_PORT):
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_metrics_args(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help=f"Serve OpenMetrics on this port (e.g. {METRICS_PORT}); off by default",
+    )
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="Address for --metrics-port")
@@ -0,0 +1,388 @@
+"""Pool of Petalite TPMs with least-outstanding-work dispatch.
+
+Each device (a sim on its own serial2tcp port, see `soc/main.py --tcp-port`, or a
+board on its own serial port) gets a UARTConnection, a TPMClient, its own Dilithium
+primary key and one worker thread. Sign jobs go to the live device with the fewest
+outstanding bytes of work; verify jobs go to the device whose key made the signature.
+A health thread probes idle devices and evicts dead or hung links, re-dispatching
+their queued sign jobs to the remaining devices.
+
+    pool = TPMPool.tcp(ports=[4327, 4328, 4329])
+    futures = [pool.submit_sign(m) for m in messages]
+    sigs = [f.result() for f in futures]
+    pool.close()
+
+    python tpm_pool.py --tcp-ports 4327 4328 --jobs 200
+    python tpm_pool.py --standin 4 --jobs 200       # scaling run on in-process stand-ins
+
+With a key_cache.KeyCache (`--key-cache PATH`) each device keeps its key persistent
+and a restarted pool provisions it with one ReadPublic instead of CreatePrimary.
+`--metrics-port 9464` serves the pool's traffic metrics (tpm_metrics) while it runs.
+"""
+
+import os
+import time
+import queue
+import argparse
+import threading
+import concurrent.futures
+
+from uart import UARTConnection
+from tpm_client import TPMClient
+from key_cache import KeyCache
+from tpm_metrics import MetricsRegistry, MetricsServer, add_metrics_args
+from tpm_marshal import CommandBuilder
+from tpm_schema import encode_GetRandom
+
+# Fixed per-job cost (in message-byte equivalents) for HashSignStart/Finish
+JOB_FIXED_COST = 4096
+
+
+class _Job:
+    def __init__(self, kind: str, message: bytes, signature: bytes = None, device: str = None):
+        self.kind = kind
+        self.message = message
+        self.signature = signature
+        self.device = device  # pinned device name (verify jobs)
+        self.cost = len(message) + JOB_FIXED_COST
+        self.attempts = 0
+        self.future = concurrent.futures.Future()
+
+
+class _PoolDevice:
+    def __init__(self, name: str, uart: UARTConnection, window: int, key_cache=None):
+        self.name = name
+        self.uart = uart
+        self.client = TPMClient(uart, window=window, verbose=False, key_cache=key_cache)
+        self.lock = threading.Lock()  # one TPM conversation at a time
+        self.jobs = queue.Queue()
+        self.outstanding = 0  # bytes of queued + running work (guarded by pool lock)
+        self.alive = True
+        self.key_handle = None
+        self.pubkey = None
+        self.busy_since = None
+        self.completed = 0
+        self.errors = 0
+        self.thread = None
+
+
+class TPMPool:
+    """Load-balanced dispatch of Dilithium sign/verify jobs over several TPMs"""
+
+    def __init__(
+        self,
+        uarts: list,
+        names: list | None = None,
+        window: int = 1,
+        chunk_size: int | None = None,
+        health_interval: float = 5.0,
+        probe_timeout: float = 10.0,
+        job_timeout: float = 600.0,
+        max_attempts: int = 2,
+        wait_boot: bool = True,
+        key_cache=None,
+    ):
+        names = names or [f"tpm{i}" for i in range(len(uarts))]
+        self.devices = [_PoolDevice(n, u, window, key_cache) for n, u in zip(names, uarts)]
+        self.chunk_size = chunk_size  # None: per device, from its GetCapability limits
+        self.health_interval = health_interval
+        self.probe_timeout = probe_timeout
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # Provision all devices in parallel (boot READY, Startup, primary key)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.devices) or 1) as ex:
+            list(ex.map(lambda d: self._provision(d, wait_boot), self.devices))
+        if not any(d.alive for d in self.devices):
+            raise RuntimeError("No TPM device could be provisioned")
+
+        for dev in self.devices:
+            dev.thread = threading.Thread(target=self._worker, args=(dev,), daemon=True)
+            dev.thread.start()
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    @classmethod
+    def tcp(cls, ports: list, host: str = "localhost", connect_timeout: int = 600, **kwargs):
+        """Several sims (or stand-ins) on their own serial2tcp ports"""
+        uarts = _open_all(
+            lambda p: UARTConnection(
+                mode="tcp", tcp_host=host, tcp_port=p, tcp_connect_timeout=connect_timeout, debug=False
+            ),
+            ports,
+        )
+        return cls(uarts, names=[f"{host}:{p}" for p in ports], **kwargs)
+
+    @classmethod
+    def serial(cls, devs: list, baudrate: int = 115200, **kwargs):
+        """Several boards, one serial port each"""
+        uarts = _open_all(
+            lambda d: UARTConnection(mode="serial", serial_port=d, baudrate=baudrate, debug=False),
+            devs,
+        )
+        return cls(uarts, names=list(devs), **kwargs)
+
+    def _console(self, msg: str):
+        print(f"[pool] {msg}")
+
+    # ---- provisioning / health ----
+    def _provision(self, dev: _PoolDevice, wait_boot: bool):
+        try:
+            if wait_boot and not dev.uart.wait_for_ready(timeout=180):
+                raise TimeoutError("no boot READY")
+            # Startup may legitimately fail with TPM_RC_INITIALIZE on a warm device
+            dev.client.startup_cmd("CLEAR")
+            dev.key_handle = dev.client.dilithium_key()
+            dev.pubkey = dev.client.signing_pubkey
+        except Exception as e:
+            self._console(f"{dev.name}: provisioning failed ({e}), not using it")
+            dev.alive = False
+            dev.uart.close()
+
+    def _link_broken(self, dev: _PoolDevice) -> bool:
+        return dev.uart.link_error is not None or not dev.uart.running
+
+    def _probe(self, dev: _PoolDevice) -> bool:
+        """GetRandom round trip with a short timeout (caller holds dev.lock)"""
+        if self._link_broken(dev):
+            return False
+        dev.uart.send_bytes(encode_GetRandom(CommandBuilder(), 8))
+        if not dev.uart.wait_for_ready(timeout=self.probe_timeout):
+            return False
+        header = dev.uart.wait_for_bytes(10, timeout=self.probe_timeout)
+        if not header or len(header) < 10:
+            return False
+        size = int.from_bytes(header[2:6], "big")
+        body = dev.uart.wait_for_bytes(size - 10, timeout=self.probe_timeout) if size > 10 else b""
+        return body is not None
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for dev in self.devices:
+                if not dev.alive:
+                    continue
+                busy_since = dev.busy_since
+                if busy_since is not None:
+                    if time.monotonic() - busy_since > self.job_timeout:
+                        self._evict(dev, f"job running for more than {self.job_timeout:.0f}s")
+                    continue
+                if not dev.lock.acquire(blocking=False):
+                    continue
+                try:
+                    healthy = self._probe(dev)
+                finally:
+                    dev.lock.release()
+                if not healthy:
+                    self._evict(dev, dev.uart.link_error or "health probe failed")
+
+    def _evict(self, dev: _PoolDevice, reason):
+        with self._lock:
+            if not dev.alive:
+                return
+            dev.alive = False
+            stranded = []
+            while True:
+                try:
+                    job = dev.jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is not None:
+                    dev.outstanding -= job.cost
+                    stranded.append(job)
+            dev.jobs.put(None)  # let the worker exit after its current job
+        self._console(f"{dev.name}: evicted ({reason})")
+        # Closing wakes a worker blocked on this link
+        dev.uart.close()
+        for job in stranded:
+            self._redispatch(job, dev, reason)
+
+    # ---- dispatch ----
+    def _dispatch(self, job: _Job):
+        with self._lock:
+            if job.device is not None:
+                candidates = [d for d in self.devices if d.alive and d.name == job.device]
+            else:
+                candidates = [d for d in self.devices if d.alive]
+            if not candidates:
+                what = f"device {job.device}" if job.device else "TPM devices"
+                job.future.set_exception(RuntimeError(f"No live {what} for {job.kind} job"))
+                return job.future
+            # Least outstanding work; list order breaks ties
+            dev = min(candidates, key=lambda d: d.outstanding)
+            dev.outstanding += job.cost
+            dev.jobs.put(job)
+        return job.future
+
+    def _redispatch(self, job: _Job, dev: _PoolDevice, reason):
+        job.attempts += 1
+        if job.device is not None or job.attempts >= self.max_attempts:
+            job.future.set_exception(ConnectionError(f"{dev.name} failed: {reason}"))
+            return
+        self._dispatch(job)
+
+    def _run_job(self, dev: _PoolDevice, job: _Job):
+        client = dev.client
+        if job.kind == "sign":
+            seq = client.hashsign_start_cmd(dev.key_handle, len(job.message), key_pw=b"abcd")
+            client.sequence_update_stream(seq, job.message, chunk_size=self.chunk_size)
+            sig = client.hashsign_finish_cmd(seq)
+            return {"device": dev.name, "signature": sig, "pubkey": dev.pubkey}
+        seq = client.hashverify_start_cmd(dev.key_handle, len(job.message), job.signature)
+        client.sequence_update_stream(seq, job.message, chunk_size=self.chunk_size)
+        ticket = client.hashverify_finish_cmd(seq)
+        return {"device": dev.name, "ticket": ticket}
+
+    def _worker(self, dev: _PoolDevice):
+        while True:
+            job = dev.jobs.get()
+            if job is None:
+                return
+            dev.busy_since = time.monotonic()
+            try:
+                with dev.lock:
+                    result = self._run_job(dev, job)
+            except Exception as e:
+                dev.errors += 1
+                with self._lock:
+                    dev.outstanding -= job.cost
+                if self._link_broken(dev) or isinstance(e, (ConnectionError, TimeoutError)):
+                    self._evict(dev, e)
+                    self._redispatch(job, dev, e)
+                else:
+                    job.future.set_exception(e)
+            else:
+                dev.completed += 1
+                with self._lock:
+                    dev.outstanding -= job.cost
+                job.future.set_result(result)
+            finally:
+                dev.busy_since = None
+
+    # ---- public API ----
+    def submit_sign(self, message: bytes) -> concurrent.futures.Future:
+        """Queue a HashSign; the future resolves to {device, signature, pubkey}"""
+        return self._dispatch(_Job("sign", bytes(message)))
+
+    def submit_verify(self, message: bytes, signature: bytes, device: str) -> concurrent.futures.Future:
+        """Queue a HashVerify on `device` (the one whose key produced `signature`)"""
+        return self._dispatch(_Job("verify", bytes(message), bytes(signature), device))
+
+    def sign(self, message: bytes) -> dict:
+        return self.submit_sign(message).result()
+
+    def verify(self, message: bytes, signed: dict) -> dict:
+        return self.submit_verify(message, signed["signature"], signed["device"]).result()
+
+    def stats(self) -> list:
+        return [
+            {
+                "device": d.name,
+                "alive": d.alive,
+                "completed": d.completed,
+                "errors": d.errors,
+                "outstanding": d.outstanding,
+            }
+            for d in self.devices
+        ]
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            for dev in self.devices:
+                dev.jobs.put(None)
+        for dev in self.devices:
+            if dev.thread is not None:
+                dev.thread.join(timeout=5)
+            dev.uart.close()
+
+
+def _open_all(open_fn, endpoints):
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(endpoints) or 1) as ex:
+        return list(ex.map(open_fn, endpoints))
+
+
+def _run_jobs(pool: TPMPool, jobs: int, msg_size: int, verify: bool) -> float:
+    messages = [os.urandom(msg_size) for _ in range(jobs)]
+    t0 = time.perf_counter()
+    signed = [f.result() for f in [pool.submit_sign(m) for m in messages]]
+    elapsed = time.perf_counter() - t0
+    if verify:
+        for f in [pool.submit_verify(m, s["signature"], s["device"]) for m, s in zip(messages, signed)]:
+            f.result()
+    return elapsed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dispatch HashSign jobs over a pool of TPMs")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--tcp-ports", type=int, nargs="+", help="serial2tcp ports of running sims")
+    target.add_argument("--serial-devs", nargs="+", help="Serial ports of boards")
+    target.add_argument("--standin", type=int, metavar="N", help="Scale 1..N in-process stand-ins")
+    parser.add_argument("--tcp-host", default="localhost")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--msg-size", type=int, default=1024)
+    parser.add_argument("--window", type=int, default=1, help="SequenceUpdates in flight per device")
+    parser.add_argument("--verify", action="store_true", help="Also verify every signature")
+    parser.add_argument(
+        "--sign-ms", type=float, default=50.0, help="Stand-in HashSignFinish time (--standin only)"
+    )
+    parser.add_argument("--key-cache", metavar="PATH", help="Keep device keys persistent, cached in PATH")
+    add_metrics_args(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    key_cache = KeyCache(args.key_cache) if args.key_cache else None
+    if args.standin:
+        from tpm_standin import TPMStandIn
+
+        print(f"{'devices':>7}  {'sigs/s':>8}  {'scaling':>7}")
+        base = None
+        for n in range(1, args.standin + 1):
+            servers = [
+                TPMStandIn(port=0, backend="fake", latency={"HashSignFinish": args.sign_ms}).start()
+                for _ in range(n)
+            ]
+            pool = TPMPool.tcp(
+                [s.port for s in servers], host=servers[0].host, window=args.window, key_cache=key_cache
+            )
+            try:
+                rate = args.jobs / _run_jobs(pool, args.jobs, args.msg_size, args.verify)
+            finally:
+                pool.close()
+                for s in servers:
+                    s.close()
+            base = base or rate
+            print(f"{n:>7}  {rate:>8.1f}  {rate / base:>6.2f}x")
+        return
+
+    if args.tcp_ports:
+        pool = TPMPool.tcp(args.tcp_ports, host=args.tcp_host, window=args.window, key_cache=key_cache)
+    else:
+        pool = TPMPool.serial(args.serial_devs, baudrate=args.baud, window=args.window, key_cache=key_cache)
+    metrics = None
+    if args.metrics_port is not None:
+        registry = MetricsRegistry()
+        registry.add_pool(pool)
+        metrics = MetricsServer(registry, host=args.metrics_host, port=args.metrics_port).start()
+        print(f"Metrics on http://{metrics.host}:{metrics.port}/metrics")
+    try:
+        elapsed = _run_jobs(pool, args.jobs, args.msg_size, args.verify)
+        print(f"{args.jobs} signatures in {elapsed:.2f}s ({args.jobs / elapsed:.1f} sigs/s)")
+        for row in pool.stats():
+            print(
+                f"  {row['device']:<20} {'up' if row['alive'] else 'DOWN':<5} "
+                f"completed={row['completed']} errors={row['errors']}"
+            )
+    finally:
+        if metrics is not None:
+            metrics.close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,695 @@
+"""Declarative schema for the TPM structures and commands the tools use.
+
+Types are declared once below; at import time they are compiled into plain Python
+source (adjacent fixed-size fields merged into one struct.unpack_from/pack_into)
+and exec'd, giving per-type and per-command functions:
+
+    decode_TPMT_SIGNATURE(buf, off) -> (TPMTSignature, end)
+    encode_TPMT_PUBLIC(m, value)                       # m is a tpm_marshal.CommandBuilder
+    encode_command(m, "HashSignStart", key_handle=h, total_len=n, auth=b"abcd") -> bytes
+    decode_response("HashSignFinish", rsp).signature   # TPMTSignature, .signature is a view
+    segment_command(data) / segment_response(data, "HashSignFinish")   # dashboard
+
+TPM2B fields decode to memoryviews of the input buffer. Adding an opcode is one
+COMMANDS entry; `python tpm_schema.py` prints the generated source.
+"""
+
+import struct
+
+from tpm_utils import (
+    TPM_ALG_DILITHIUM,
+    TPM_ALG_ECC,
+    TPM_CAP_TPM_PROPERTIES,
+    TPM_CC_NAMES,
+    TPM_CC_Startup,
+    TPM_CC_GetRandom,
+    TPM_CC_CreatePrimary,
+    TPM_CC_HashSignStart,
+    TPM_CC_SequenceUpdate,
+    TPM_CC_HashSignFinish,
+    TPM_CC_HashVerifyStart,
+    TPM_CC_HashVerifyFinish,
+    TPM_CC_HashSignDigest,
+    TPM_CC_ReadPerfCounters,
+    TPM_CC_GetCapability,
+    TPM_CC_EvictControl,
+    TPM_CC_ReadPublic,
+    TPM_CC_FlushContext,
+    TPM_HEADER_SIZE,
+    TPM_ST_NO_SESSIONS,
+    TPM_ST_SESSIONS,
+)
+from tpm_marshal import TPM_RS_PW
+
+
+# ---- type kinds ----
+class Prim:
+    def __init__(self, name: str, fmt: str):
+        self.name = name
+        self.fmt = fmt
+
+
+class TPM2B:
+    """Size-prefixed byte buffer; decodes to a memoryview"""
+
+    def __init__(self, name: str, size_fmt: str = "H"):
+        self.name = name
+        self.size_fmt = size_fmt
+
+
+class Struct:
+    """Ordered fields; `segments` = (header label, payload label, tag) highlights a
+    structure ending in a TPM2B in the dashboard (e.g. signature header / signature)"""
+
+    def __init__(self, name: str, fields: list, py_name: str | None = None, segments: tuple | None = None):
+        self.name = name
+        self.fields = fields
+        self.py_name = py_name or name
+        self.segments = segments
+
+
+class Sized:
+    """TPM2B wrapping a structure (TPM2B_PUBLIC, TPM2B_SENSITIVE_CREATE)"""
+
+    def __init__(self, name: str, inner: Struct):
+        self.name = name
+        self.inner = inner
+
+
+class Union:
+    """Member selected by an earlier field of the same structure (TPMU_*)"""
+
+    def __init__(self, name: str, selector: str, cases: dict):
+        self.name = name
+        self.selector = selector
+        self.cases = cases
+
+
+class List:
+    """UINT32 count followed by `count` elements (TPML_*)"""
+
+    def __init__(self, name: str, elem):
+        self.name = name
+        self.elem = elem
+
+
+class Command:
+    def __init__(self, name, cc, tag, handles=(), params=(), rsp_handles=(), rsp_params=()):
+        self.name = name
+        self.cc = cc
+        self.tag = tag
+        self.handles = tuple(handles)
+        self.params = list(params)
+        self.rsp_handles = tuple(rsp_handles)
+        # Leading response parameters to decode; anything after them is left alone
+        self.rsp_params = list(rsp_params)
+
+
+# ---- schema ----
+UINT8 = Prim("UINT8", "B")
+UINT16 = Prim("UINT16", "H")
+UINT32 = Prim("UINT32", "I")
+TPM_ALG_ID = Prim("TPM_ALG_ID", "H")
+TPM_ST = Prim("TPM_ST", "H")
+TPM_HANDLE = Prim("TPM_HANDLE", "I")
+TPMA_OBJECT = Prim("TPMA_OBJECT", "I")
+TPMA_SESSION = Prim("TPMA_SESSION", "B")
+TPMI_YES_NO = Prim("TPMI_YES_NO", "B")
+
+TPM2B_DIGEST = TPM2B("TPM2B_DIGEST")
+TPM2B_NONCE = TPM2B("TPM2B_NONCE")
+TPM2B_AUTH = TPM2B("TPM2B_AUTH")
+TPM2B_DATA = TPM2B("TPM2B_DATA")
+TPM2B_SENSITIVE_DATA = TPM2B("TPM2B_SENSITIVE_DATA")
+TPM2B_MAX_BUFFER = TPM2B("TPM2B_MAX_BUFFER")
+TPM2B_PUBLIC_KEY_DILITHIUM = TPM2B("TPM2B_PUBLIC_KEY_DILITHIUM")
+TPM2B_SIGNATURE_DILITHIUM = TPM2B("TPM2B_SIGNATURE_DILITHIUM")
+TPM2B_ECC_PARAMETER = TPM2B("TPM2B_ECC_PARAMETER")
+TPM2B_NAME = TPM2B("TPM2B_NAME")
+
+TPMS_AUTH_COMMAND = Struct(
+    "TPMS_AUTH_COMMAND",
+    [
+        ("session_handle", TPM_HANDLE),
+        ("nonce", TPM2B_NONCE),
+        ("session_attributes", TPMA_SESSION),
+        ("hmac", TPM2B_AUTH),
+    ],
+    py_name="TPMSAuthCommand",
+)
+TPMS_SENSITIVE_CREATE = Struct(
+    "TPMS_SENSITIVE_CREATE",
+    [("user_auth", TPM2B_AUTH), ("data", TPM2B_SENSITIVE_DATA)],
+    py_name="TPMSSensitiveCreate",
+)
+TPMS_DILITHIUM_PARMS = Struct(
+    "TPMS_DILITHIUM_PARMS",
+    [("symmetric", TPM_ALG_ID), ("scheme", TPM_ALG_ID), ("security_level", UINT8)],
+    py_name="TPMSDilithiumParms",
+)
+# NULL symmetric and kdf, scheme with a hash (as used by tpm.py's ECC template)
+TPMS_ECC_PARMS = Struct(
+    "TPMS_ECC_PARMS",
+    [
+        ("symmetric", TPM_ALG_ID),
+        ("scheme", TPM_ALG_ID),
+        ("scheme_hash", TPM_ALG_ID),
+        ("curve_id", UINT16),
+        ("kdf", TPM_ALG_ID),
+    ],
+    py_name="TPMSEccParms",
+)
+TPMS_ECC_POINT = Struct(
+    "TPMS_ECC_POINT", [("x", TPM2B_ECC_PARAMETER), ("y", TPM2B_ECC_PARAMETER)], py_name="TPMSEccPoint"
+)
+TPMT_PUBLIC = Struct(
+    "TPMT_PUBLIC",
+    [
+        ("type", TPM_ALG_ID),
+        ("name_alg", TPM_ALG_ID),
+        ("object_attributes", TPMA_OBJECT),
+        ("auth_policy", TPM2B_DIGEST),
+        (
+            "parameters",
+            Union("TPMU_PUBLIC_PARMS", "type", {TPM_ALG_DILITHIUM: TPMS_DILITHIUM_PARMS, TPM_ALG_ECC: TPMS_ECC_PARMS}),
+        ),
+        (
+            "unique",
+            Union("TPMU_PUBLIC_ID", "type", {TPM_ALG_DILITHIUM: TPM2B_PUBLIC_KEY_DILITHIUM, TPM_ALG_ECC: TPMS_ECC_POINT}),
+        ),
+    ],
+    py_name="TPMTPublic",
+)
+TPM2B_PUBLIC = Sized("TPM2B_PUBLIC", TPMT_PUBLIC)
+TPM2B_SENSITIVE_CREATE = Sized("TPM2B_SENSITIVE_CREATE", TPMS_SENSITIVE_CREATE)
+TPMS_PCR_SELECTION = Struct(
+    "TPMS_PCR_SELECTION", [("hash", TPM_ALG_ID), ("pcr_select", TPM2B("PCR_SELECT", "B"))], py_name="TPMSPcrSelection"
+)
+TPML_PCR_SELECTION = List("TPML_PCR_SELECTION", TPMS_PCR_SELECTION)
+TPMT_SIGNATURE = Struct(
+    "TPMT_SIGNATURE",
+    [("sig_alg", TPM_ALG_ID), ("hash_alg", TPM_ALG_ID), ("signature", TPM2B_SIGNATURE_DILITHIUM)],
+    py_name="TPMTSignature",
+    segments=("sigHdr", "sig", "sig"),
+)
+TPMT_TK_VERIFIED = Struct(
+    "TPMT_TK_VERIFIED",
+    [("tag", TPM_ST), ("hierarchy", TPM_HANDLE), ("digest", TPM2B_DIGEST)],
+    py_name="TPMTTKVerified",
+)
+TPMS_TAGGED_PROPERTY = Struct(
+    "TPMS_TAGGED_PROPERTY", [("property", UINT32), ("value", UINT32)], py_name="TPMSTaggedProperty"
+)
+TPML_TAGGED_TPM_PROPERTY = List("TPML_TAGGED_TPM_PROPERTY", TPMS_TAGGED_PROPERTY)
+TPMS_CAPABILITY_DATA = Struct(
+    "TPMS_CAPABILITY_DATA",
+    [
+        ("capability", UINT32),
+        ("data", Union("TPMU_CAPABILITIES", "capability", {TPM_CAP_TPM_PROPERTIES: TPML_TAGGED_TPM_PROPERTY})),
+    ],
+    py_name="TPMSCapabilityData",
+)
+
+STRUCTS = [
+    TPMS_AUTH_COMMAND,
+    TPMS_SENSITIVE_CREATE,
+    TPMS_DILITHIUM_PARMS,
+    TPMS_ECC_PARMS,
+    TPMS_ECC_POINT,
+    TPMT_PUBLIC,
+    TPMS_PCR_SELECTION,
+    TPMT_SIGNATURE,
+    TPMT_TK_VERIFIED,
+    TPMS_TAGGED_PROPERTY,
+    TPMS_CAPABILITY_DATA,
+]
+
+COMMANDS = [
+    Command("Startup", TPM_CC_Startup, TPM_ST_NO_SESSIONS, params=[("startup_type", UINT16)]),
+    Command(
+        "GetRandom",
+        TPM_CC_GetRandom,
+        TPM_ST_NO_SESSIONS,
+        params=[("bytes_requested", UINT16)],
+        rsp_params=[("random_bytes", TPM2B_DIGEST)],
+    ),
+    Command(
+        "CreatePrimary",
+        TPM_CC_CreatePrimary,
+        TPM_ST_SESSIONS,
+        handles=["primary_handle"],
+        params=[
+            ("in_sensitive", TPM2B_SENSITIVE_CREATE),
+            ("in_public", TPM2B_PUBLIC),
+            ("outside_info", TPM2B_DATA),
+            ("creation_pcr", TPML_PCR_SELECTION),
+        ],
+        rsp_handles=["object_handle"],
+        rsp_params=[("out_public", TPM2B_PUBLIC)],
+    ),
+    Command(
+        "HashSignStart",
+        TPM_CC_HashSignStart,
+        TPM_ST_SESSIONS,
+        handles=["key_handle"],
+        params=[("total_len", UINT32)],
+        rsp_handles=["sequence_handle"],
+    ),
+    Command(
+        "SequenceUpdate",
+        TPM_CC_SequenceUpdate,
+        TPM_ST_SESSIONS,
+        handles=["sequence_handle"],
+        params=[("buffer", TPM2B_MAX_BUFFER)],
+    ),
+    Command(
+        "HashSignFinish",
+        TPM_CC_HashSignFinish,
+        TPM_ST_SESSIONS,
+        handles=["sequence_handle"],
+        rsp_params=[("signature", TPMT_SIGNATURE)],
+    ),
+    Command(
+        "HashVerifyStart",
+        TPM_CC_HashVerifyStart,
+        TPM_ST_NO_SESSIONS,
+        handles=["key_handle"],
+        params=[("total_len", UINT32), ("signature", TPMT_SIGNATURE)],
+        rsp_handles=["sequence_handle"],
+    ),
+    Command(
+        "HashVerifyFinish",
+        TPM_CC_HashVerifyFinish,
+        TPM_ST_SESSIONS,
+        handles=["sequence_handle"],
+        rsp_params=[("validation", TPMT_TK_VERIFIED)],
+    ),
+    Command(
+        "HashSignDigest",
+        TPM_CC_HashSignDigest,
+        TPM_ST_SESSIONS,
+        handles=["key_handle"],
+        params=[("digest", TPM2B_DIGEST)],
+        rsp_params=[("signature", TPMT_SIGNATURE)],
+    ),
+    Command(
+        "GetCapability",
+        TPM_CC_GetCapability,
+        TPM_ST_NO_SESSIONS,
+        params=[("capability", UINT32), ("property", UINT32), ("property_count", UINT32)],
+        rsp_params=[("more_data", TPMI_YES_NO), ("capability_data", TPMS_CAPABILITY_DATA)],
+    ),
+    Command(
+        "EvictControl",
+        TPM_CC_EvictControl,
+        TPM_ST_SESSIONS,
+        handles=["auth_handle", "object_handle"],
+        params=[("persistent_handle", TPM_HANDLE)],
+    ),
+    Command(
+        "ReadPublic",
+        TPM_CC_ReadPublic,
+        TPM_ST_NO_SESSIONS,
+        handles=["object_handle"],
+        rsp_params=[("out_public", TPM2B_PUBLIC), ("name", TPM2B_NAME), ("qualified_name", TPM2B_NAME)],
+    ),
+    Command("FlushContext", TPM_CC_FlushContext, TPM_ST_NO_SESSIONS, params=[("flush_handle", TPM_HANDLE)]),
+    # Vendor: on-device cycle counters, answered by the platform layer (tpm_utils.decode_perf_counters)
+    Command("ReadPerfCounters", TPM_CC_ReadPerfCounters, TPM_ST_NO_SESSIONS, params=[("reset", UINT8)]),
+]
+
+
+# ---- records ----
+class Record:
+    """Base of the generated result classes: __slots__ fields, iterable like a tuple"""
+
+    __slots__ = ()
+
+    def __iter__(self):
+        return (getattr(self, f) for f in self.__slots__)
+
+    def __getitem__(self, i):
+        return tuple(self)[i]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={_short(getattr(self, f))}" for f in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+def _short(v):
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return f"<{len(v)} bytes>" if len(v) > 16 else bytes(v).hex()
+    return hex(v) if isinstance(v, int) else repr(v)
+
+
+def _record(name: str, fields: list) -> type:
+    args = ", ".join(fields)
+    body = "".join(f"    self.{f} = {f}\n" for f in fields) or "    pass\n"
+    ns = {}
+    exec(f"def __init__(self, {args}):\n{body}", ns)
+    return type(name, (Record,), {"__slots__": tuple(fields), "__init__": ns["__init__"]})
+
+
+# ---- code generation ----
+class _Gen:
+    def __init__(self):
+        self.lines = []
+        self.structs = {}  # format -> precompiled struct name
+        self.ns = {"Record": Record}
+
+    def struct_name(self, fmt: str) -> str:
+        if fmt not in self.structs:
+            name = f"_S_{fmt}"
+            self.structs[fmt] = name
+            self.ns[name] = struct.Struct(">" + fmt)
+        return self.structs[fmt]
+
+    def emit(self, indent: int, line: str):
+        self.lines.append("    " * indent + line)
+
+    # decoding: `pending` collects (fmt, target) runs merged into one unpack_from
+    def flush_decode(self, indent: int, pending: list):
+        if not pending:
+            return
+        fmt = "".join(f for f, _ in pending)
+        targets = ", ".join(t for _, t in pending)
+        self.emit(indent, f"{targets}, = {self.struct_name(fmt)}.unpack_from(buf, off)")
+        self.emit(indent, f"off += {struct.calcsize('>' + fmt)}")
+        pending.clear()
+
+    def decode_type(self, t, var: str, indent: int, pending: list):
+        if isinstance(t, Prim):
+            pending.append((t.fmt, var))
+        elif isinstance(t, TPM2B):
+            pending.append((t.size_fmt, f"_n_{var}"))
+            self.flush_decode(indent, pending)
+            self.emit(indent, f"if off + _n_{var} > len(buf):")
+            self.emit(indent + 1, f"raise RuntimeError('Bad TPM data (truncated {t.name})')")
+            self.emit(indent, f"{var} = buf[off : off + _n_{var}]")
+            self.emit(indent, f"off += _n_{var}")
+        elif isinstance(t, Sized):
+            pending.append(("H", f"_n_{var}"))
+            self.flush_decode(indent, pending)
+            self.emit(indent, f"{var}, _ = decode_{t.inner.name}(buf[: off + _n_{var}], off)")
+            self.emit(indent, f"off += _n_{var}")
+        elif isinstance(t, Struct):
+            self.flush_decode(indent, pending)
+            self.emit(indent, f"{var}, off = decode_{t.name}(buf, off)")
+        elif isinstance(t, List):
+            pending.append(("I", f"_n_{var}"))
+            self.flush_decode(indent, pending)
+            self.emit(indent, f"{var} = []")
+            self.emit(indent, f"for _ in range(_n_{var}):")
+            self.decode_type(t.elem, "_e", indent + 1, [])
+            self.emit(indent + 1, f"{var}.append(_e)")
+        elif isinstance(t, Union):
+            self.flush_decode(indent, pending)
+            kw = "if"
+            for value, case in t.cases.items():
+                self.emit(indent, f"{kw} f_{t.selector} == {value}:")
+                sub = []
+                self.decode_type(case, var, indent + 1, sub)
+                self.flush_decode(indent + 1, sub)
+                kw = "elif"
+            self.emit(indent, "else:")
+            self.emit(indent + 1, f"raise RuntimeError(f'Unsupported {t.name} selector 0x{{f_{t.selector}:04X}}')")
+        else:
+            raise TypeError(t)
+
+    # encoding: `pending` collects (fmt, expression) runs merged into one pack_into
+    def flush_encode(self, indent: int, pending: list):
+        if not pending:
+            return
+        fmt = "".join(f for f, _ in pending)
+        exprs = ", ".join(e for _, e in pending)
+        self.emit(indent, f"_o = m.reserve({struct.calcsize('>' + fmt)})")
+        self.emit(indent, f"{self.struct_name(fmt)}.pack_into(m.buf, _o, {exprs})")
+        pending.clear()
+
+    def encode_type(self, t, expr: str, indent: int, pending: list, selectors: dict):
+        if isinstance(t, Prim):
+            pending.append((t.fmt, expr))
+        elif isinstance(t, TPM2B):
+            pending.append((t.size_fmt, f"len({expr})"))
+            self.flush_encode(indent, pending)
+            self.emit(indent, f"m.raw({expr})")
+        elif isinstance(t, Sized):
+            self.flush_encode(indent, pending)
+            self.emit(indent, "_s = m.tpm2b_begin()")
+            self.emit(indent, f"encode_{t.inner.name}(m, {expr})")
+            self.emit(indent, "m.tpm2b_end(_s)")
+        elif isinstance(t, Struct):
+            self.flush_encode(indent, pending)
+            self.emit(indent, f"encode_{t.name}(m, {expr})")
+        elif isinstance(t, List):
+            pending.append(("I", f"len({expr})"))
+            self.flush_encode(indent, pending)
+            self.emit(indent, f"for _e in {expr}:")
+            sub = []
+            self.encode_type(t.elem, "_e", indent + 1, sub, selectors)
+            self.flush_encode(indent + 1, sub)
+        elif isinstance(t, Union):
+            self.flush_encode(indent, pending)
+            kw = "if"
+            for value, case in t.cases.items():
+                self.emit(indent, f"{kw} {selectors[t.selector]} == {value}:")
+                sub = []
+                self.encode_type(case, expr, indent + 1, sub, selectors)
+                self.flush_encode(indent + 1, sub)
+                kw = "elif"
+            self.emit(indent, "else:")
+            self.emit(indent + 1, f"raise ValueError('Unsupported {t.name} selector')")
+        else:
+            raise TypeError(t)
+
+    def gen_struct(self, s: Struct):
+        self.ns[s.py_name] = _record(s.py_name, [f for f, _ in s.fields])
+        self.emit(0, f"def decode_{s.name}(buf, off):")
+        pending = []
+        for fname, t in s.fields:
+            self.decode_type(t, f"f_{fname}", 1, pending)
+        self.flush_decode(1, pending)
+        args = ", ".join(f"f_{f}" for f, _ in s.fields)
+        self.emit(1, f"return {s.py_name}({args}), off")
+        self.emit(0, "")
+        self.emit(0, f"def encode_{s.name}(m, v):")
+        pending = []
+        selectors = {f: f"v.{f}" for f, _ in s.fields}
+        for fname, t in s.fields:
+            self.encode_type(t, f"v.{fname}", 1, pending, selectors)
+        self.flush_encode(1, pending)
+        self.emit(0, "")
+
+    def gen_command(self, c: Command):
+        params = [f for f, _ in c.params]
+        # encode_<Name>(m, handles..., params..., auth=b"") -> bytes
+        sig = ", ".join(["m"] + list(c.handles) + params)
+        auth = ', auth=b""' if c.tag == TPM_ST_SESSIONS else ""
+        self.emit(0, f"def encode_{c.name}({sig}{auth}):")
+        self.emit(1, f"m.begin({c.tag}, {c.cc})")
+        pending = [("I", h) for h in c.handles]
+        if c.tag == TPM_ST_SESSIONS:
+            # authorizationSize + one TPM_RS_PW TPMS_AUTH_COMMAND
+            pending += [("I", "9 + len(auth)"), ("I", str(TPM_RS_PW)), ("H", "0"), ("B", "0"), ("H", "len(auth)")]
+            self.flush_encode(1, pending)
+            self.emit(1, "m.raw(auth)")
+        for fname, t in c.params:
+            self.encode_type(t, fname, 1, pending, {})
+        self.flush_encode(1, pending)
+        self.emit(1, "return m.finish()")
+        self.emit(0, "")
+
+        # decode_<Name>_response(rsp) -> <Name>Response(handles..., params...)
+        rsp_fields = list(c.rsp_handles) + [f for f, _ in c.rsp_params]
+        self.ns[f"{c.name}Response"] = _record(f"{c.name}Response", rsp_fields)
+        self.emit(0, f"def decode_{c.name}_response(rsp):")
+        self.emit(1, "buf = rsp if isinstance(rsp, memoryview) else memoryview(rsp)")
+        self.emit(1, "f_tag, _, _ = _S_HII.unpack_from(buf, 0)")
+        self.emit(1, f"off = {TPM_HEADER_SIZE}")
+        pending = [("I", f"f_{h}") for h in c.rsp_handles]
+        self.flush_decode(1, pending)
+        self.emit(1, f"if f_tag == {TPM_ST_SESSIONS}:")
+        self.emit(2, "off += 4  # parameterSize")
+        for fname, t in c.rsp_params:
+            self.decode_type(t, f"f_{fname}", 1, pending)
+        self.flush_decode(1, pending)
+        self.emit(1, f"return {c.name}Response({', '.join('f_' + f for f in rsp_fields)})")
+        self.emit(0, "")
+
+        self.gen_segmenter(c, "cmd", c.handles, c.params, "handle")
+        self.gen_segmenter(c, "rsp", c.rsp_handles, c.rsp_params, "handles")
+
+    def gen_segmenter(self, c: Command, kind: str, handles, params, handle_label: str):
+        """segs = [(label, start, end, tag)] with the dashboard's labels/tags"""
+        self.emit(0, f"def _segment_{kind}_{c.name}(buf):")
+        self.emit(1, "n = len(buf)")
+        self.emit(1, "f_tag, _, _ = _S_HII.unpack_from(buf, 0)")
+        self.emit(1, f"segs = [('hdr', 0, {TPM_HEADER_SIZE}, 'hdr')]")
+        pos = TPM_HEADER_SIZE
+        if handles:
+            if kind == "cmd":
+                for _ in handles:
+                    self.emit(1, f"segs.append(('{handle_label}', {pos}, {pos + 4}, 'hdl'))")
+                    pos += 4
+            else:
+                self.emit(1, f"segs.append(('{handle_label}', {pos}, {pos + 4 * len(handles)}, 'hdl'))")
+                pos += 4 * len(handles)
+        self.emit(1, f"off = {pos}")
+        if kind == "cmd":
+            self.emit(1, "end = n")
+            self.emit(1, f"if f_tag == {TPM_ST_SESSIONS}:")
+            self.emit(2, "a, = _S_I.unpack_from(buf, off)")
+            self.emit(2, "segs.append(('authSize', off, off + 4, 'sz'))")
+            self.emit(2, "segs.append(('auth', off + 4, off + 4 + a, 'auth'))")
+            self.emit(2, "off += 4 + a")
+        else:
+            self.emit(1, "end = n")
+            self.emit(1, f"if f_tag == {TPM_ST_SESSIONS} and off + 4 <= n:")
+            self.emit(2, "p, = _S_I.unpack_from(buf, off)")
+            self.emit(2, "segs.append(('paramSize', off, off + 4, 'sz'))")
+            self.emit(2, "off += 4")
+            self.emit(2, "end = min(n, off + p)")
+        # Plain parameters are shown as one 'params' run; highlighted structures split
+        # it, so only the parameters in front of the last highlighted one are walked
+        last = max((i for i, (_, t) in enumerate(params) if isinstance(t, Struct) and t.segments), default=-1)
+        self.emit(1, "start = off")
+        for fname, t in params[: last + 1]:
+            if isinstance(t, Struct) and t.segments:
+                hdr_label, payload_label, tag = t.segments
+                *head, (_, payload) = t.fields
+                fmt = "".join(ft.fmt for _, ft in head) + payload.size_fmt
+                self.emit(1, "if start < off:")
+                self.emit(2, "segs.append(('params', start, off, 'prm'))")
+                self.emit(1, f"_k = {self.struct_name(fmt)}.unpack_from(buf, off)[-1]")
+                size = struct.calcsize(">" + fmt)
+                self.emit(1, f"segs.append(('{hdr_label}', off, off + {size}, '{tag}'))")
+                self.emit(1, f"segs.append(('{payload_label}', off + {size}, off + {size} + _k, '{tag}'))")
+                self.emit(1, f"off = start = off + {size} + _k")
+            else:
+                pending = []
+                self.decode_type(t, "_v", 1, pending)
+                self.flush_decode(1, pending)
+        self.emit(1, "if start < end:")
+        self.emit(2, "segs.append(('params', start, end, 'prm'))")
+        if kind == "rsp":
+            self.emit(1, "if end < n:")
+            self.emit(2, "segs.append(('auth', end, n, 'auth'))")
+        self.emit(1, "return segs")
+        self.emit(0, "")
+
+    def build(self):
+        self.struct_name("HII")
+        self.struct_name("I")
+        for s in STRUCTS:
+            self.gen_struct(s)
+        for c in COMMANDS:
+            self.gen_command(c)
+        source = "\n".join(self.lines)
+        exec(compile(source, "<tpm_schema generated>", "exec"), self.ns)
+        return source, self.ns
+
+
+GENERATED_SOURCE, _generated = _Gen().build()
+globals().update({k: v for k, v in _generated.items() if not k.startswith("__") and k != "Record"})
+# Result classes other modules import by name
+TPMTPublic = _generated["TPMTPublic"]
+TPMTSignature = _generated["TPMTSignature"]
+TPMTTKVerified = _generated["TPMTTKVerified"]
+
+COMMANDS_BY_NAME = {c.name: c for c in COMMANDS}
+COMMANDS_BY_CC = {c.cc: c for c in COMMANDS}
+_ENCODERS = {c.name: _generated[f"encode_{c.name}"] for c in COMMANDS}
+_RSP_DECODERS = {c.name: _generated[f"decode_{c.name}_response"] for c in COMMANDS}
+_CMD_SEGMENTERS = {c.cc: _generated[f"_segment_cmd_{c.name}"] for c in COMMANDS}
+_RSP_SEGMENTERS = {c.name: _generated[f"_segment_rsp_{c.name}"] for c in COMMANDS}
+for _c in COMMANDS:
+    TPM_CC_NAMES.setdefault(_c.cc, _c.name)
+
+
+def command_spec(name: str) -> Command | None:
+    """Schema entry for a command name; display suffixes like "(Dilithium)" are ignored"""
+    return COMMANDS_BY_NAME.get(name.split("(", 1)[0])
+
+
+def encode_command(m, name: str, *args, **kwargs) -> bytes:
+    return _ENCODERS[name](m, *args, **kwargs)
+
+
+def decode_response(name: str, rsp):
+    """Handles and leading parameters of a successful response; TPM2Bs are views into rsp"""
+    if len(rsp) < TPM_HEADER_SIZE:
+        raise RuntimeError("TPM response too short")
+    try:
+        return _RSP_DECODERS[name](rsp)
+    except struct.error as e:
+        raise RuntimeError(f"Bad {name} response ({e})") from None
+
+
+def decode_createprimary_outpublic(rsp) -> TPMTPublic:
+    return decode_response("CreatePrimary", rsp).out_public
+
+
+def decode_hashsign_finish(rsp) -> TPMTSignature:
+    return decode_response("HashSignFinish", rsp).signature
+
+
+def decode_hashverify_finish(rsp) -> TPMTTKVerified:
+    return decode_response("HashVerifyFinish", rsp).validation
+
+
+def _clamp(segs: list, n: int) -> list:
+    out = []
+    for label, start, end, tag in segs:
+        end = min(end, n)
+        if start < end:
+            out.append((label, start, end, tag))
+    return out
+
+
+def _fallback_segments(data, handles: int = 0, is_response: bool = False) -> list:
+    """Header, `handles` handles, parameterSize (ST_SESSIONS responses) and parameters"""
+    n = len(data)
+    segs = [("hdr", 0, TPM_HEADER_SIZE, "hdr")]
+    pos = TPM_HEADER_SIZE
+    if handles:
+        segs.append(("handles", pos, pos + 4 * handles, "hdl"))
+        pos += 4 * handles
+    if is_response and n >= 2 and int.from_bytes(data[0:2], "big") == TPM_ST_SESSIONS and pos + 4 <= n:
+        segs.append(("paramSize", pos, pos + 4, "sz"))
+        pos += 4
+    segs.append(("params", pos, n, "prm"))
+    return _clamp(segs, n)
+
+
+def segment_command(data) -> list:
+    """[(label, start, end, tag)] for a marshaled command; unknown codes fall back to header + params"""
+    n = len(data)
+    if n <= TPM_HEADER_SIZE:
+        return _fallback_segments(data)
+    fn = _CMD_SEGMENTERS.get(int.from_bytes(data[6:10], "big"))
+    if fn is None:
+        return _fallback_segments(data)
+    try:
+        return _clamp(fn(memoryview(data)), n)
+    except (struct.error, RuntimeError):
+        return _fallback_segments(data)
+
+
+def segment_response(data, name: str, handles: int = 0) -> list:
+    """Like segment_command, for the response to command `name`; responses to
+    commands missing from the schema are split assuming `handles` response handles"""
+    n = len(data)
+    spec = command_spec(name or "")
+    if n <= TPM_HEADER_SIZE or spec is None:
+        return _fallback_segments(data, handles, is_response=True)
+    try:
+        return _clamp(_RSP_SEGMENTERS[spec.name](memoryview(data)), n)
+    except (struct.error, RuntimeError):
+        return _fallback_segments(data, handles, is_response=True)
+
+
+if __name__ == "__main__":
+    print(GENERATED_SOURCE)
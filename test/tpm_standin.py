@@ -0,0 +1,766 @@
+"""Pure-Python stand-in for the Petalite TPM behind serial2tcp.
+
+Listens on the sim's TCP port and speaks the same wire protocol: a 0xA0 READY byte
+when a client connects (boot) and before every response, commands framed by the
+TPM header size field. Implements the opcodes the host tools use: Startup,
+GetRandom, GetCapability (TPM properties), CreatePrimary (Dilithium), ReadPublic,
+EvictControl, FlushContext, HashSignStart/SequenceUpdate/HashSignFinish,
+HashSignDigest (pre-hash), HashVerifyStart/SequenceUpdate/HashVerifyFinish and
+ReadPerfCounters (RunCommand time only, counted at PERF_CLOCK_HZ).
+
+    python tpm_standin.py                       # instead of the Verilator sim
+    python tpm.py --tcp                         # unchanged client
+
+Crypto comes from dilithium_py (as in cross-check.ipynb) when installed; otherwise a
+fake backend returns correctly sized keys and signatures that only verify against
+each other. Every connection starts from a freshly booted TPM; the owner seed and
+persistent objects (EvictControl) are kept across connections, like the firmware's
+RAM-backed NV on a board that stays powered.
+
+Timing can be modelled with per-command latencies and a UART baud rate, e.g.
+`--latency HashSignFinish=250 --latency-default 2 --baud 115200`. `--rx-slots`
+mirrors the firmware's receive slots (TPM_RX_SLOTS): commands arriving while every
+slot is busy are dropped, like the ISR does. Use 1 to model the single-buffer firmware.
+"""
+
+import os
+import hmac
+import time
+import socket
+import queue
+import struct
+import hashlib
+import argparse
+import threading
+
+from tpm_utils import (
+    TPM_ALG_DILITHIUM,
+    TPM_CC_Startup,
+    TPM_CC_GetRandom,
+    TPM_CC_CreatePrimary,
+    TPM_CC_SequenceUpdate,
+    TPM_CC_HashSignStart,
+    TPM_CC_HashSignFinish,
+    TPM_CC_HashVerifyStart,
+    TPM_CC_HashVerifyFinish,
+    TPM_CC_HashSignDigest,
+    TPM_CC_ReadPerfCounters,
+    TPM_CC_GetCapability,
+    TPM_CC_EvictControl,
+    TPM_CC_ReadPublic,
+    TPM_CC_FlushContext,
+    TPM_CAP_TPM_PROPERTIES,
+    TPM_HR_PERSISTENT,
+    PERSISTENT_LAST,
+    TPM_PT_INPUT_BUFFER,
+    TPM_PT_MAX_COMMAND_SIZE,
+    TPM_PT_MAX_RESPONSE_SIZE,
+    PREHASH_DIGEST_SIZE,
+    TPM_ST_NO_SESSIONS,
+    TPM_ST_SESSIONS,
+    TPM_HEADER_SIZE,
+    PERF_SECTIONS,
+    TPM_MAX_CMD_LEN,
+    command_name,
+)
+
+DILITHIUM_READY_BYTE = 0xA0
+
+TPM_ALG_NULL = 0x0010
+TPM_ALG_SHA256 = 0x000B
+TPM_ST_CREATION = 0x8021
+TPM_ST_VERIFIED = 0x8022
+TPM_RH_OWNER = 0x40000001
+TPM_RS_PW = 0x40000009
+
+TPM_RC_SUCCESS = 0x000
+TPM_RC_INITIALIZE = 0x100
+TPM_RC_COMMAND_SIZE = 0x142
+TPM_RC_COMMAND_CODE = 0x143
+TPM_RC_AUTH_MISSING = 0x125
+TPM_RC_VALUE = 0x084
+TPM_RC_SIZE = 0x095
+TPM_RC_INSUFFICIENT = 0x09A
+TPM_RC_SIGNATURE = 0x09B
+TPM_RC_TYPE = 0x2CA  # TPM_RC_TYPE, parameter 2 (inPublic)
+TPM_RC_HANDLE = 0x18B  # TPM_RC_HANDLE, handle 1
+TPM_RC_HIERARCHY = 0x185  # TPM_RC_HIERARCHY, handle 1
+TPM_RC_RANGE = 0x1CD  # TPM_RC_RANGE, parameter 1
+TPM_RC_NV_DEFINED = 0x14C
+TPM_RC_NV_SPACE = 0x14B
+TPM_RC_AUTH_FAIL = 0x98E  # TPM_RC_AUTH_FAIL, session 1
+
+MAX_COMMAND_SIZE = TPM_MAX_CMD_LEN  # one firmware receive slot
+MAX_RESPONSE_SIZE = 8192
+MAX_DIGEST_BUFFER = 1024  # TPM2B_MAX_BUFFER limit of the reference TPM
+MAX_RANDOM_BYTES = 64
+MAX_CAP_PROPERTIES = 16
+MAX_PERSISTENT_OBJECTS = 7  # evict slots left by the reference TPM's NV_MEMORY_SIZE
+# ReadPerfCounters: nominal core clock the stand-in's wall time is converted at, and the
+# firmware's per-command table size (perf.h PERF_MAX_COMMANDS)
+PERF_CLOCK_HZ = 100_000_000
+PERF_MAX_COMMANDS = 12
+
+# Fixed properties reported through GetCapability(TPM_CAP_TPM_PROPERTIES)
+TPM_PROPERTIES = {
+    TPM_PT_INPUT_BUFFER: MAX_DIGEST_BUFFER,
+    TPM_PT_MAX_COMMAND_SIZE: MAX_COMMAND_SIZE,
+    TPM_PT_MAX_RESPONSE_SIZE: MAX_RESPONSE_SIZE,
+}
+
+# Dilithium (round 3) sizes per security level: (public key, signature)
+DILITHIUM_SIZES = {
+    2: (1312, 2420),
+    3: (1952, 3293),
+    5: (2592, 4595),
+}
+
+# Empty TPMS_AUTH_RESPONSE for a password session: nonce(0) | continueSession | hmac(0)
+_PW_AUTH_RESPONSE = b"\x00\x00\x01\x00\x00"
+
+
+class _DilithiumPyBackend:
+    """Reference Dilithium from dilithium_py (same package as cross-check.ipynb)."""
+
+    name = "dilithium_py"
+
+    def __init__(self):
+        from dilithium_py.dilithium import Dilithium2, Dilithium3, Dilithium5
+
+        self.impl = {2: Dilithium2, 3: Dilithium3, 5: Dilithium5}
+        self._lock = threading.Lock()
+
+    def keygen(self, level: int, seed: bytes):
+        impl = self.impl[level]
+        try:
+            return impl.keygen(zeta=seed)
+        except TypeError:
+            pass
+        # Released dilithium_py draws zeta from `random_bytes`; pin it to the seed
+        with self._lock:
+            saved = impl.random_bytes
+            impl.random_bytes = lambda n: seed[:n]
+            try:
+                return impl.keygen()
+            finally:
+                impl.random_bytes = saved
+
+    def sign(self, level: int, sk: bytes, msg: bytes) -> bytes:
+        return self.impl[level].sign(sk, msg)
+
+    def verify(self, level: int, pk: bytes, msg: bytes, sig: bytes) -> bool:
+        return self.impl[level].verify(pk, msg, sig)
+
+
+class _FakeDilithiumBackend:
+    """Correctly sized, deterministic stand-in keys/signatures (not Dilithium)."""
+
+    name = "fake"
+
+    def keygen(self, level: int, seed: bytes):
+        pk_len, _ = DILITHIUM_SIZES[level]
+        pk = hashlib.shake_256(b"standin-pk" + seed).digest(pk_len)
+        return pk, seed
+
+    def _sig(self, level: int, pk: bytes, msg: bytes) -> bytes:
+        _, sig_len = DILITHIUM_SIZES[level]
+        return hashlib.shake_256(b"standin-sig" + pk + msg).digest(sig_len)
+
+    def sign(self, level: int, sk: bytes, msg: bytes) -> bytes:
+        return self._sig(level, self.keygen(level, sk)[0], msg)
+
+    def verify(self, level: int, pk: bytes, msg: bytes, sig: bytes) -> bool:
+        return hmac.compare_digest(self._sig(level, pk, msg), sig)
+
+
+def load_backend(name: str = "auto"):
+    if name in ("auto", "dilithium_py"):
+        try:
+            return _DilithiumPyBackend()
+        except ImportError:
+            if name == "dilithium_py":
+                raise RuntimeError(
+                    "dilithium_py is required for this backend. Install with: pip install dilithium-py"
+                )
+    return _FakeDilithiumBackend()
+
+
+class _TPMError(Exception):
+    def __init__(self, rc: int):
+        super().__init__(f"rc=0x{rc:X}")
+        self.rc = rc
+
+
+class _Reader:
+    """Bounds-checked big-endian cursor over a command buffer."""
+
+    def __init__(self, data: bytes, off: int = 0):
+        self.data = data
+        self.off = off
+
+    def take(self, n: int) -> bytes:
+        if self.off + n > len(self.data):
+            raise _TPMError(TPM_RC_INSUFFICIENT)
+        out = self.data[self.off : self.off + n]
+        self.off += n
+        return out
+
+    def u8(self) -> int:
+        return self.take(1)[0]
+
+    def u16(self) -> int:
+        return int.from_bytes(self.take(2), "big")
+
+    def u32(self) -> int:
+        return int.from_bytes(self.take(4), "big")
+
+    def tpm2b(self) -> bytes:
+        return self.take(self.u16())
+
+
+def _tpm2b(data: bytes) -> bytes:
+    return struct.pack(">H", len(data)) + data
+
+
+def _response(rc: int, handles: bytes = b"", params: bytes = b"", sessions: bool = False) -> bytes:
+    if rc != TPM_RC_SUCCESS:
+        return struct.pack(">HII", TPM_ST_NO_SESSIONS, TPM_HEADER_SIZE, rc)
+    if sessions:
+        body = handles + struct.pack(">I", len(params)) + params + _PW_AUTH_RESPONSE
+        tag = TPM_ST_SESSIONS
+    else:
+        body = handles + params
+        tag = TPM_ST_NO_SESSIONS
+    return struct.pack(">HII", tag, TPM_HEADER_SIZE + len(body), rc) + body
+
+
+class _TPMState:
+    """Volatile state of one booted TPM (one client connection)."""
+
+    def __init__(self, backend, proof: bytes, persistent: dict):
+        self.backend = backend
+        self.proof = proof
+        self.started = False
+        self.objects = {}  # handle -> dict(level, pk, sk, auth, public, name)
+        self.persistent = persistent  # handle -> object, shared by every boot
+        self.sequences = {}  # handle -> dict(kind, key, total, buf, sig)
+        self.next_object = 0x80000000
+        self.next_sequence = 0x80000100
+
+
+class TPMStandIn:
+    """TCP server emulating the Petalite TPM firmware on the serial2tcp port."""
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 4327,
+        backend: str = "auto",
+        latency: dict | None = None,
+        latency_default: float = 0.0,
+        baud: int | None = None,
+        boot_delay: float = 0.0,
+        rx_slots: int = 2,
+        debug: bool = False,
+    ):
+        self.backend = load_backend(backend)
+        self.latency = {k.lower(): v for k, v in (latency or {}).items()}
+        self.latency_default = latency_default
+        self.baud = baud
+        self.boot_delay = boot_delay
+        self.rx_slots = max(1, int(rx_slots))
+        self.debug = debug
+        self.running = True
+        self.commands_served = 0
+        self.commands_dropped = 0
+        # Survive reconnects: owner seed and the NV-resident (persistent) objects
+        self.proof = os.urandom(32)
+        self.persistent = {}
+        # ReadPerfCounters, board-wide like the firmware's: {cc: [commands, cycles, max cycles]}
+        self.perf = {}
+        self._perf_lock = threading.Lock()
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(4)
+        self.host, self.port = self.sock.getsockname()[:2]
+        self.thread = None
+
+        self.handlers = {
+            TPM_CC_Startup: self._startup,
+            TPM_CC_GetRandom: self._get_random,
+            TPM_CC_GetCapability: self._get_capability,
+            TPM_CC_CreatePrimary: self._create_primary,
+            TPM_CC_ReadPublic: self._read_public,
+            TPM_CC_EvictControl: self._evict_control,
+            TPM_CC_FlushContext: self._flush_context,
+            TPM_CC_HashSignStart: self._hashsign_start,
+            TPM_CC_SequenceUpdate: self._sequence_update,
+            TPM_CC_HashSignFinish: self._hashsign_finish,
+            TPM_CC_HashSignDigest: self._hashsign_digest,
+            TPM_CC_HashVerifyStart: self._hashverify_start,
+            TPM_CC_HashVerifyFinish: self._hashverify_finish,
+        }
+
+    def _console(self, msg: str):
+        if self.debug:
+            print(f"[standin] {msg}")
+
+    # ---- server ----
+    def start(self):
+        """Serve from a background thread; returns self for chaining"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self._console(f"Listening on {self.host}:{self.port} (crypto: {self.backend.name})")
+        while self.running:
+            try:
+                conn, addr = self.sock.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_conn, args=(conn, addr), daemon=True).start()
+
+    def close(self):
+        self.running = False
+        try:
+            self.sock.close()
+        except Exception:
+            pass
+
+    def _wire_time(self, nbytes: int) -> float:
+        # 8N1: ten bit times per byte
+        return nbytes * 10.0 / self.baud if self.baud else 0.0
+
+    def _recv_exact(self, conn, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = conn.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("client closed")
+            buf += chunk
+        return bytes(buf)
+
+    def _send(self, conn, data: bytes):
+        if not self.baud:
+            conn.sendall(data)
+            return
+        # Pace the response at the modelled line rate, ~10 ms per slice
+        step = max(1, self.baud // 1000)
+        start = time.perf_counter()
+        for off in range(0, len(data), step):
+            conn.sendall(data[off : off + step])
+            lag = start + self._wire_time(off + step) - time.perf_counter()
+            if lag > 0:
+                time.sleep(lag)
+
+    def _read_command(self, conn):
+        header = self._recv_exact(conn, TPM_HEADER_SIZE)
+        t0 = time.perf_counter()
+        size = int.from_bytes(header[2:6], "big")
+        if size < TPM_HEADER_SIZE:
+            return header, TPM_RC_COMMAND_SIZE
+        if size > MAX_COMMAND_SIZE:
+            # Like the firmware ISR: discard the rest of the command, then answer
+            self._recv_exact(conn, size - TPM_HEADER_SIZE)
+            return header, TPM_RC_COMMAND_SIZE
+        cmd = header + self._recv_exact(conn, size - TPM_HEADER_SIZE)
+        lag = t0 + self._wire_time(size) - time.perf_counter()
+        if lag > 0:
+            time.sleep(lag)
+        return cmd, None
+
+    def _serve_conn(self, conn, addr):
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._console(f"Client {addr[0]}:{addr[1]} connected")
+        state = _TPMState(self.backend, self.proof, self.persistent)
+        # Receive slots: taken when a command arrives, given back once it is answered
+        free_slots = threading.Semaphore(self.rx_slots)
+        pending = queue.Queue()
+        executor = threading.Thread(
+            target=self._execute_loop, args=(conn, state, pending, free_slots), daemon=True
+        )
+        try:
+            if self.boot_delay:
+                time.sleep(self.boot_delay)
+            conn.sendall(bytes([DILITHIUM_READY_BYTE]))
+            executor.start()
+            while self.running:
+                cmd, rc = self._read_command(conn)
+                if not free_slots.acquire(blocking=False):
+                    self.commands_dropped += 1
+                    self._console(f"All {self.rx_slots} RX slot(s) busy, dropped {len(cmd)} B")
+                    continue
+                pending.put((cmd, rc))
+                if rc is not None and int.from_bytes(cmd[2:6], "big") < TPM_HEADER_SIZE:
+                    # The framing is lost after a bad size; answer and drop the link
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            pending.put(None)
+            if executor.is_alive():
+                executor.join()
+            conn.close()
+            self._console(f"Client {addr[0]}:{addr[1]} disconnected")
+
+    def _execute_loop(self, conn, state: _TPMState, pending: queue.Queue, free_slots):
+        """Firmware main loop: run queued commands in order, free the slot, answer"""
+        try:
+            while True:
+                item = pending.get()
+                if item is None:
+                    return
+                cmd, rc = item
+                rsp = _response(rc) if rc is not None else self.execute(state, cmd)
+                # Free the slot before answering: a client that sends its next command
+                # as soon as the answer arrives must not find the slot still taken
+                free_slots.release()
+                self._send(conn, bytes([DILITHIUM_READY_BYTE]) + rsp)
+        except OSError:
+            pass
+
+    # ---- command dispatch ----
+    def execute(self, state: _TPMState, cmd: bytes) -> bytes:
+        """Run one command against `state` and return the response bytes"""
+        t0 = time.perf_counter()
+        code = int.from_bytes(cmd[6:10], "big")
+        name = command_name(code)
+        if code == TPM_CC_ReadPerfCounters:
+            # Answered by the platform layer: no Startup needed, and not counted itself
+            self.commands_served += 1
+            return self._read_perf_counters(cmd)
+        handler = self.handlers.get(code)
+        try:
+            if handler is None:
+                raise _TPMError(TPM_RC_COMMAND_CODE)
+            if code != TPM_CC_Startup and not state.started:
+                raise _TPMError(TPM_RC_INITIALIZE)
+            rsp = handler(state, cmd)
+        except _TPMError as e:
+            rsp = _response(e.rc)
+        self.commands_served += 1
+        delay = self.latency.get(name.lower(), self.latency_default) / 1000.0
+        lag = t0 + delay - time.perf_counter()
+        if lag > 0:
+            time.sleep(lag)
+        self._perf_record(code, time.perf_counter() - t0)
+        self._console(f"{name} -> rc=0x{int.from_bytes(rsp[6:10], 'big'):X} ({len(rsp)} B)")
+        return rsp
+
+    def _perf_record(self, code: int, seconds: float):
+        cycles = int(seconds * PERF_CLOCK_HZ)
+        with self._perf_lock:
+            if code not in self.perf and len(self.perf) >= PERF_MAX_COMMANDS:
+                code = 0  # firmware's "other" entry
+            entry = self.perf.setdefault(code, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += cycles
+            entry[2] = max(entry[2], min(cycles, 0xFFFFFFFF))
+
+    def _read_perf_counters(self, cmd: bytes) -> bytes:
+        reset = len(cmd) > TPM_HEADER_SIZE and cmd[TPM_HEADER_SIZE] != 0
+        with self._perf_lock:
+            entries = sorted(self.perf.items(), key=lambda item: item[0] == 0)
+            if reset:
+                self.perf = {}
+        params = struct.pack(">IBB", PERF_CLOCK_HZ, len(PERF_SECTIONS), len(entries))
+        idle = struct.pack(">IQI", 0, 0, 0) * (len(PERF_SECTIONS) - 1)
+        for code, (count, cycles, peak) in entries:
+            # Only RunCommand is known here; the Dilithium and DMA sections stay empty
+            params += struct.pack(">IIIQI", code, count, count, cycles, peak) + idle
+        return _response(TPM_RC_SUCCESS, params=params)
+
+    def _auth(self, r: _Reader) -> bytes:
+        """Parse the authorization area (one password session); returns the hmac/password"""
+        size = r.u32()
+        end = r.off + size
+        if size == 0:
+            raise _TPMError(TPM_RC_AUTH_MISSING)
+        if r.u32() != TPM_RS_PW:
+            raise _TPMError(TPM_RC_AUTH_FAIL)
+        r.tpm2b()  # nonce
+        r.u8()  # sessionAttributes
+        password = r.tpm2b()
+        r.off = end
+        return password
+
+    def _object(self, state: _TPMState, handle: int) -> dict:
+        obj = state.objects.get(handle) or state.persistent.get(handle)
+        if obj is None:
+            raise _TPMError(TPM_RC_HANDLE)
+        return obj
+
+    def _sequence(self, state: _TPMState, handle: int, kind: str | None = None) -> dict:
+        seq = state.sequences.get(handle)
+        if seq is None or (kind and seq["kind"] != kind):
+            raise _TPMError(TPM_RC_HANDLE)
+        return seq
+
+    def _startup(self, state: _TPMState, cmd: bytes) -> bytes:
+        if state.started:
+            raise _TPMError(TPM_RC_INITIALIZE)
+        state.started = True
+        return _response(TPM_RC_SUCCESS)
+
+    def _get_random(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        n = min(r.u16(), MAX_RANDOM_BYTES)
+        return _response(TPM_RC_SUCCESS, params=_tpm2b(os.urandom(n)))
+
+    def _get_capability(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        capability, prop, count = r.u32(), r.u32(), r.u32()
+        if capability != TPM_CAP_TPM_PROPERTIES:
+            raise _TPMError(TPM_RC_VALUE)
+        tags = sorted(t for t in TPM_PROPERTIES if t >= prop)
+        count = min(count, MAX_CAP_PROPERTIES)
+        more = len(tags) > count
+        params = struct.pack(">BII", int(more), capability, min(count, len(tags)))
+        for tag in tags[:count]:
+            params += struct.pack(">II", tag, TPM_PROPERTIES[tag])
+        return _response(TPM_RC_SUCCESS, params=params)
+
+    def _create_primary(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        hierarchy = r.u32()
+        self._auth(r)
+        sensitive = _Reader(r.tpm2b())
+        user_auth = sensitive.tpm2b()
+        in_public = r.tpm2b()
+
+        p = _Reader(in_public)
+        type_alg = p.u16()
+        if type_alg != TPM_ALG_DILITHIUM:
+            raise _TPMError(TPM_RC_TYPE)
+        name_alg = p.u16()
+        attrs = p.u32()
+        auth_policy = p.tpm2b()
+        symmetric = p.u16()
+        scheme = p.u16()
+        level = p.u8()
+        if level not in DILITHIUM_SIZES:
+            raise _TPMError(TPM_RC_VALUE)
+
+        # Primary keys are derived from the template, as on a real TPM
+        seed = hashlib.sha256(state.proof + struct.pack(">I", hierarchy) + in_public).digest()
+        pk, sk = state.backend.keygen(level, seed)
+
+        public_area = (
+            struct.pack(">HHI", type_alg, name_alg, attrs)
+            + _tpm2b(auth_policy)
+            + struct.pack(">HHB", symmetric, scheme, level)
+            + _tpm2b(pk)
+        )
+        name = struct.pack(">H", TPM_ALG_SHA256) + hashlib.sha256(public_area).digest()
+        handle = state.next_object
+        state.next_object += 1
+        state.objects[handle] = {
+            "level": level,
+            "pk": pk,
+            "sk": sk,
+            "auth": user_auth,
+            "public": public_area,
+            "name": name,
+        }
+
+        params = (
+            _tpm2b(public_area)
+            + _tpm2b(b"")  # creationData
+            + _tpm2b(b"")  # creationHash
+            + struct.pack(">HI", TPM_ST_CREATION, hierarchy)
+            + _tpm2b(b"")  # creationTicket digest
+            + _tpm2b(name)
+        )
+        return _response(TPM_RC_SUCCESS, struct.pack(">I", handle), params, sessions=True)
+
+    def _read_public(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        obj = self._object(state, r.u32())
+        # qualifiedName: primaries only, so parent name (owner) then the object name
+        qualified = struct.pack(">H", TPM_ALG_SHA256) + hashlib.sha256(
+            struct.pack(">I", TPM_RH_OWNER) + obj["name"]
+        ).digest()
+        params = _tpm2b(obj["public"]) + _tpm2b(obj["name"]) + _tpm2b(qualified)
+        return _response(TPM_RC_SUCCESS, params=params)
+
+    def _evict_control(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        auth_handle = r.u32()
+        object_handle = r.u32()
+        self._auth(r)
+        persistent_handle = r.u32()
+        if auth_handle != TPM_RH_OWNER:
+            raise _TPMError(TPM_RC_HIERARCHY)
+        if not TPM_HR_PERSISTENT <= persistent_handle <= PERSISTENT_LAST:
+            raise _TPMError(TPM_RC_RANGE)
+        if object_handle in state.persistent:
+            # Persistent object: evict it from NV
+            if object_handle != persistent_handle:
+                raise _TPMError(TPM_RC_HANDLE)
+            del state.persistent[object_handle]
+        else:
+            obj = self._object(state, object_handle)
+            if persistent_handle in state.persistent:
+                raise _TPMError(TPM_RC_NV_DEFINED)
+            if len(state.persistent) >= MAX_PERSISTENT_OBJECTS:
+                raise _TPMError(TPM_RC_NV_SPACE)
+            state.persistent[persistent_handle] = dict(obj)
+        return _response(TPM_RC_SUCCESS, sessions=True)
+
+    def _flush_context(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        handle = r.u32()
+        if state.objects.pop(handle, None) is None and state.sequences.pop(handle, None) is None:
+            raise _TPMError(TPM_RC_HANDLE)
+        return _response(TPM_RC_SUCCESS)
+
+    def _new_sequence(self, state: _TPMState, seq: dict) -> int:
+        handle = state.next_sequence
+        state.next_sequence += 1
+        state.sequences[handle] = seq
+        return handle
+
+    def _hashsign_start(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        key_handle = r.u32()
+        obj = self._object(state, key_handle)
+        if not hmac.compare_digest(self._auth(r), obj["auth"]):
+            raise _TPMError(TPM_RC_AUTH_FAIL)
+        total = r.u32()
+        handle = self._new_sequence(
+            state, {"kind": "sign", "key": key_handle, "total": total, "buf": bytearray()}
+        )
+        return _response(TPM_RC_SUCCESS, struct.pack(">I", handle), sessions=True)
+
+    def _sequence_update(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        seq = self._sequence(state, r.u32())
+        self._auth(r)
+        chunk = r.tpm2b()
+        if len(chunk) > MAX_DIGEST_BUFFER or len(seq["buf"]) + len(chunk) > seq["total"]:
+            raise _TPMError(TPM_RC_SIZE)
+        seq["buf"] += chunk
+        return _response(TPM_RC_SUCCESS, sessions=True)
+
+    def _hashsign_finish(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        handle = r.u32()
+        seq = self._sequence(state, handle, "sign")
+        self._auth(r)
+        if len(seq["buf"]) != seq["total"]:
+            raise _TPMError(TPM_RC_SIZE)
+        obj = self._object(state, seq["key"])
+        del state.sequences[handle]
+        sig = state.backend.sign(obj["level"], obj["sk"], bytes(seq["buf"]))
+        params = struct.pack(">HH", TPM_ALG_DILITHIUM, TPM_ALG_NULL) + _tpm2b(sig)
+        return _response(TPM_RC_SUCCESS, params=params, sessions=True)
+
+    def _hashsign_digest(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        obj = self._object(state, r.u32())
+        if not hmac.compare_digest(self._auth(r), obj["auth"]):
+            raise _TPMError(TPM_RC_AUTH_FAIL)
+        digest = r.tpm2b()
+        if len(digest) != PREHASH_DIGEST_SIZE:
+            raise _TPMError(TPM_RC_SIZE)
+        # The digest is signed as the message, in one pass through the core
+        sig = state.backend.sign(obj["level"], obj["sk"], digest)
+        params = struct.pack(">HH", TPM_ALG_DILITHIUM, TPM_ALG_NULL) + _tpm2b(sig)
+        return _response(TPM_RC_SUCCESS, params=params, sessions=True)
+
+    def _hashverify_start(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        key_handle = r.u32()
+        self._object(state, key_handle)
+        total = r.u32()
+        sig_alg = r.u16()
+        r.u16()  # hashAlg
+        sig = r.tpm2b()
+        if sig_alg != TPM_ALG_DILITHIUM:
+            raise _TPMError(TPM_RC_VALUE)
+        handle = self._new_sequence(
+            state,
+            {"kind": "verify", "key": key_handle, "total": total, "buf": bytearray(), "sig": sig},
+        )
+        return _response(TPM_RC_SUCCESS, struct.pack(">I", handle))
+
+    def _hashverify_finish(self, state: _TPMState, cmd: bytes) -> bytes:
+        r = _Reader(cmd, TPM_HEADER_SIZE)
+        handle = r.u32()
+        seq = self._sequence(state, handle, "verify")
+        self._auth(r)
+        obj = self._object(state, seq["key"])
+        del state.sequences[handle]
+        msg = bytes(seq["buf"])
+        if len(msg) != seq["total"] or not state.backend.verify(obj["level"], obj["pk"], msg, seq["sig"]):
+            raise _TPMError(TPM_RC_SIGNATURE)
+        digest = hmac.new(state.proof, obj["name"] + hashlib.sha256(msg).digest(), hashlib.sha256).digest()
+        params = struct.pack(">HI", TPM_ST_VERIFIED, TPM_RH_OWNER) + _tpm2b(digest)
+        return _response(TPM_RC_SUCCESS, params=params, sessions=True)
+
+
+def _parse_latency(items) -> dict:
+    latency = {}
+    for item in items or []:
+        name, _, ms = item.partition("=")
+        if not ms:
+            raise argparse.ArgumentTypeError(f"--latency expects NAME=MS, got {item!r}")
+        latency[name] = float(ms)
+    return latency
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Pure-Python Petalite TPM stand-in (serial2tcp protocol)")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--tcp-port", type=int, default=4327, help="TCP port (default: 4327, as serial2tcp)")
+    parser.add_argument(
+        "--backend",
+        choices=["auto", "dilithium_py", "fake"],
+        default="auto",
+        help="Dilithium implementation (auto: dilithium_py if installed, else fake)",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        metavar="NAME=MS",
+        help="Per-command processing time, e.g. HashSignFinish=250 (repeatable)",
+    )
+    parser.add_argument("--latency-default", type=float, default=0.0, help="Processing time (ms) for other commands")
+    parser.add_argument("--baud", type=int, default=None, help="Model UART line rate (8N1) on both directions")
+    parser.add_argument("--boot-delay", type=float, default=0.0, help="Seconds before the boot READY byte")
+    parser.add_argument(
+        "--rx-slots",
+        type=int,
+        default=2,
+        help="Firmware command slots (default: 2, as TPM_RX_SLOTS; 1 = single buffer)",
+    )
+    parser.add_argument("--quiet", action="store_true", help="Do not log served commands")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = TPMStandIn(
+        host=args.host,
+        port=args.tcp_port,
+        backend=args.backend,
+        latency=_parse_latency(args.latency),
+        latency_default=args.latency_default,
+        baud=args.baud,
+        boot_delay=args.boot_delay,
+        rx_slots=args.rx_slots,
+        debug=not args.quiet,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Per-command latency split into phases, one HDR-style histogram per command and phase.
+
+    marshal  building the command bytes on the host
+    tx       command bytes over the link: until the last write returns, or with a
+             known line rate at least as long as the bytes take on the wire (8N1)
+    compute  end of transmission to the READY byte, i.e. the TPM executing the command
+    rx       READY byte to the last response byte arriving
+    decode   response arrival to the parsed result (includes waking the caller)
+
+TPMClient records every exchange into its `timings`:
+
+    client = TPMClient(uart, timings=CommandTimings(baud=115200))   # serial2tcp board
+    client.sign_file(message, key)
+    print(client.timings.render())
+    client.timings.histogram("HashSignFinish", "compute").percentile(99)
+
+Values are nanoseconds. Pipelined SequenceUpdates (window > 1) overlap, so their split
+is approximate.
+"""
+
+import threading
+
+from histogram import LatencyHistogram
+
+PHASES = ("marshal", "tx", "compute", "rx", "decode")
+
+
+class Exchange:
+    """perf_counter_ns() marks of one command/response exchange"""
+
+    __slots__ = ("name", "size", "begin", "sent", "tx_done", "ready", "received")
+
+    def __init__(self, name: str, size: int, begin: int, sent: int):
+        self.name = name
+        self.size = size
+        self.begin = begin
+        self.sent = sent
+        self.tx_done = None
+        self.ready = None
+        self.received = None
+
+
+class CommandTimings:
+    """{command name: {phase: LatencyHistogram}}; safe to share between threads"""
+
+    def __init__(self, baud: int | None = None):
+        # Line rate of the TPM's UART, if the host should account for bytes still in flight
+        self.baud = baud
+        self._lock = threading.Lock()
+        self._hists = {}
+
+    def wire_ns(self, num_bytes: int) -> int:
+        return num_bytes * 10 * 1_000_000_000 // self.baud if self.baud else 0
+
+    def split(self, ex: Exchange, end: int) -> dict:
+        """{phase: ns} of a finished exchange; marks the link did not provide count as 0"""
+        ready = ex.ready if ex.ready is not None else ex.sent
+        received = ex.received if ex.received is not None else ready
+        tx_end = max(ex.sent, ex.tx_done or ex.sent, ex.sent + self.wire_ns(ex.size))
+        tx_end = min(tx_end, ready)
+        return {
+            "marshal": ex.sent - ex.begin,
+            "tx": tx_end - ex.sent,
+            "compute": ready - tx_end,
+            "rx": received - ready,
+            "decode": max(0, end - received),
+        }
+
+    def _command(self, name: str) -> dict:
+        with self._lock:
+            hists = self._hists.get(name)
+            if hists is None:
+                hists = self._hists[name] = {phase: LatencyHistogram() for phase in PHASES}
+        return hists
+
+    def record(self, ex: Exchange, end: int) -> dict:
+        phases = self.split(ex, end)
+        hists = self._command(ex.name)
+        for phase, ns in phases.items():
+            hists[phase].record(ns)
+        return phases
+
+    def names(self) -> list:
+        with self._lock:
+            return list(self._hists)
+
+    def histogram(self, name: str, phase: str) -> LatencyHistogram | None:
+        with self._lock:
+            hists = self._hists.get(name)
+        return hists[phase] if hists else None
+
+    def merge(self, other: "CommandTimings"):
+        for name in other.names():
+            hists = self._command(name)
+            for phase in PHASES:
+                hists[phase].merge(other.histogram(name, phase))
+
+    def reset(self):
+        with self._lock:
+            self._hists = {}
+
+    def summary(self, percentiles=(50, 90, 99), scale: float = 1e6) -> dict:
+        """{command: {phase: count/min/mean/pXX/max}}, values divided by `scale` (ms by default)"""
+        return {
+            name: {phase: self.histogram(name, phase).summary(percentiles, scale) for phase in PHASES}
+            for name in self.names()
+        }
+
+    def render(self, p: float = 50, unit: str = "ms", scale: float = 1e6) -> str:
+        """Table of the p-th percentile per phase; `bound` is wire when tx + rx outweighs compute"""
+        lines = [
+            f"{'command':<26} {'n':>6}  "
+            + "  ".join(f"{phase:>8}" for phase in PHASES)
+            + f"  {'bound':>5}   (p{p:g}, {unit})"
+        ]
+        for name in self.names():
+            values = {phase: self.histogram(name, phase).percentile(p) for phase in PHASES}
+            bound = "wire" if values["tx"] + values["rx"] > values["compute"] else "core"
+            count = self.histogram(name, "compute").count
+            lines.append(
+                f"{name:<26} {count:>6}  "
+                + "  ".join(f"{values[phase] / scale:>8.2f}" for phase in PHASES)
+                + f"  {bound:>5}"
+            )
+        return "\n".join(lines)
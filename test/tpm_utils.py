@@ -1,13 +1,206 @@
 import time
+import struct
+import hashlib
+import functools
 
 # Shared TPM constants
 TPM_ALG_ECC = 0x0023
 TPM_ALG_DILITHIUM = 0x0072
+TPM_ALG_NULL = 0x0010
+TPM_ALG_SHA256 = 0x000B
+TPM_RH_OWNER = 0x40000001
 TPM_CC_HashSignStart = 0x200001A0
 TPM_CC_HashSignFinish = 0x200001A1
 TPM_CC_SequenceUpdate = 0x0000015C
 TPM_CC_HashVerifyStart = 0x200001A2
 TPM_CC_HashVerifyFinish = 0x200001A3
+TPM_CC_HashSignDigest = 0x200001A4
+TPM_CC_ReadPerfCounters = 0x200001A5
+TPM_CC_Startup = 0x00000144
+TPM_CC_GetRandom = 0x0000017B
+TPM_CC_CreatePrimary = 0x00000131
+TPM_CC_GetCapability = 0x0000017A
+TPM_CC_EvictControl = 0x00000120
+TPM_CC_ReadPublic = 0x00000173
+TPM_CC_FlushContext = 0x00000165
+
+# Owner persistent object handles (TPM2_EvictControl)
+TPM_HR_PERSISTENT = 0x81000000
+PERSISTENT_LAST = 0x817FFFFF
+
+TPM_CAP_TPM_PROPERTIES = 0x00000006
+TPM_PT_INPUT_BUFFER = 0x0000010D  # largest TPM2B_MAX_BUFFER (SequenceUpdate chunk)
+TPM_PT_MAX_COMMAND_SIZE = 0x0000011E
+TPM_PT_MAX_RESPONSE_SIZE = 0x0000011F
+
+# PetaliteCore.add_io reserves a 12 KB tpm_cmd_buffer, split by the firmware into
+# TPM_RX_SLOTS command slots of TPM_MAX_CMD_LEN (transport.h); every command must fit in one slot
+TPM_MAX_CMD_LEN = 6 * 1024
+TPM_RX_SLOTS = 2
+TPM_CMD_BUFFER_SIZE = TPM_RX_SLOTS * TPM_MAX_CMD_LEN
+# Used when the TPM cannot report its limits
+DEFAULT_CHUNK_SIZE = 256
+
+# ReadPerfCounters sections, in firmware order (perf.h perf_section_t). Sections nest:
+# RunCommand spans the whole command, DMA waits also count in the dilithium_* around them.
+# Hw* are the gateware PerfCounters over the command (busy: a Dilithium op in flight;
+# compute: busy and waiting on neither DMA; Sink/Source: reader -> core -> writer stream,
+# Starved = consumer waiting for data, Blocked = producer waiting for the consumer;
+# Reader/WriterWait: wishbone wait states of the DMA masters)
+PERF_SECTIONS = (
+    "RunCommand",
+    "DilithiumKeygen",
+    "DilithiumSignStart",
+    "DilithiumUpdate",
+    "DilithiumSignFinish",
+    "DilithiumVerifyStart",
+    "DilithiumVerifyFinish",
+    "DmaReadWait",
+    "DmaWriteWait",
+    "PackKeypair",
+    "PackSig",
+    "HwDilithiumBusy",
+    "HwDilithiumCompute",
+    "HwSinkStarved",
+    "HwSinkBlocked",
+    "HwSourceStarved",
+    "HwSourceBlocked",
+    "HwReaderWait",
+    "HwWriterWait",
+)
+
+# Pre-hash signing: HashSignDigest signs a SHAKE256 digest of the message, this long
+PREHASH_DIGEST_SIZE = 64
+
+TPM_ST_NO_SESSIONS = 0x8001
+TPM_ST_SESSIONS = 0x8002
+TPM_HEADER_SIZE = 10
+
+TPM_CC_NAMES = {
+    TPM_CC_Startup: "Startup",
+    TPM_CC_GetRandom: "GetRandom",
+    TPM_CC_CreatePrimary: "CreatePrimary",
+    TPM_CC_SequenceUpdate: "SequenceUpdate",
+    TPM_CC_HashSignStart: "HashSignStart",
+    TPM_CC_HashSignFinish: "HashSignFinish",
+    TPM_CC_HashVerifyStart: "HashVerifyStart",
+    TPM_CC_HashVerifyFinish: "HashVerifyFinish",
+    TPM_CC_HashSignDigest: "HashSignDigest",
+    TPM_CC_ReadPerfCounters: "ReadPerfCounters",
+    TPM_CC_GetCapability: "GetCapability",
+    TPM_CC_EvictControl: "EvictControl",
+    TPM_CC_ReadPublic: "ReadPublic",
+    TPM_CC_FlushContext: "FlushContext",
+}
+
+
+def command_name(cc: int) -> str:
+    return TPM_CC_NAMES.get(cc, f"0x{cc:08X}")
+
+
+class CommandTemplate:
+    """A command shape compiled once into a byte prototype with known field offsets.
+
+    render() copies the prototype and patches commandSize, the handle(s) and the
+    TPM2B length in place; a payload of `payload_len` bytes is sent after it.
+    """
+
+    _U16 = struct.Struct(">H")
+    _U32 = struct.Struct(">I")
+
+    def __init__(self, prototype: bytes, handle_offsets: tuple = (), tpm2b_offset: int | None = None):
+        self.prototype = bytes(prototype)
+        self.handle_offsets = tuple(handle_offsets)
+        self.tpm2b_offset = tpm2b_offset
+
+    def render(self, *handles: int, payload_len: int = 0) -> bytearray:
+        buf = bytearray(self.prototype)
+        self._U32.pack_into(buf, 2, len(buf) + payload_len)
+        for off, handle in zip(self.handle_offsets, handles):
+            self._U32.pack_into(buf, off, handle)
+        if self.tpm2b_offset is not None:
+            self._U16.pack_into(buf, self.tpm2b_offset, payload_len)
+        return buf
+
+
+@functools.lru_cache(maxsize=None)
+def command_template(name: str) -> CommandTemplate:
+    """Compiled template for one of the near-constant commands, built on first use.
+
+    "CreatePrimary(Dilithium)" (L2, userAuth "abcd"), "HashSignFinish",
+    "HashVerifyFinish" and "SequenceUpdate" (render(seq, payload_len=len(chunk))).
+    """
+    # tpm_marshal and tpm_schema import this module, so import them lazily
+    from tpm_marshal import CommandBuilder, create_primary_dilithium
+    from tpm_schema import encode_command
+
+    m = CommandBuilder()
+    if name == "CreatePrimary(Dilithium)":
+        return CommandTemplate(create_primary_dilithium(m))
+    if name in ("HashSignFinish", "HashVerifyFinish"):
+        # sequence handle with an empty RS_PW auth, no parameters
+        return CommandTemplate(encode_command(m, name, 0), handle_offsets=(TPM_HEADER_SIZE,))
+    if name == "SequenceUpdate":
+        # the TPM2B_MAX_BUFFER size is the last field; the chunk is sent after it
+        prototype = encode_command(m, name, 0, b"")
+        return CommandTemplate(prototype, handle_offsets=(TPM_HEADER_SIZE,), tpm2b_offset=len(prototype) - 2)
+    raise KeyError(f"No command template for {name!r}")
+
+
+def max_sequence_chunk(input_buffer: int, max_command_size: int) -> int:
+    """Largest SequenceUpdate chunk allowed by TPM_PT_INPUT_BUFFER and
+    TPM_PT_MAX_COMMAND_SIZE that also fits one firmware receive slot"""
+    overhead = len(command_template("SequenceUpdate").prototype)
+    slot = TPM_CMD_BUFFER_SIZE // TPM_RX_SLOTS
+    return max(1, min(input_buffer, max_command_size - overhead, slot - overhead))
+
+
+def prehash_digest(chunks) -> bytes:
+    """Message representative signed in pre-hash mode: SHAKE256 of the message
+    (a bytes-like object or an iterable of buffers), PREHASH_DIGEST_SIZE bytes"""
+    h = hashlib.shake_256()
+    if isinstance(chunks, (bytes, bytearray, memoryview)):
+        h.update(chunks)
+    else:
+        for chunk in chunks:
+            h.update(chunk)
+    return h.digest(PREHASH_DIGEST_SIZE)
+
+
+def decode_perf_counters(rsp) -> dict:
+    """ReadPerfCounters response as {"clock_hz", "commands": {name: {"count", "sections"}}}.
+
+    sections maps a PERF_SECTIONS name to calls, total/max cycles and total/max/mean µs;
+    sections never entered are left out. Commands past the firmware table size are
+    accumulated under "other".
+    """
+    if len(rsp) < TPM_HEADER_SIZE + 6:
+        raise RuntimeError("ReadPerfCounters response too short")
+    clock_hz, n_sections, n_commands = struct.unpack_from(">IBB", rsp, TPM_HEADER_SIZE)
+    off = TPM_HEADER_SIZE + 6
+    us_per_cycle = 1e6 / clock_hz if clock_hz else 0.0
+    names = [PERF_SECTIONS[i] if i < len(PERF_SECTIONS) else f"section{i}" for i in range(n_sections)]
+    commands = {}
+    for _ in range(n_commands):
+        if len(rsp) < off + 8 + 16 * n_sections:
+            raise RuntimeError("ReadPerfCounters response truncated")
+        cc, count = struct.unpack_from(">II", rsp, off)
+        off += 8
+        sections = {}
+        for name in names:
+            calls, cycles, peak = struct.unpack_from(">IQI", rsp, off)
+            off += 16
+            if calls:
+                sections[name] = {
+                    "calls": calls,
+                    "cycles": cycles,
+                    "max_cycles": peak,
+                    "us": cycles * us_per_cycle,
+                    "max_us": peak * us_per_cycle,
+                    "mean_us": cycles * us_per_cycle / calls,
+                }
+        commands["other" if cc == 0 else command_name(cc)] = {"count": count, "sections": sections}
+    return {"clock_hz": clock_hz, "commands": commands}
 
 
 def u32_be_hex(v: int) -> str:
@@ -37,51 +230,27 @@ def parse_createprimary_outpublic(rsp: bytes):
     """Parse CreatePrimary outPublic and return a dict with type and key fields.
     Supports ECC and Dilithium; returns raw bytes for unknown types.
     """
+    # tpm_schema imports this module, so import it lazily
+    from tpm_schema import decode_createprimary_outpublic
+
     off = sessions_param_offset(rsp, response_handle_count=1)
-    if off + 2 > len(rsp):
-        raise RuntimeError("Bad CreatePrimary response (no outPublic)")
-    out_pub_size = int.from_bytes(rsp[off : off + 2], "big")
-    off += 2
-    end = off + out_pub_size
-    if end > len(rsp):
+    if len(rsp) < off + 12:
         raise RuntimeError("Bad CreatePrimary response (truncated outPublic)")
-
-    p = off
-    type_alg = int.from_bytes(rsp[p : p + 2], "big")
-    p += 2
-    name_alg = int.from_bytes(rsp[p : p + 2], "big")
-    p += 2
-    object_attrs = int.from_bytes(rsp[p : p + 4], "big")
-    p += 4
-    ap_size = int.from_bytes(rsp[p : p + 2], "big")
-    p += 2
-    p += ap_size
-
-    if type_alg == TPM_ALG_DILITHIUM:
-        p += 2 + 2 + 1  # symmetric + scheme + securityLevel
-        u_size = int.from_bytes(rsp[p : p + 2], "big")
-        p += 2
-        pub = rsp[p : p + u_size]
-        return {"type": "dilithium", "nameAlg": name_alg, "objectAttributes": object_attrs, "pub": pub}
-
-    if type_alg == TPM_ALG_ECC:
-        p += 2 + 2 + 2 + 2 + 2  # ECC parameters
-        x_size = int.from_bytes(rsp[p : p + 2], "big")
-        p += 2
-        x = rsp[p : p + x_size]
-        p += x_size
-        y_size = int.from_bytes(rsp[p : p + 2], "big")
-        p += 2
-        y = rsp[p : p + y_size]
-        p += y_size
-        return {"type": "ecc", "nameAlg": name_alg, "objectAttributes": object_attrs, "x": x, "y": y}
-
-    return {"type": f"0x{type_alg:04X}", "nameAlg": name_alg, "objectAttributes": object_attrs, "raw": rsp[off:end]}
+    alg, name_alg, attrs = struct.unpack_from(">HHI", rsp, off + 2)
+    common = {"nameAlg": name_alg, "objectAttributes": attrs}
+    if alg == TPM_ALG_DILITHIUM:
+        pub = decode_createprimary_outpublic(rsp)
+        return {"type": "dilithium", **common, "pub": bytes(pub.unique)}
+    if alg == TPM_ALG_ECC:
+        pub = decode_createprimary_outpublic(rsp)
+        return {"type": "ecc", **common, "x": bytes(pub.unique.x), "y": bytes(pub.unique.y)}
+    size = int.from_bytes(rsp[off : off + 2], "big")
+    return {"type": f"0x{alg:04X}", **common, "raw": bytes(rsp[off + 2 : off + 2 + size])}
 
 
 def build_dilithium_signature_param(sig: bytes) -> str:
     """Return TPMT_SIGNATURE for Dilithium: sigAlg|hashAlg(NULL)|TPM2B sig."""
     sigAlg = u16_be_hex(TPM_ALG_DILITHIUM)
-    hashAlg = u16_be_hex(0x0010)  # TPM_ALG_NULL
+    hashAlg = u16_be_hex(TPM_ALG_NULL)
     tpmb = u16_be_hex(len(sig)) + bytes_hex(sig)
     return f"{sigAlg}{hashAlg}{tpmb}"
@@ -1,16 +1,99 @@
+import os
 import time
 import socket
+import select
+import selectors
 import threading
 import queue
+import collections
 
 try:
     import serial  # (optional when using TCP only)
 except Exception:
     serial = None
 
+from wire_log import WireLog, LEVEL_OFF, LEVEL_WIRE
+from wire_capture import PcapngCapture
+from histogram import LatencyHistogram
+
 
 DILITHIUM_READY_BYTE = 0xA0
 BASE_ACK_GROUP_LENGTH = 64
+RX_RING_SIZE = 64 * 1024
+RX_READ_SIZE = 4096
+# Queued commands are coalesced into one gather write up to these limits
+TX_COALESCE_MAX = 64 * 1024
+TX_MAX_IOV = 64
+
+
+def _advance(views: list, n: int) -> list:
+    """Drop the first `n` bytes from a list of memoryviews (no copies)"""
+    i = 0
+    while i < len(views) and n >= len(views[i]):
+        n -= len(views[i])
+        i += 1
+    views = views[i:]
+    if views and n:
+        views[0] = views[0][n:]
+    return views
+
+
+class _RingBuffer:
+    """Preallocated single-producer/single-consumer byte ring.
+
+    The read worker receives straight into `writable()` and publishes with `commit()`;
+    consumers look at `views()` (memoryview slices, no copies) and release with `consume()`.
+    `head`/`tail` are free-running byte counters, so available = head - tail.
+    """
+
+    def __init__(self, capacity: int = RX_RING_SIZE):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.head = 0
+        self.tail = 0
+
+    def available(self) -> int:
+        return self.head - self.tail
+
+    def writable(self) -> memoryview:
+        """Largest contiguous free region starting at head (may be empty when full)."""
+        free = self.capacity - (self.head - self.tail)
+        start = self.head % self.capacity
+        return self.view[start : start + min(free, self.capacity - start)]
+
+    def commit(self, n: int):
+        self.head += n
+
+    def views(self, n: int, offset: int = 0):
+        """Up to two memoryviews covering n bytes starting `offset` bytes after tail."""
+        start = (self.tail + offset) % self.capacity
+        first = min(n, self.capacity - start)
+        if first == n:
+            return (self.view[start : start + n],)
+        return (self.view[start:], self.view[: n - first])
+
+    def consume(self, n: int):
+        self.tail += n
+
+    def find(self, value: int, n: int, offset: int = 0) -> int:
+        """Offset (relative to tail) of the first `value` in [offset, offset + n), or -1."""
+        start = (self.tail + offset) % self.capacity
+        first = min(n, self.capacity - start)
+        idx = self.buf.find(value, start, start + first)
+        if idx >= 0:
+            return offset + idx - start
+        if first < n:
+            idx = self.buf.find(value, 0, n - first)
+            if idx >= 0:
+                return offset + first + idx
+        return -1
+
+    def copy_into(self, dest: memoryview, n: int):
+        pos = 0
+        for v in self.views(n):
+            dest[pos : pos + len(v)] = v
+            pos += len(v)
 
 
 class _SocketTransport:
@@ -23,9 +106,28 @@ class _SocketTransport:
     def recv(self, size: int) -> bytes:
         return self.sock.recv(size)
 
+    def recv_into(self, view: memoryview) -> int:
+        n = self.sock.recv_into(view)
+        if n == 0 and len(view):
+            raise ConnectionError("Connection closed by peer")
+        return n
+
+    def fileno(self):
+        return self.sock.fileno()
+
     def sendall(self, data: bytes):
         self.sock.sendall(data)
 
+    def sendv(self, bufs: list) -> int:
+        """Gather-write every buffer in `bufs`; returns the number of syscalls"""
+        views = [memoryview(b) for b in bufs]
+        calls = 0
+        while views:
+            n = self.sock.sendmsg(views)
+            calls += 1
+            views = _advance(views, n)
+        return calls
+
     def close(self):
         self.sock.close()
 
@@ -33,6 +135,11 @@ class _SocketTransport:
 class _SerialTransport:
     def __init__(self, ser):
         self.ser = ser
+        # POSIX pyserial opens the port O_NONBLOCK, so the selector reader can use it
+        try:
+            self.fd = ser.fileno()
+        except Exception:
+            self.fd = None
 
     def settimeout(self, t: float):
         self.ser.timeout = t
@@ -42,14 +149,52 @@ class _SerialTransport:
         # pyserial returns b'' on timeout
         return self.ser.read(size)
 
+    def recv_into(self, view: memoryview) -> int:
+        if self.fd is not None:
+            # Only called once the selector reports the port readable
+            try:
+                n = os.readv(self.fd, [view])
+            except BlockingIOError:
+                return 0
+            if n == 0 and len(view):
+                # Readable with nothing to read: the port hung up (e.g. adapter unplugged)
+                raise ConnectionError(f"Serial port {self.ser.port} closed")
+            return n
+        # pyserial returns 0 on timeout
+        return self.ser.readinto(view) or 0
+
+    def fileno(self):
+        return self.fd
+
     def sendall(self, data: bytes):
-        # Ensure full write by looping until all bytes sent
-        total = 0
-        while total < len(data):
-            n = self.ser.write(data[total:])
-            if n is None:
+        self.sendv([data])
+
+    def sendv(self, bufs: list) -> int:
+        """Write every buffer in `bufs`; returns the number of syscalls"""
+        views = [memoryview(b) for b in bufs]
+        calls = 0
+        if self.fd is None:
+            # No descriptor: one pyserial write per buffer, partial writes resume on a view
+            for view in views:
+                while view:
+                    n = self.ser.write(view) or 0
+                    calls += 1
+                    view = view[n:]
+            return calls
+        while views:
+            try:
+                n = os.writev(self.fd, views)
+            except BlockingIOError:
                 n = 0
-            total += n
+            calls += 1
+            if n:
+                views = _advance(views, n)
+                continue
+            # Kernel TX buffer full; wait for it to drain (close() makes the fd invalid)
+            if not self.ser.is_open:
+                raise ConnectionError("Serial port closed")
+            select.select([], [self.fd], [], 0.5)
+        return calls
 
     def close(self):
         self.ser.close()
@@ -70,9 +215,15 @@ class UARTConnection:
         serial_timeout: float = 0.1,
         name: str = None,
         debug: bool = True,
-        # File logging options
+        # Wire logging options (binary log, render with `python wire_log.py <path>`)
         log_path: str | None = None,
         log_writes: bool = True,
+        log_level: int | None = None,
+        # pcapng capture of framed TPM traffic (see wire_capture.py)
+        capture_path: str | None = None,
+        # Receive ring capacity (should hold a few full responses) and bytes per read
+        rx_buffer_size: int = RX_RING_SIZE,
+        read_size: int = RX_READ_SIZE,
     ):
         self.name = name
         # Keep original debug flag semantics
@@ -81,9 +232,13 @@ class UARTConnection:
         self.mode = mode
 
         self.log_read_each_byte = mode == "serial"
+        self.read_size = max(1, int(read_size))
 
-        # Transport open
+        # Transport open; endpoint names the device ("host:port" or the serial port)
         self.transport = None
+        self.endpoint = None
+        # Line rate, when this end knows it (serial); bytes can still be on the wire after a write returns
+        self.baudrate = baudrate if mode == "serial" else None
         if mode == "serial":
             if serial is None:
                 raise RuntimeError(
@@ -99,9 +254,61 @@ class UARTConnection:
         else:
             raise ValueError("mode must be 'tcp' or 'serial'")
 
-        # Queues
-        self.received_data = queue.Queue()
+        # Wire logging: I/O threads only queue raw bytes, a batch thread writes them
+        self.log_path = log_path
+        self.log_writes = log_writes
+        if log_level is None:
+            log_level = LEVEL_WIRE if self.debug else LEVEL_OFF
+        self.wire_log = WireLog(
+            path=log_path,
+            name=name,
+            level=log_level,
+            per_byte=self.log_read_each_byte,
+        )
+        self.wire_log.note("UART log started")
+        self.capture = PcapngCapture(capture_path, name=name) if capture_path else None
+        # Recorders that want raw reads/writes; empty when nothing is enabled
+        self._wire_sinks = [log for log in (self.wire_log, self.capture) if log and log.wire]
+
+        # Receive ring (filled in place by the read worker) and send queue.
+        # Consumers publish what they are waiting for (a byte count or a marker byte)
+        # and the reader only signals _rx_cond once that condition is met.
+        self._rx = _RingBuffer(rx_buffer_size)
+        self._rx_lock = threading.Lock()
+        self._rx_cond = threading.Condition(self._rx_lock)
+        self._rx_space = threading.Condition(self._rx_lock)
+        self._rx_error = None
+        self._rx_want_bytes = 0
+        self._rx_want_byte = None
+        self._rx_scanned = 0
+        self._rx_reader_blocked = False
+        # perf_counter_ns() of the read that satisfied the waiter, for wake_latency
+        self._rx_ready_ns = None
+        # perf_counter_ns() of the latest read, of the latest read when wait_for_ready()
+        # found its byte and of the latest completed write (TPMClient phase timing)
+        self.rx_last_ns = None
+        self.ready_ns = None
+        self.tx_done_ns = None
+        self.wake_latency = LatencyHistogram()
+        # Host-side metrics (tpm_metrics), updated by the calling thread, never by the I/O threads:
+        # READY wait per wait_for_ready() in ns, and timeouts by what was waited for
+        self.ready_wait = LatencyHistogram()
+        self.timeouts = collections.Counter()
+        self.rx_stats = {
+            "select_calls": 0,
+            "read_calls": 0,
+            "bytes_read": 0,
+            "wakeups": 0,
+        }
+        self.tx_stats = {
+            "write_calls": 0,
+            "bytes_written": 0,
+            "commands": 0,
+            "batches": 0,
+        }
         self.send_queue = queue.Queue()
+        # Self-pipe so close() can interrupt the reader's select()
+        self._wake_r, self._wake_w = socket.socketpair()
 
         # Start threads
         self.running = True
@@ -112,23 +319,6 @@ class UARTConnection:
         if self.debug:
             print(f"{self._id()} Read/Write threads started")
 
-        # Rolling pushback buffer
-        self._pushback = bytearray()
-
-        # File logging
-        self.log_path = log_path
-        self.log_writes = log_writes
-        self._log_fp = None
-        if self.log_path:
-            try:
-                self._log_fp = open(self.log_path, "a", buffering=1, encoding="utf-8")
-                # Timestamped header
-                ts = time.strftime("%Y-%m-%d %H:%M:%S")
-                self._log_fp.write(f"[{ts}] === UART log started ===\n")
-            except Exception as e:
-                print(f"{self._id()}[LOG] Failed to open log file: {e}")
-                self._log_fp = None
-
     def _id(self):
         return f"[{self.name}]" if self.name else ""
 
@@ -145,6 +335,7 @@ class UARTConnection:
                 self._console(f"✅ Connected after {elapsed:.2f} seconds!")
                 self.sock = sock
                 self.transport = _SocketTransport(sock)
+                self.endpoint = f"{host}:{port}"
                 return
             except (ConnectionRefusedError, socket.timeout):
                 try:
@@ -175,6 +366,7 @@ class UARTConnection:
             pass
         time.sleep(0.1)
         self.transport = _SerialTransport(ser)
+        self.endpoint = serial_port
         self._console("✅ Serial port opened")
 
     # Unified console/file helpers
@@ -182,203 +374,339 @@ class UARTConnection:
         if self.debug:
             print(f"{self._id()} {msg}")
 
-    def _emit_log_line(self, line: str):
-        if self._log_fp:
-            try:
-                self._log_fp.write(line + "\n")
-            except Exception:
-                pass
-        else:
-            print(line)
-
-    # NEW: simple HH:MM:SS timestamp for log lines
-    def _ts(self) -> str:
-        return time.strftime("%H:%M:%S")
+    def _publish_rx(self, n: int):
+        """Make n freshly received bytes visible; wake the consumer only if satisfied."""
+        arrived_ns = time.perf_counter_ns()
+        with self._rx_lock:
+            self._rx.commit(n)
+            self.rx_last_ns = arrived_ns
+            self.rx_stats["bytes_read"] += n
+            avail = self._rx.available()
+            wake = False
+            if self._rx_want_bytes and avail >= self._rx_want_bytes:
+                wake = True
+            elif self._rx_want_byte is not None:
+                # Only scan what the waiter has not looked at yet
+                scan_from = self._rx_scanned
+                if self._rx.find(self._rx_want_byte, avail - scan_from, scan_from) >= 0:
+                    wake = True
+                self._rx_scanned = avail
+            if wake:
+                self._rx_want_bytes = 0
+                self._rx_want_byte = None
+                self.rx_stats["wakeups"] += 1
+                self._rx_ready_ns = arrived_ns
+                self._rx_cond.notify()
+
+    def _wait_rx_space(self) -> bool:
+        """Block the reader while the ring is full; False once shutting down."""
+        with self._rx_lock:
+            while self.running and self._rx.available() == self._rx.capacity:
+                self._rx_reader_blocked = True
+                self._rx_space.wait()
+            self._rx_reader_blocked = False
+        return self.running
 
     def _read_worker(self):
-        """Background thread that continuously reads from transport"""
+        """Background thread that reads from transport into the ring when it is readable"""
+        fd = getattr(self.transport, "fileno", lambda: None)()
+        if fd is None:
+            return self._poll_read_worker()
+
+        sel = selectors.DefaultSelector()
+        sel.register(fd, selectors.EVENT_READ)
+        sel.register(self._wake_r, selectors.EVENT_READ)
+        try:
+            while self.running:
+                view = self._rx.writable()
+                if not view:
+                    if not self._wait_rx_space():
+                        break
+                    continue
+                events = sel.select()
+                self.rx_stats["select_calls"] += 1
+                if not self.running:
+                    break
+                if not any(key.fd == fd for key, _ in events):
+                    continue
+                view = view[: self.read_size]
+                n = self.transport.recv_into(view)
+                self.rx_stats["read_calls"] += 1
+                if n:
+                    for sink in self._wire_sinks:
+                        sink.read(view[:n])
+                    self._publish_rx(n)
+        except Exception as e:
+            self._rx_fail(e)
+        finally:
+            sel.close()
+
+    def _poll_read_worker(self):
+        """Fallback reader for transports without a selectable descriptor"""
         while self.running:
             try:
+                view = self._rx.writable()
+                if not view:
+                    if not self._wait_rx_space():
+                        break
+                    continue
                 self.transport.settimeout(0.1)
-                data = self.transport.recv(64)
-                if data:
-                    self.received_data.put(("data", data, time.time()))
-                    # Keep original behavior and format; just route to file if set
-                    if self.debug:
-                        if self.log_read_each_byte:
-                            for b in data:
-                                self._emit_log_line(
-                                    f"[{self._ts()}] {self._id()}[READ] {b:02x}"
-                                )
-                        else:
-                            self._emit_log_line(
-                                f"[{self._ts()}] {self._id()}[READ] {data.hex()}"
-                            )
+                view = view[: self.read_size]
+                n = self.transport.recv_into(view)
+                self.rx_stats["read_calls"] += 1
+                if n:
+                    for sink in self._wire_sinks:
+                        sink.read(view[:n])
+                    self._publish_rx(n)
             except socket.timeout:
                 continue
             except Exception as e:
-                if self.running:
-                    self._console(f"[READ ERROR] {e}")
-                    self.received_data.put(("error", str(e), time.time()))
+                self._rx_fail(e)
                 break
 
+    def _rx_fail(self, e: Exception):
+        if self.running:
+            self._console(f"[READ ERROR] {e}")
+            with self._rx_lock:
+                self._rx_error = str(e)
+                self._rx_cond.notify_all()
+
+    @property
+    def link_error(self) -> str | None:
+        """Reason the link went down (read error or close()), None while healthy"""
+        return self._rx_error
+
+    def get_rx_stats(self) -> dict:
+        """Snapshot of reader counters (syscalls, consumer wakeups, bytes per read)"""
+        stats = dict(self.rx_stats)
+        stats["syscalls"] = stats["select_calls"] + stats["read_calls"]
+        reads = stats["read_calls"]
+        stats["bytes_per_read"] = stats["bytes_read"] / reads if reads else 0.0
+        return stats
+
+    def get_tx_stats(self) -> dict:
+        """Snapshot of writer counters (syscalls, commands coalesced per write)"""
+        stats = dict(self.tx_stats)
+        calls = stats["write_calls"]
+        stats["bytes_per_write"] = stats["bytes_written"] / calls if calls else 0.0
+        batches = stats["batches"]
+        stats["commands_per_batch"] = stats["commands"] / batches if batches else 0.0
+        return stats
+
     def _write_worker(self):
-        """Background thread that handles sending data"""
-        while self.running:
+        """Background thread that sends queued commands, coalescing whatever is queued"""
+        stop = False
+        while not stop:
+            command = self.send_queue.get()
+            if command is None:
+                break
+            # Everything already queued was released by the caller (e.g. pipelined
+            # SequenceUpdates), so it can go out in the same gather write
+            bufs = []
+            size = 0
+            commands = 0
+            while command is not None:
+                commands += 1
+                if self._wire_sinks:
+                    self._record_write(command)
+                bufs.extend(command)
+                size += sum(len(b) for b in command)
+                if size >= TX_COALESCE_MAX or len(bufs) >= TX_MAX_IOV:
+                    break
+                try:
+                    command = self.send_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if command is None:
+                    stop = True
             try:
-                command = self.send_queue.get(timeout=0.1)
-                if command:
-                    # Keep original formatting for writes
-                    if self.debug:
-                        if isinstance(command, bytes):
-                            hex_str = command.hex().upper()
-                            # Truncate very long logs for readability. TODO: maybe I dont want this.
-                            if len(command) > 256:
-                                preview = hex_str[:256]  # first 128 bytes shown
-                                self._emit_log_line(
-                                    f"[{self._ts()}] {self._id()}[WRITE] 0x{preview}... (len={len(command)})"
-                                )
-                            else:
-                                self._emit_log_line(
-                                    f"[{self._ts()}] {self._id()}[WRITE] 0x{hex_str}"
-                                )
-                        elif isinstance(command, int):
-                            self._emit_log_line(
-                                f"[{self._ts()}] {self._id()}[WRITE] 0x{command:X}"
-                            )
-                        else:
-                            self._emit_log_line(
-                                f"[{self._ts()}] {self._id()}[WRITE] {repr(command)}"
-                            )
-
-                    if isinstance(command, str):
-                        command = command.encode()
-                    elif isinstance(command, int):
-                        command = bytes([command])
-
-                    self.transport.sendall(command)
-                    self.send_queue.task_done()
-            except queue.Empty:
-                continue
+                calls = self.transport.sendv(bufs)
+                self.tx_done_ns = time.perf_counter_ns()
+                self.tx_stats["write_calls"] += calls
+                self.tx_stats["bytes_written"] += size
+                self.tx_stats["commands"] += commands
+                self.tx_stats["batches"] += 1
             except Exception as e:
                 if self.running:
                     self._console(f"[WRITE ERROR] {e}")
+            finally:
+                # Drop the references before reporting the commands done, so callers
+                # waiting in wait_sent() can release their buffers (e.g. mmap views)
+                bufs = command = None
+                for _ in range(commands):
+                    self.send_queue.task_done()
 
-    def send_bytes(self, data):
-        """Send multiple bytes"""
-        self.send_queue.put(data)
+    def _record_write(self, command: list):
+        data = command[0] if len(command) == 1 else b"".join(command)
+        for sink in self._wire_sinks:
+            if self.log_writes or sink is self.capture:
+                sink.write(data)
+
+    def send_bytes(self, *parts):
+        """Queue one command. Several parts (e.g. header and payload) are sent
+        scatter-gather without being joined; buffers are not copied, so callers
+        must not modify them after queueing."""
+        command = []
+        for data in parts:
+            if isinstance(data, str):
+                data = data.encode()
+            elif isinstance(data, int):
+                data = bytes([data])
+            if len(data):
+                command.append(data)
+        if command:
+            self.send_queue.put(command)
+
+    def wait_sent(self, timeout: float = 5.0) -> bool:
+        """Wait until every queued command has been written and its buffers released"""
+        q = self.send_queue
+        deadline = time.monotonic() + timeout
+        with q.all_tasks_done:
+            while q.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts["send"] += 1
+                    return False
+                q.all_tasks_done.wait(remaining)
+        return True
 
     def get_received_data(self, timeout=0.1):
-        """Get any received data (non-blocking)"""
-        received = []
-        start_time = time.time()
-
-        while time.time() - start_time < timeout:
-            try:
-                item = self.received_data.get_nowait()
-                received.append(item)
-                self.received_data.task_done()
-            except queue.Empty:
-                break
-
-        return received
-
-    def _take_from_pushback(self, n: int) -> bytes:
-        """Remove and return up to n bytes from the pushback buffer."""
-        if not self._pushback:
-            return b""
-        take = min(n, len(self._pushback))
-        chunk = bytes(self._pushback[:take])
-        del self._pushback[:take]
-        return chunk
-
-    def _next_data_chunk(self, timeout=0.1):
-        """Yield next data/error item, preferring pushback first.
-
-        Returns a tuple (msg_type, data, timestamp) consistent with queue items.
-        If pushback has data, returns it as a single 'data' chunk.
+        """Get whatever is buffered, waiting up to `timeout` for the first byte"""
+        with self._rx_cond:
+            n = self._wait_available(1, time.monotonic() + timeout)
+            if not n:
+                return []
+            data = b"".join(self._rx.views(n))
+            self._consume(n)
+        return [("data", data, time.time())]
+
+    def _consume(self, n: int):
+        """Release n bytes from the ring (caller holds _rx_lock)."""
+        self._rx.consume(n)
+        self._rx_scanned = max(0, self._rx_scanned - n)
+        if self._rx_reader_blocked:
+            self._rx_space.notify()
+
+    def _wait_rx(self, deadline: float) -> bool:
+        """Sleep until the reader signals or `deadline` (monotonic) passes; False on timeout.
+
+        Must be called with _rx_cond held and a _rx_want_* request registered.
         """
-        if self._pushback:
-            data = bytes(self._pushback)
-            self._pushback.clear()
-            return ("data", data, time.time())
-        return self.received_data.get(timeout=timeout)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        self._rx_cond.wait(remaining)
+        ready_ns = self._rx_ready_ns
+        if ready_ns is not None:
+            self._rx_ready_ns = None
+            self.wake_latency.record(time.perf_counter_ns() - ready_ns)
+        return True
+
+    def _wait_available(self, n: int, deadline: float) -> int:
+        """Block until n bytes are buffered, an error is seen or the deadline passes.
+
+        Must be called with _rx_cond held. Returns the number of buffered bytes.
+        """
+        n = min(n, self._rx.capacity)
+        while self._rx.available() < n and self._rx_error is None:
+            self._rx_want_bytes = n
+            if not self._wait_rx(deadline):
+                break
+        self._rx_want_bytes = 0
+        return self._rx.available()
 
     def _wait_for_byte(self, expected_byte, signal_name: str = "", timeout=5):
-        """Wait for a specific byte value"""
-        start_time = time.perf_counter()
+        """Wait for a specific byte value, discarding everything before it"""
+        start_time = time.monotonic()
+        deadline = start_time + timeout
 
-        while time.perf_counter() - start_time < timeout:
-            try:
-                msg_type, data, timestamp = self._next_data_chunk(timeout=0.1)
-
-                if msg_type == "data" and data:
-                    for idx, byte in enumerate(data):
-                        if byte == expected_byte:
-                            if idx + 1 < len(data):
-                                remaining = data[idx + 1 :]
-                                self._pushback.extend(remaining)
-                            if signal_name:
-                                elapsed = time.perf_counter() - start_time
-                                self._console(
-                                    f"[{signal_name.upper()}] Received in {elapsed:.3f} seconds"
-                                )
-                            return True
-                elif msg_type == "error":
-                    self._console(f"[ERROR] {data}")
+        with self._rx_cond:
+            while True:
+                avail = self._rx.available()
+                if avail:
+                    idx = self._rx.find(expected_byte, avail)
+                    if idx >= 0:
+                        self._rx_want_byte = None
+                        self.ready_ns = self.rx_last_ns
+                        self._consume(idx + 1)
+                        if signal_name:
+                            elapsed = time.monotonic() - start_time
+                            self._console(
+                                f"[{signal_name.upper()}] Received in {elapsed:.3f} seconds"
+                            )
+                        return True
+                    self._consume(avail)
+                if self._rx_error is not None:
+                    self._console(f"[ERROR] {self._rx_error}")
                     return False
-
-            except queue.Empty:
-                continue
+                self._rx_scanned = 0
+                self._rx_want_byte = expected_byte
+                if not self._wait_rx(deadline):
+                    break
+            self._rx_want_byte = None
 
         self._console(
             f"[TIMEOUT] No {signal_name.upper()} received in {timeout:.3f} seconds"
         )
         return False
 
+    def readinto(self, dest, timeout=5) -> int:
+        """Fill `dest` (any writable buffer) straight from the ring; returns bytes copied"""
+        dest = memoryview(dest).cast("B")
+        num_bytes = len(dest)
+        got = 0
+        deadline = time.monotonic() + timeout
+        with self._rx_cond:
+            # Copy as data arrives, so requests larger than the ring still complete
+            while got < num_bytes:
+                avail = self._wait_available(num_bytes - got, deadline)
+                if not avail:
+                    break
+                take = min(avail, num_bytes - got)
+                self._rx.copy_into(dest[got:], take)
+                self._consume(take)
+                got += take
+        if got < num_bytes and self._rx_error is None:
+            self.timeouts["read"] += 1
+        return got
+
     def wait_for_bytes(self, num_bytes, timeout=5) -> bytes:
         """Wait for specific number of bytes"""
         if not num_bytes:
             return bytes()
 
-        start_time = time.perf_counter()
-        buffer = bytearray()
-
-        while time.perf_counter() - start_time < timeout:
-            try:
-                # First, consume from pushback if any
-                if self._pushback and len(buffer) < num_bytes:
-                    need = num_bytes - len(buffer)
-                    buffer.extend(self._take_from_pushback(need))
-                    if len(buffer) >= num_bytes:
-                        return bytes(buffer[:num_bytes])
-
-                msg_type, data, timestamp = self._next_data_chunk(timeout=0.1)
-
-                if msg_type == "data":
-                    need = num_bytes - len(buffer)
-                    if need > 0:
-                        take = data[:need]
-                        buffer.extend(take)
-                        # Anything beyond what we needed goes into pushback
-                        if len(data) > len(take):
-                            self._pushback.extend(data[len(take) :])
-                    else:
-                        # Already have enough, stash all data to pushback
-                        self._pushback.extend(data)
-
-                    if len(buffer) >= num_bytes:
-                        return bytes(buffer[:num_bytes])
-
-            except queue.Empty:
-                continue
-
-        return bytes(buffer) if buffer else None
+        if num_bytes > self._rx.capacity:
+            buffer = bytearray(num_bytes)
+            got = self.readinto(buffer, timeout=timeout)
+            return bytes(buffer[:got]) if got else None
+
+        with self._rx_cond:
+            avail = self._wait_available(num_bytes, time.monotonic() + timeout)
+            take = min(avail, num_bytes)
+            if take < num_bytes and self._rx_error is None:
+                self.timeouts["read"] += 1
+            if not take:
+                return None
+            # Single materialisation: copy the ring slice(s) into the result
+            views = self._rx.views(take)
+            data = bytes(views[0]) if len(views) == 1 else b"".join(views)
+            self._consume(take)
+        return data
 
     def wait_for_ready(self, timeout=120):
-        return self._wait_for_byte(
+        t0 = time.perf_counter_ns()
+        found = self._wait_for_byte(
             expected_byte=DILITHIUM_READY_BYTE, signal_name="READY", timeout=timeout
         )
+        if found:
+            self.ready_wait.record(time.perf_counter_ns() - t0)
+        elif self._rx_error is None:
+            self.timeouts["ready"] += 1
+        return found
+
+    def rx_buffered(self) -> int:
+        """Received bytes not consumed yet; read without the lock, so approximate"""
+        return self._rx.available()
 
     def send_in_chunks(
         self,
@@ -419,7 +747,9 @@ class UARTConnection:
         Returns:
             bytes: The complete data received, or None if the operation failed or timed out.
         """
-        full_data = b""
+        full_data = bytearray(total_bytes)
+        full_view = memoryview(full_data)
+        received = 0
         total_chunks = (total_bytes + chunk_size - 1) // chunk_size
 
         if data_name:
@@ -428,7 +758,7 @@ class UARTConnection:
             )
 
         for chunk_num in range(total_chunks):
-            bytes_to_receive = min(chunk_size, total_bytes - len(full_data))
+            bytes_to_receive = min(chunk_size, total_bytes - received)
 
             if self.debug:
                 self._console(
@@ -436,61 +766,68 @@ class UARTConnection:
                     f"waiting for {bytes_to_receive} bytes..."
                 )
 
-            data_chunk = self.wait_for_bytes(
-                num_bytes=bytes_to_receive, timeout=timeout_per_chunk
+            got = self.readinto(
+                full_view[received : received + bytes_to_receive],
+                timeout=timeout_per_chunk,
             )
 
-            if not data_chunk or len(data_chunk) < bytes_to_receive:
+            if got < bytes_to_receive:
                 self._console(
                     f"❌ Failed to receive {data_name} chunk ({chunk_num + 1}). Timed out."
                 )
                 return None
 
-            full_data += data_chunk
+            received += got
 
             self.send_ack()
             if self.debug:
                 self._console(f"✅ ACK'd chunk {chunk_num + 1}/{total_chunks}")
 
-        if len(full_data) == total_bytes:
+        if received == total_bytes:
             if data_name:
                 self._console(
                     f"✅ Successfully received all {total_bytes} bytes of {data_name}."
                 )
-            return full_data
+            return bytes(full_data)
         else:
             self._console(
-                f"❌ Error: Expected {total_bytes} bytes, but received {len(full_data)}."
+                f"❌ Error: Expected {total_bytes} bytes, but received {received}."
             )
             return None
 
     def flush_received_data(self):
         """Show any remaining received data"""
         print("\n--- Remaining received data ---")
-        try:
-            while True:
-                item = self.received_data.get_nowait()
-                msg_type, data, timestamp = item
-                if msg_type == "data":
-                    print(f"{self._id()} Received: {data.hex()}")
-        except queue.Empty:
-            print(f"{self._id()} No more data")
+        for msg_type, data, timestamp in self.get_received_data():
+            if msg_type == "data":
+                print(f"{self._id()} Received: {data.hex()}")
+        print(f"{self._id()} No more data")
 
     def close(self):
         """Clean shutdown"""
         self._console("Shutting down UART connection...")
         self.running = False
+        self.send_queue.put(None)
+        try:
+            self._wake_w.send(b"\0")
+        except Exception:
+            pass
+        with self._rx_lock:
+            # Wake anyone still waiting on this link instead of letting them time out
+            if self._rx_error is None:
+                self._rx_error = "connection closed"
+            self._rx_cond.notify_all()
+            self._rx_space.notify_all()
         self.read_thread.join(timeout=1)
         self.write_thread.join(timeout=1)
         try:
             self.transport.close()
         except Exception:
             pass
-        if self._log_fp:
-            try:
-                ts = time.strftime("%Y-%m-%d %H:%M:%S")
-                self._log_fp.write(f"[{ts}] === UART log closed ===\n")
-                self._log_fp.close()
-            except Exception:
-                pass
+        for s in (self._wake_r, self._wake_w):
+            s.close()
+        self.wire_log.note("UART log closed")
+        self.wire_log.close()
+        if self.capture:
+            self.capture.close()
         self._console("UART connection closed")
@@ -0,0 +1,318 @@
+import os
+import time
+import socket
+import asyncio
+
+try:
+    import serial  # (optional when using TCP only)
+except Exception:
+    serial = None
+
+from uart import DILITHIUM_READY_BYTE
+
+
+class _AsyncSocketTransport:
+    """asyncio stream backend for the serial2tcp socket of the simulation."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(
+        cls,
+        tcp_host: str = "localhost",
+        tcp_port: int = 4327,
+        tcp_connect_timeout: int = 600,
+        console=print,
+        **_,
+    ):
+        """Retry TCP connection to simulation until timeout (same policy as UARTConnection)"""
+        console(f"Connecting to {tcp_host}:{tcp_port}... (will wait up to {tcp_connect_timeout}s)")
+        try_count = 0
+        start_time = time.time()
+        while time.time() - start_time < tcp_connect_timeout:
+            try:
+                reader, writer = await asyncio.open_connection(tcp_host, tcp_port)
+                sock = writer.get_extra_info("socket")
+                if sock is not None:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                console(f"✅ Connected after {time.time() - start_time:.2f} seconds!")
+                return cls(reader, writer)
+            except (ConnectionRefusedError, OSError):
+                elapsed = time.time() - start_time
+                console(f"[{elapsed:.2f}s] Not ready yet (attempt {try_count}). Retrying...")
+                try_count += 1
+                await asyncio.sleep(0.1)
+        raise TimeoutError(
+            f"❌ Could not connect to {tcp_host}:{tcp_port} after {tcp_connect_timeout} seconds"
+        )
+
+    async def recv(self, size: int) -> bytes:
+        return await self.reader.read(size)
+
+    async def sendall(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
+
+
+class _AsyncSerialTransport:
+    """Non-blocking pyserial backend driven by the event loop's reader/writer callbacks.
+
+    pyserial opens POSIX ports with O_NONBLOCK, so we can do raw os.read/os.write on
+    the descriptor and only park on the loop when the port would block.
+    """
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.fd = ser.fileno()
+
+    @classmethod
+    async def open(
+        cls,
+        serial_port: str | None = "/dev/ttyUSB1",
+        baudrate: int = 115200,
+        console=print,
+        **_,
+    ):
+        if serial is None:
+            raise RuntimeError(
+                "pyserial is required for serial mode. Install with: pip install pyserial"
+            )
+        if not serial_port:
+            raise RuntimeError("serial_port must be provided in serial mode.")
+        console(f"Opening serial {serial_port} @ {baudrate} (async)...")
+        ser = serial.Serial(port=serial_port, baudrate=baudrate, timeout=0, write_timeout=0)
+        try:
+            ser.reset_input_buffer()
+            ser.reset_output_buffer()
+        except Exception:
+            pass
+        if not hasattr(ser, "fileno"):
+            ser.close()
+            raise RuntimeError("Async serial backend needs a POSIX serial port (fileno())")
+        await asyncio.sleep(0.1)
+        console("✅ Serial port opened")
+        return cls(ser)
+
+    async def _wait_fd(self, add, remove):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        add(self.fd, lambda: fut.done() or fut.set_result(None))
+        try:
+            await fut
+        finally:
+            remove(self.fd)
+
+    async def recv(self, size: int) -> bytes:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                data = os.read(self.fd, size)
+            except BlockingIOError:
+                data = None
+            if data:
+                return data
+            if data is not None:
+                # A readable port with nothing to read has hung up (e.g. USB adapter unplugged)
+                raise ConnectionError(f"serial port {self.ser.port} closed")
+            await self._wait_fd(loop.add_reader, loop.remove_reader)
+
+    async def sendall(self, data):
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self.fd, view)
+            except BlockingIOError:
+                n = 0
+            view = view[n:]
+            if view:
+                await self._wait_fd(loop.add_writer, loop.remove_writer)
+
+    async def close(self):
+        self.ser.close()
+
+
+# Pluggable async backends, keyed by UARTConnection's `mode` names.
+# A backend is any class with `async open(**kwargs)`, `recv`, `sendall` and `close`.
+ASYNC_BACKENDS = {
+    "tcp": _AsyncSocketTransport,
+    "serial": _AsyncSerialTransport,
+}
+
+
+def register_async_backend(mode: str, backend) -> None:
+    ASYNC_BACKENDS[mode] = backend
+
+
+class AsyncUARTConnection:
+    """asyncio counterpart of UARTConnection.
+
+    One reader task per link fills a receive buffer; waiters are woken by an event
+    instead of polling, so a single event loop can drive many TPMs at once:
+
+        conns = await asyncio.gather(*(AsyncUARTConnection.open(tcp_port=p) for p in ports))
+        await asyncio.gather(*(c.wait_for_ready() for c in conns))
+    """
+
+    def __init__(self, transport, name: str = None, debug: bool = False, read_size: int = 4096):
+        self.transport = transport
+        self.name = name
+        self.debug = bool(debug)
+        self.read_size = read_size
+        self.running = True
+
+        # Receive buffer: consumed prefix is tracked by an offset and compacted lazily
+        self._rx = bytearray()
+        self._rx_pos = 0
+        self._rx_event = asyncio.Event()
+        self._rx_error = None
+        self._tx_lock = asyncio.Lock()
+
+        self.read_task = asyncio.get_running_loop().create_task(self._read_worker())
+
+    @classmethod
+    async def open(cls, mode: str = "tcp", name: str = None, debug: bool = False, **kwargs):
+        backend = ASYNC_BACKENDS.get(mode)
+        if backend is None:
+            raise ValueError(f"mode must be one of {sorted(ASYNC_BACKENDS)}")
+        prefix = f"[{name}]" if name else ""
+        console = (lambda msg: print(f"{prefix} {msg}")) if debug else (lambda msg: None)
+        transport = await backend.open(console=console, **kwargs)
+        return cls(transport, name=name, debug=debug)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _id(self):
+        return f"[{self.name}]" if self.name else ""
+
+    def _console(self, msg: str):
+        if self.debug:
+            print(f"{self._id()} {msg}")
+
+    def _available(self) -> int:
+        return len(self._rx) - self._rx_pos
+
+    def _consume(self, n: int) -> bytes:
+        data = bytes(self._rx[self._rx_pos : self._rx_pos + n])
+        self._rx_pos += n
+        if self._rx_pos == len(self._rx):
+            self._rx.clear()
+            self._rx_pos = 0
+        elif self._rx_pos > 4096 and self._rx_pos > len(self._rx) // 2:
+            del self._rx[: self._rx_pos]
+            self._rx_pos = 0
+        return data
+
+    async def _read_worker(self):
+        """Background task that continuously reads from transport"""
+        try:
+            while self.running:
+                data = await self.transport.recv(self.read_size)
+                if not data:
+                    raise ConnectionError("link closed by peer")
+                self._rx += data
+                self._rx_event.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self.running:
+                self._console(f"[READ ERROR] {e}")
+                self._rx_error = e
+                self._rx_event.set()
+
+    async def _wait_rx(self, deadline: float) -> bool:
+        """Park until new data (or an error) arrives; False once the deadline passes."""
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or self._rx_error is not None:
+            return False
+        self._rx_event.clear()
+        try:
+            await asyncio.wait_for(self._rx_event.wait(), remaining)
+        except asyncio.TimeoutError:
+            return False
+        return self._rx_error is None or self._available() > 0
+
+    @property
+    def link_error(self):
+        """Exception that stopped the reader task, or None while the link is up"""
+        return self._rx_error
+
+    async def send_bytes(self, *parts):
+        """Send one command; several parts (e.g. header and payload) go out back to
+        back under one lock, without being joined"""
+        async with self._tx_lock:
+            for data in parts:
+                if isinstance(data, str):
+                    data = data.encode()
+                elif isinstance(data, int):
+                    data = bytes([data])
+                if len(data):
+                    await self.transport.sendall(data)
+
+    async def wait_for_bytes(self, num_bytes, timeout=5) -> bytes:
+        """Wait for specific number of bytes; returns what arrived (or None) on timeout"""
+        if not num_bytes:
+            return bytes()
+        deadline = time.perf_counter() + timeout
+        while self._available() < num_bytes:
+            if not await self._wait_rx(deadline):
+                if self._available() < num_bytes:
+                    avail = self._available()
+                    return self._consume(avail) if avail else None
+        return self._consume(num_bytes)
+
+    async def _wait_for_byte(self, expected_byte, signal_name: str = "", timeout=5):
+        """Wait for a specific byte value, discarding anything before it"""
+        start = time.perf_counter()
+        deadline = start + timeout
+        while True:
+            idx = self._rx.find(bytes([expected_byte]), self._rx_pos)
+            if idx >= 0:
+                self._consume(idx + 1 - self._rx_pos)
+                if signal_name:
+                    self._console(
+                        f"[{signal_name.upper()}] Received in {time.perf_counter() - start:.3f} seconds"
+                    )
+                return True
+            self._consume(self._available())
+            if not await self._wait_rx(deadline):
+                if self._rx_error is not None:
+                    self._console(f"[ERROR] {self._rx_error}")
+                    return False
+                if time.perf_counter() >= deadline:
+                    break
+        self._console(f"[TIMEOUT] No {signal_name.upper()} received in {timeout:.3f} seconds")
+        return False
+
+    async def wait_for_ready(self, timeout=120):
+        return await self._wait_for_byte(
+            expected_byte=DILITHIUM_READY_BYTE, signal_name="READY", timeout=timeout
+        )
+
+    async def close(self):
+        """Clean shutdown"""
+        self._console("Shutting down async UART connection...")
+        self.running = False
+        self.read_task.cancel()
+        try:
+            await self.read_task
+        except (asyncio.CancelledError, Exception):
+            pass
+        try:
+            await self.transport.close()
+        except Exception:
+            pass
+        self._console("UART connection closed")
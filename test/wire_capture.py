@@ -0,0 +1,389 @@
+"""pcapng capture and replay of TPM wire sessions.
+
+`PcapngCapture` is a WireLog sink that writes one Enhanced Packet Block per TPM
+command/response (framed by the header size field) with nanosecond timestamps and
+the direction in epb_flags. Bytes outside a TPM frame (the 0xA0 READY marker, noise)
+are written as their own packets. Captures open in Wireshark as LINKTYPE_USER0.
+
+Record with `UARTConnection(..., capture_path="session.pcapng")`, then:
+
+    python wire_capture.py dump session.pcapng
+    python wire_capture.py replay session.pcapng --tcp-port 4327
+    python wire_capture.py replay session.pcapng --mock
+
+Replay sends every recorded command as soon as the previous response is in and
+prints recorded vs. replayed latency per command. Commands that depend on earlier
+state (handles from CreatePrimary, sequence handles) replay correctly against a
+freshly started sim, since it hands out the same transient handles.
+"""
+
+import sys
+import time
+import socket
+import struct
+import argparse
+import threading
+
+from wire_log import WireLog, KIND_READ, KIND_WRITE, LEVEL_WIRE
+from tpm_utils import (
+    TPM_ST_NO_SESSIONS,
+    TPM_ST_SESSIONS,
+    TPM_HEADER_SIZE,
+    command_name,
+)
+
+LINKTYPE_USER0 = 147
+
+_BT_SHB = 0x0A0D0D0A
+_BT_IDB = 0x00000001
+_BT_EPB = 0x00000006
+_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+_OPT_ENDOFOPT = 0
+_OPT_IF_NAME = 2
+_OPT_IF_TSRESOL = 9
+_OPT_EPB_FLAGS = 2
+
+# epb_flags direction bits
+DIR_INBOUND = 1  # device -> host
+DIR_OUTBOUND = 2  # host -> device
+
+# Tags accepted when looking for a frame start (0x00C4 = TPM_ST_RSP_COMMAND)
+_FRAME_TAGS = (TPM_ST_NO_SESSIONS, TPM_ST_SESSIONS, 0x00C4)
+MAX_FRAME_SIZE = 64 * 1024
+
+
+def _option(code: int, value: bytes) -> bytes:
+    pad = (-len(value)) % 4
+    return struct.pack("<HH", code, len(value)) + value + b"\0" * pad
+
+
+def _block(block_type: int, body: bytes) -> bytes:
+    total = 12 + len(body)
+    return struct.pack("<II", block_type, total) + body + struct.pack("<I", total)
+
+
+class _Framer:
+    """Splits one direction of the byte stream into TPM frames and out-of-band runs."""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data: bytes):
+        self.buf += data
+        frames = []
+        buf = self.buf
+        while buf:
+            if buf[0] != 0x80 and buf[0] != 0x00:
+                # Out-of-band run (READY marker etc.) up to the next possible tag byte
+                end = 1
+                while end < len(buf) and buf[end] not in (0x80, 0x00):
+                    end += 1
+                frames.append(bytes(buf[:end]))
+                del buf[:end]
+                continue
+            if len(buf) < TPM_HEADER_SIZE:
+                break
+            tag = int.from_bytes(buf[0:2], "big")
+            size = int.from_bytes(buf[2:6], "big")
+            if tag not in _FRAME_TAGS or not TPM_HEADER_SIZE <= size <= MAX_FRAME_SIZE:
+                frames.append(bytes(buf[:1]))
+                del buf[:1]
+                continue
+            if len(buf) < size:
+                break
+            frames.append(bytes(buf[:size]))
+            del buf[:size]
+        return frames
+
+    def flush(self):
+        rest = bytes(self.buf)
+        self.buf.clear()
+        return [rest] if rest else []
+
+
+class PcapngCapture(WireLog):
+    """WireLog sink writing framed TPM traffic to a pcapng file."""
+
+    def __init__(self, path: str, name: str = None, flush_interval: float = 0.05):
+        self._framers = {KIND_WRITE: _Framer(), KIND_READ: _Framer()}
+        self._last_ts = {KIND_WRITE: 0, KIND_READ: 0}
+        super().__init__(path=path, name=name, level=LEVEL_WIRE, flush_interval=flush_interval)
+
+    def _open(self):
+        self._fp = open(self.path, "wb")
+        shb = struct.pack("<IHHq", _BYTE_ORDER_MAGIC, 1, 0, -1)
+        opts = _option(_OPT_IF_NAME, (self.name or "uart").encode())
+        opts += _option(_OPT_IF_TSRESOL, bytes([9])) + _option(_OPT_ENDOFOPT, b"")
+        idb = struct.pack("<HHI", LINKTYPE_USER0, 0, 0) + opts
+        self._fp.write(_block(_BT_SHB, shb) + _block(_BT_IDB, idb))
+
+    def _packet(self, ts_mono: int, kind: int, frame: bytes) -> bytes:
+        ts = self._wall0 + ts_mono - self._mono0
+        flags = DIR_OUTBOUND if kind == KIND_WRITE else DIR_INBOUND
+        pad = (-len(frame)) % 4
+        body = struct.pack("<IIIII", 0, ts >> 32, ts & 0xFFFFFFFF, len(frame), len(frame))
+        body += frame + b"\0" * pad
+        body += _option(_OPT_EPB_FLAGS, struct.pack("<I", flags)) + _option(_OPT_ENDOFOPT, b"")
+        return _block(_BT_EPB, body)
+
+    def _write_batch(self, records: list):
+        # A frame is stamped with the time its last byte was sent/received
+        parts = []
+        for kind, _, ts, data in records:
+            framer = self._framers.get(kind)
+            if framer is None:
+                continue
+            self._last_ts[kind] = ts
+            for frame in framer.feed(data):
+                parts.append(self._packet(ts, kind, frame))
+        if parts:
+            self._fp.write(b"".join(parts))
+            self._fp.flush()
+
+    def _close(self):
+        if self._fp is not None:
+            for kind, framer in self._framers.items():
+                for frame in framer.flush():
+                    self._fp.write(self._packet(self._last_ts[kind], kind, frame))
+        super()._close()
+
+
+def read_capture(path: str):
+    """Yield (timestamp_ns, direction, frame) for every packet in a pcapng capture"""
+    with open(path, "rb") as fp:
+        blob = fp.read()
+    view = memoryview(blob)
+    off = 0
+    tsresol = []  # per interface: ticks per second
+    while off + 12 <= len(view):
+        block_type, total = struct.unpack_from("<II", view, off)
+        if block_type == _BT_SHB:
+            (magic,) = struct.unpack_from("<I", view, off + 8)
+            if magic != _BYTE_ORDER_MAGIC:
+                raise ValueError(f"{path}: only little-endian pcapng is supported")
+            tsresol = []
+        elif block_type == _BT_IDB:
+            res = 10**6
+            p = off + 16
+            end = off + total - 4
+            while p + 4 <= end:
+                code, length = struct.unpack_from("<HH", view, p)
+                if code == _OPT_ENDOFOPT:
+                    break
+                if code == _OPT_IF_TSRESOL:
+                    v = view[p + 4]
+                    res = 2 ** (v & 0x7F) if v & 0x80 else 10**v
+                p += 4 + length + ((-length) % 4)
+            tsresol.append(res)
+        elif block_type == _BT_EPB:
+            iface, ts_hi, ts_lo, cap_len, _ = struct.unpack_from("<IIIII", view, off + 8)
+            data_off = off + 28
+            frame = bytes(view[data_off : data_off + cap_len])
+            direction = 0
+            p = data_off + cap_len + ((-cap_len) % 4)
+            end = off + total - 4
+            while p + 4 <= end:
+                code, length = struct.unpack_from("<HH", view, p)
+                if code == _OPT_ENDOFOPT:
+                    break
+                if code == _OPT_EPB_FLAGS:
+                    (flags,) = struct.unpack_from("<I", view, p + 4)
+                    direction = flags & 0x3
+                p += 4 + length + ((-length) % 4)
+            res = tsresol[iface] if iface < len(tsresol) else 10**6
+            ts_ns = ((ts_hi << 32) | ts_lo) * 10**9 // res
+            yield ts_ns, direction, frame
+        off += total
+
+
+def _is_tpm_frame(frame: bytes) -> bool:
+    return (
+        len(frame) >= TPM_HEADER_SIZE
+        and int.from_bytes(frame[0:2], "big") in _FRAME_TAGS
+        and int.from_bytes(frame[2:6], "big") == len(frame)
+    )
+
+
+def command_pairs(packets):
+    """Pair each outbound TPM command with the next inbound TPM response.
+
+    Returns a list of (command, response, recorded_latency_ns); response is None for a
+    command that never got an answer in the capture.
+    """
+    pairs = []
+    pending = None
+    for ts, direction, frame in packets:
+        if not _is_tpm_frame(frame):
+            continue
+        if direction == DIR_OUTBOUND:
+            if pending is not None:
+                pairs.append((pending[1], None, None))
+            pending = (ts, frame)
+        elif direction == DIR_INBOUND and pending is not None:
+            pairs.append((pending[1], frame, ts - pending[0]))
+            pending = None
+    if pending is not None:
+        pairs.append((pending[1], None, None))
+    return pairs
+
+
+class MockTPM:
+    """Local TCP server answering each command with the next recorded response."""
+
+    def __init__(self, responses, host: str = "localhost", port: int = 0):
+        self.responses = list(responses)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((host, port))
+        self.sock.listen(1)
+        self.host, self.port = self.sock.getsockname()[:2]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _recv_exact(self, conn, n: int) -> bytes:
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = conn.recv(n - len(buf))
+            if not chunk:
+                raise ConnectionError("client closed")
+            buf += chunk
+        return bytes(buf)
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            for rsp in self.responses:
+                header = self._recv_exact(conn, TPM_HEADER_SIZE)
+                self._recv_exact(conn, int.from_bytes(header[2:6], "big") - TPM_HEADER_SIZE)
+                conn.sendall(b"\xA0" + rsp)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+def replay(uart, pairs, timeout: float = 60):
+    """Send recorded commands back to back; return rows of per-command results"""
+    rows = []
+    for idx, (cmd, recorded_rsp, recorded_ns) in enumerate(pairs):
+        t0 = time.perf_counter_ns()
+        uart.send_bytes(cmd)
+        if not uart.wait_for_ready(timeout):
+            raise RuntimeError(f"command #{idx}: no READY within {timeout}s")
+        header = uart.wait_for_bytes(TPM_HEADER_SIZE, timeout=timeout)
+        if not header or len(header) < TPM_HEADER_SIZE:
+            raise RuntimeError(f"command #{idx}: truncated response header")
+        size = int.from_bytes(header[2:6], "big")
+        body = uart.wait_for_bytes(size - TPM_HEADER_SIZE, timeout=timeout) or b""
+        replay_ns = time.perf_counter_ns() - t0
+        rsp = header + body
+        rows.append(
+            {
+                "index": idx,
+                "command": command_name(int.from_bytes(cmd[6:10], "big")),
+                "cmd_len": len(cmd),
+                "rsp_len": len(rsp),
+                "rc": int.from_bytes(rsp[6:10], "big"),
+                "recorded_rc": int.from_bytes(recorded_rsp[6:10], "big") if recorded_rsp else None,
+                "recorded_ns": recorded_ns,
+                "replay_ns": replay_ns,
+            }
+        )
+    return rows
+
+
+def print_report(rows):
+    print(f"{'#':>4}  {'command':<18} {'cmd B':>6} {'rsp B':>6} {'rec ms':>10} {'replay ms':>10} {'delta ms':>10} {'delta':>8}  rc")
+    total_rec = total_rep = 0
+    for r in rows:
+        rec = r["recorded_ns"]
+        rep = r["replay_ns"]
+        rc = f"0x{r['rc']:X}"
+        if r["recorded_rc"] is not None and r["recorded_rc"] != r["rc"]:
+            rc += f" (recorded 0x{r['recorded_rc']:X})"
+        if rec is None:
+            print(f"{r['index']:>4}  {r['command']:<18} {r['cmd_len']:>6} {r['rsp_len']:>6} {'-':>10} {rep / 1e6:>10.3f} {'-':>10} {'-':>8}  {rc}")
+            continue
+        total_rec += rec
+        total_rep += rep
+        delta = rep - rec
+        pct = f"{100.0 * delta / rec:+.1f}%" if rec else "-"
+        print(
+            f"{r['index']:>4}  {r['command']:<18} {r['cmd_len']:>6} {r['rsp_len']:>6} "
+            f"{rec / 1e6:>10.3f} {rep / 1e6:>10.3f} {delta / 1e6:>+10.3f} {pct:>8}  {rc}"
+        )
+    if total_rec:
+        delta = total_rep - total_rec
+        print(
+            f"total: recorded {total_rec / 1e6:.3f} ms, replay {total_rep / 1e6:.3f} ms, "
+            f"delta {delta / 1e6:+.3f} ms ({100.0 * delta / total_rec:+.1f}%)"
+        )
+
+
+def _dump(args):
+    for ts, direction, frame in read_capture(args.path):
+        arrow = {DIR_OUTBOUND: "->", DIR_INBOUND: "<-"}.get(direction, "??")
+        stamp = time.strftime("%H:%M:%S", time.localtime(ts / 1e9)) + f".{ts % 10**9:09d}"
+        if _is_tpm_frame(frame):
+            code = int.from_bytes(frame[6:10], "big")
+            label = command_name(code) if direction == DIR_OUTBOUND else f"rc=0x{code:X}"
+            print(f"[{stamp}] {arrow} {label} ({len(frame)} B)")
+        else:
+            print(f"[{stamp}] {arrow} {frame.hex()}")
+
+
+def _replay(args):
+    from uart import UARTConnection
+
+    pairs = command_pairs(read_capture(args.path))
+    if not pairs:
+        print("No TPM commands in capture")
+        return False
+    mock = None
+    host, port = args.tcp_host, args.tcp_port
+    if args.mock:
+        mock = MockTPM(rsp for _, rsp, _ in pairs if rsp is not None)
+        host, port = mock.host, mock.port
+        pairs = [p for p in pairs if p[1] is not None]
+    uart = UARTConnection(mode="tcp", tcp_host=host, tcp_port=port, debug=False)
+    try:
+        if not args.mock and not args.no_boot_ready:
+            # The sim announces itself with a READY byte at boot
+            uart.wait_for_ready(timeout=args.timeout)
+        rows = replay(uart, pairs, timeout=args.timeout)
+    finally:
+        uart.close()
+        if mock is not None:
+            mock.close()
+    print_report(rows)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay pcapng TPM wire captures")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("dump", help="List captured frames")
+    p.add_argument("path")
+    p.set_defaults(func=_dump)
+    p = sub.add_parser("replay", help="Replay commands and report latency deltas")
+    p.add_argument("path")
+    p.add_argument("--tcp-host", default="localhost")
+    p.add_argument("--tcp-port", type=int, default=4327)
+    p.add_argument("--mock", action="store_true", help="Replay against a local mock answering with recorded responses")
+    p.add_argument("--no-boot-ready", action="store_true", help="Do not wait for the boot READY byte first")
+    p.add_argument("--timeout", type=float, default=600)
+    p.set_defaults(func=_replay)
+    args = parser.parse_args()
+    try:
+        args.func(args)
+    except BrokenPipeError:
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Structured wire logging for UARTConnection.
+
+The I/O threads only append (kind, level, monotonic_ns, raw bytes) tuples to a deque;
+a background thread drains it in batches and writes compact binary records. Hex
+rendering happens when somebody reads the log:
+
+    python wire_log.py tpm_test-20250101-120000.wlog [--per-byte] [--full]
+
+Without a path the batches are rendered to stdout by the background thread instead,
+which keeps the old `debug=True` console output without formatting on the I/O path.
+"""
+
+import sys
+import time
+import struct
+import argparse
+import threading
+import collections
+
+# Levels: a record is kept when its level <= the log's level
+LEVEL_OFF = 0
+LEVEL_INFO = 1
+LEVEL_WIRE = 2
+
+# Record kinds
+KIND_READ = 1
+KIND_WRITE = 2
+KIND_NOTE = 3
+
+KIND_NAMES = {KIND_READ: "READ", KIND_WRITE: "WRITE", KIND_NOTE: "NOTE"}
+
+FILE_MAGIC = b"TPMWLOG1"
+# wall clock ns, monotonic ns (same instant), name length
+_FILE_HEADER = struct.Struct("<qqH")
+# kind, level, monotonic ns, payload length
+_RECORD = struct.Struct("<BBqI")
+
+WRITE_PREVIEW_BYTES = 128
+
+
+class WireLog:
+    """Batching wire recorder; `record()` is the only call made on the I/O path."""
+
+    def __init__(
+        self,
+        path: str | None = None,
+        name: str = None,
+        level: int = LEVEL_WIRE,
+        flush_interval: float = 0.05,
+        per_byte: bool = False,
+    ):
+        self.path = path
+        self.name = name
+        self.level = level
+        self.flush_interval = flush_interval
+        self.per_byte = per_byte
+        # Cheap attribute checks for callers (`if log.wire: ...`)
+        self.wire = level >= LEVEL_WIRE
+        self.info = level >= LEVEL_INFO
+
+        # deque.append/popleft are atomic, so producers never take a lock
+        self._records = collections.deque()
+        self._stop = threading.Event()
+        self._wall0 = time.time_ns()
+        self._mono0 = time.monotonic_ns()
+        self._fp = None
+        self.records_written = 0
+        self.batches_written = 0
+
+        if level == LEVEL_OFF:
+            self._thread = None
+            return
+        self._open()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+
+    # ---- producer side ----
+    def record(self, kind: int, data, level: int = LEVEL_WIRE):
+        """Queue raw bytes (bytes/bytearray/memoryview, copied) for the writer thread."""
+        if level > self.level:
+            return
+        self._records.append((kind, level, time.monotonic_ns(), bytes(data)))
+
+    def read(self, data):
+        if self.wire:
+            self._records.append((KIND_READ, LEVEL_WIRE, time.monotonic_ns(), bytes(data)))
+
+    def write(self, data):
+        if self.wire:
+            self._records.append((KIND_WRITE, LEVEL_WIRE, time.monotonic_ns(), bytes(data)))
+
+    def note(self, msg: str):
+        if self.info:
+            self._records.append((KIND_NOTE, LEVEL_INFO, time.monotonic_ns(), msg.encode()))
+
+    # ---- writer side (override _open/_write_batch/_close for other formats) ----
+    def _open(self):
+        if self.path:
+            self._fp = open(self.path, "ab")
+            if self._fp.tell() == 0:
+                name = (self.name or "").encode()
+                self._fp.write(FILE_MAGIC + _FILE_HEADER.pack(self._wall0, self._mono0, len(name)) + name)
+
+    def _write_batch(self, records: list):
+        if self._fp is None:
+            for line in render_records(
+                records, self._wall0, self._mono0, self.name, per_byte=self.per_byte
+            ):
+                print(line)
+            return
+        parts = []
+        for kind, level, ts, data in records:
+            parts.append(_RECORD.pack(kind, level, ts, len(data)))
+            parts.append(data)
+        self._fp.write(b"".join(parts))
+        self._fp.flush()
+
+    def _close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+    def _drain(self):
+        records = []
+        pop = self._records.popleft
+        try:
+            while True:
+                records.append(pop())
+        except IndexError:
+            pass
+        if records:
+            self._write_batch(records)
+            self.records_written += len(records)
+            self.batches_written += 1
+
+    def _writer(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._drain()
+            except Exception as e:
+                print(f"[LOG] Wire log writer failed, logging turned off: {e}")
+                # Nothing drains the queue any more: stop producers from filling it
+                self._disable()
+                return
+
+    def _disable(self):
+        self.level = LEVEL_OFF
+        self.wire = self.info = False
+        self._records.clear()
+
+    def close(self):
+        """Stop the writer, flush what is queued and close the sink"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1)
+        self._thread = None
+        try:
+            if self.level != LEVEL_OFF:
+                self._drain()
+        finally:
+            self._close()
+
+
+# ---- reading side ----
+def read_records(path: str):
+    """Yield (kind, level, wall_time_s, data) from a binary wire log; returns the header name."""
+    with open(path, "rb") as fp:
+        blob = fp.read()
+    if not blob.startswith(FILE_MAGIC):
+        raise ValueError(f"{path}: not a wire log (bad magic)")
+    view = memoryview(blob)
+    off = len(FILE_MAGIC)
+    wall0, mono0, name_len = _FILE_HEADER.unpack_from(view, off)
+    off += _FILE_HEADER.size + name_len
+    while off + _RECORD.size <= len(view):
+        kind, level, ts, length = _RECORD.unpack_from(view, off)
+        off += _RECORD.size
+        yield kind, level, (wall0 + ts - mono0) / 1e9, bytes(view[off : off + length])
+        off += length
+
+
+def read_name(path: str) -> str:
+    with open(path, "rb") as fp:
+        head = fp.read(len(FILE_MAGIC) + _FILE_HEADER.size)
+        _, _, name_len = _FILE_HEADER.unpack_from(head, len(FILE_MAGIC))
+        return fp.read(name_len).decode()
+
+
+def _fmt_ts(wall_s: float) -> str:
+    return time.strftime("%H:%M:%S", time.localtime(wall_s)) + f".{int(wall_s * 1e6) % 1000000:06d}"
+
+
+def render_records(records, wall0: int, mono0: int, name: str = None, per_byte=False, full=False):
+    """Render in-memory (kind, level, monotonic_ns, data) records as log lines"""
+    return render(
+        ((k, lv, (wall0 + ts - mono0) / 1e9, d) for k, lv, ts, d in records),
+        name,
+        per_byte=per_byte,
+        full=full,
+    )
+
+
+def render(records, name: str = None, per_byte=False, full=False):
+    """Yield text lines in the UARTConnection log format for (kind, level, wall_s, data)"""
+    tag = f"[{name}]" if name else ""
+    for kind, _, wall_s, data in records:
+        ts = _fmt_ts(wall_s)
+        if kind == KIND_NOTE:
+            yield f"[{ts}] {tag}=== {data.decode(errors='replace')} ==="
+        elif kind == KIND_READ:
+            if per_byte:
+                for b in data:
+                    yield f"[{ts}] {tag}[READ] {b:02x}"
+            else:
+                yield f"[{ts}] {tag}[READ] {data.hex()}"
+        elif kind == KIND_WRITE:
+            if len(data) > WRITE_PREVIEW_BYTES * 2 and not full:
+                preview = data[: WRITE_PREVIEW_BYTES].hex().upper()
+                yield f"[{ts}] {tag}[WRITE] 0x{preview}... (len={len(data)})"
+            else:
+                yield f"[{ts}] {tag}[WRITE] 0x{data.hex().upper()}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a binary UART wire log as text")
+    parser.add_argument("path", help="Wire log written by UARTConnection(log_path=...)")
+    parser.add_argument("--per-byte", action="store_true", help="One READ line per byte")
+    parser.add_argument("--full", action="store_true", help="Do not truncate long writes")
+    args = parser.parse_args()
+    try:
+        for line in render(
+            read_records(args.path), read_name(args.path), per_byte=args.per_byte, full=args.full
+        ):
+            print(line)
+    except BrokenPipeError:
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()